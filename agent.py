@@ -1,51 +1,196 @@
 # agent.py
-from models import db, Event, Artifact, Finding
-from mcp_bridge import http_check, ssh_exec, mariadb_query
-from rag import control_snippets
-from llm_client import plan_steps_with_llm, decide_with_llm
-import json
+from models import db, Job, Event, Artifact, Finding
+from config import EVENT_FLUSH_SIZE, EVENT_FLUSH_MS, EVENT_URGENT_LEVELS
+from config import ANALYZE_TOKEN_BUDGET, ANALYZE_CONCURRENCY, ANALYZE_GROUP_MAX
+from config import INCREMENTAL_RESCAN, INCREMENTAL_LOOKBACK
+from bus import publish_events
+from executor import execute_plan, execute_plan_async
+from mcp_bridge import ssh_pool_stats, db_pool_stats
+from rag import control_snippets_batch, index_stats
+from llm_client import plan_steps_with_llm, decide_with_llm, aplan_steps_with_llm, adecide_with_llm
+from evidence import group_controls, estimate_tokens, control_fingerprint
+import rules
+import llm_client
+import asyncio, json, threading, time
+from contextlib import contextmanager
+from metrics import span, inc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app, has_app_context
+
+class EventSink:
+    """
+    이벤트를 모아서 한 번에 insert/commit 하는 버퍼.
+    - max_size 개가 쌓이거나 가장 오래된 이벤트가 max_delay_ms 를 넘기면 flush
+      (다음 add 가 없어도 batch 의 첫 이벤트가 건 timer 가 max_delay 뒤에 flush)
+    - urgent 레벨(stage/error/done 등)은 즉시 flush → SSE 클라이언트에 바로 보임
+    job 종료(성공/실패) 시 worker 가 flush() 를 호출해 남은 이벤트를 내려 쓴다.
+    commit 후에는 id 가 붙은 이벤트를 job 채널로 publish (SSE push).
+    """
+    def __init__(self, max_size: int, max_delay_ms: int, urgent_levels):
+        self.max_size = max_size
+        self.max_delay = max_delay_ms / 1000.0
+        self.urgent = set(urgent_levels)
+        self._buf = []
+        self._first = 0.0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # batch 를 꺼낸 순서대로 commit/publish
+
+    def add(self, job_id, level, message, payload=None):
+        ev = Event(job_id=job_id, ts=datetime.utcnow(), level=level, message=message, payload_json=payload or {})
+        with self._lock:
+            first = not self._buf
+            if first:
+                self._first = time.monotonic()
+            self._buf.append(ev)
+            due = (level in self.urgent or len(self._buf) >= self.max_size
+                   or time.monotonic() - self._first >= self.max_delay)
+        if due:
+            self.flush()
+        elif first and has_app_context():
+            t = threading.Timer(self.max_delay, self._flush_idle, args=(current_app._get_current_object(),))
+            t.daemon = True
+            t.start()
+
+    def _flush_idle(self, app):
+        """timer thread: 그 사이 flush 되지 않고 max_delay 가 지난 batch 가 남아 있으면 내려 씀."""
+        with self._lock:
+            if not self._buf or time.monotonic() - self._first < self.max_delay:
+                return  # 이미 flush 됐고, 새 batch 는 자기 timer 가 처리
+        try:
+            with app.app_context():
+                self.flush()
+        except Exception:
+            pass  # batch 는 버퍼로 돌아가 job 종료 flush 에서 다시 시도
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buf = self._buf, []
+            if batch:
+                try:
+                    with span("db_commit", what="events"):
+                        db.session.add_all(batch)
+                        db.session.flush()  # id 부여
+                        # commit 은 instance 를 expire 시키므로 그 전에 직렬화 (안 그러면 이벤트마다 SELECT 로 다시 읽음)
+                        payloads = [ev.to_json() for ev in batch]
+                        db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    for ev in batch:
+                        ev.id = None
+                    with self._lock:
+                        self._buf[:0] = batch
+                        self._first = time.monotonic()
+                    raise
+                publish_events(payloads)
+            return batch
+
+events = EventSink(EVENT_FLUSH_SIZE, EVENT_FLUSH_MS, EVENT_URGENT_LEVELS)
 
 def log(job_id, level, message, payload=None):
-    ev = Event(job_id=job_id, level=level, message=message, payload_json=payload or {})
-    db.session.add(ev); db.session.commit()
+    events.add(job_id, level, message, payload)
 
-def run_pipeline(job):
-    artifacts_db = []
-    # 1) RAG
-    log(job.id, "stage", "RAG")
-    controls = {cid: control_snippets(cid) for cid in job.controls}
+def flush_events():
+    return events.flush()
 
-    # 2) PLAN (LLM or fallback)
-    log(job.id, "stage", "PLAN")
-    plan = plan_steps_with_llm(job.target, controls)
-    if not plan:
-        log(job.id, "warn", "No plan produced; marking unknown")
-    # 3) EXECUTE
-    for st in plan:
-        log(job.id, "info", "tool_call", {"tool": st["tool"], "args": st["args"]})
-        if st["tool"] == "http_check":
-            out = http_check(st["args"]["url"])
-        elif st["tool"] == "ssh_exec":
-            out = ssh_exec(st["args"]["cmd"])
-        elif st["tool"] == "mariadb_query":
-            out = mariadb_query(st["args"]["sql"])
-        else:
-            out = {"tool": st["tool"], "args": st["args"], "result": {"note":"unknown tool"}, "sha256": ""}
-        art = Artifact(job_id=job.id, type="json", ref="", sha256=out["sha256"],
-                       meta_json={**out["result"], "tool": out["tool"]})
-        db.session.add(art); db.session.commit()
-        artifacts_db.append(art)
-        log(job.id, "info", "tool_done", {"tool": out["tool"], "sha256": out["sha256"]})
-
-    # evidence list for LLM
+def _analyze_prepare(controls, evidence):
+    """규칙 판정 + 남은 control 의 판정 그룹. 반환: (items, summary, pending, groups)"""
+    items, pending = rules.evaluate(controls, evidence)
+    summary = {"pass":0,"fail":0,"na":0,"unknown":0}
+    for it in items:
+        summary[it["status"]] = summary.get(it["status"], 0) + 1
+    rest = {cid: c for cid, c in controls.items() if cid in pending}
+    groups = group_controls(rest, evidence, ANALYZE_TOKEN_BUDGET, ANALYZE_GROUP_MAX) if rest else []
+    return items, summary, pending, groups
+
+def _analyze_merge(results, items, summary, controls, evidence, pending, groups, t0):
+    for d in results:
+        items.extend(d.get("items", []))
+        for k, v in (d.get("summary") or {}).items():
+            summary[k] = summary.get(k, 0) + (v or 0)
+    stats = {"groups": len(groups), "controls": len(controls),
+             "rule_decided": len(controls) - len(pending), "escalated": pending,
+             "evidence_tokens_full": estimate_tokens(evidence),
+             "evidence_tokens_sent": sum(estimate_tokens(g["evidence"]) for g in groups),
+             "latency_ms": round((time.perf_counter() - t0) * 1000, 2)}
+    return {"items": items, "summary": summary}, stats
+
+def analyze(controls, evidence, usage=None):
+    """
+    규칙 엔진으로 전체 증거를 한 번에 판정하고, 남은 control 만
+    압축한 증거로 그룹 단위 판정 호출을 병렬 실행해서 결과를 합침.
+    반환: (decision, stats)
+    """
+    t0 = time.perf_counter()
+    items, summary, pending, groups = _analyze_prepare(controls, evidence)
+    results = []
+    if groups:
+        with ThreadPoolExecutor(max_workers=min(ANALYZE_CONCURRENCY, len(groups))) as pool:
+            results = list(pool.map(lambda g: decide_with_llm(g["evidence"], g["controls"], usage=usage), groups))
+    return _analyze_merge(results, items, summary, controls, evidence, pending, groups, t0)
+
+def _record_outputs(job, outs, options):
+    """EXECUTE 결과를 artifact 로 저장하고 ANALYZE 용 evidence 리스트 반환."""
+    unique_outs = list({id(o): o for o in outs}.values())
+    hits = sum(1 for o in unique_outs if o.get("cache", {}).get("hit"))
+    log(job.id, "info", "tool_cache", {"hits": hits, "misses": sum(1 for o in unique_outs if "cache" in o) - hits,
+                                       "force_fresh": bool(options.get("force_fresh"))})
+    with span("db_commit", what="artifacts"):
+        for out in unique_outs:
+            art = Artifact.from_tool_output(job.id, out)
+            db.session.add(art)
+        db.session.commit()
+    log(job.id, "info", "tool_pools", {"ssh": ssh_pool_stats(), "db": db_pool_stats()})
+
+    # evidence list for LLM (blob 을 다시 읽지 않고 메모리의 결과 사용)
     evidence = []
-    for a in artifacts_db:
-        d = dict(a.meta_json)
-        evidence.append({"tool": d.get("tool"), "result": d, "sha256": a.sha256})
+    for out in unique_outs:
+        evidence.append({"tool": out["tool"], "result": {**out["result"], "tool": out["tool"]}, "sha256": out["sha256"]})
+    return evidence
+
+def _decider_version(control_id: str):
+    """판정 로직이 바뀌면 fingerprint 도 바뀌도록: 규칙 정의 + (GPT 사용 시) 프롬프트/모델 버전."""
+    rule = rules.COMPILED.get(control_id.upper())
+    return {"rule": rule.spec if rule else None,
+            "llm": [llm_client.PROMPT_VERSION, llm_client.GPT_MODEL] if llm_client.USE_GPT else None}
+
+def _prior_job(job):
+    """같은 target + 같은 control 집합으로 끝난 가장 최근 job."""
+    want = sorted(job.controls or [])
+    recent = (Job.query.filter(Job.target == job.target, Job.status == "DONE", Job.id != job.id)
+              .order_by(Job.id.desc()).limit(INCREMENTAL_LOOKBACK).all())
+    return next((j for j in recent if sorted(j.controls or []) == want), None)
+
+_DEFINITIVE = ("pass", "fail")
 
-    # 4) ANALYZE (LLM structured decision or fallback)
-    log(job.id, "stage", "ANALYZE")
-    decision = decide_with_llm(evidence, controls)
+def _plan_reuse(job, controls, evidence):
+    """
+    control 별 fingerprint 를 계산하고, 직전 job 의 같은 fingerprint 판정을 재사용 대상으로 고름.
+    확정 판정(pass/fail)만 재사용: unknown 은 증거가 같아도 다시 판정해 봐야 함 (LLM/규칙 개선, 일시 오류).
+    반환: (fingerprints, {cid: [이전 Finding]}, base job id | None)
+    """
+    fps = {cid: control_fingerprint(cid, c, evidence, _decider_version(cid)) for cid, c in controls.items()}
+    incremental = (job.options or {}).get("incremental", INCREMENTAL_RESCAN)
+    prior = _prior_job(job) if incremental else None
+    if prior is None:
+        return fps, {}, None
+    by_cid = {}
+    for f in Finding.query.filter_by(job_id=prior.id).all():
+        by_cid.setdefault(f.control_id, []).append(f)
+    reused = {cid: fs for cid, fs in by_cid.items()
+              if cid in fps and all(f.fingerprint == fps[cid] and f.status in _DEFINITIVE for f in fs)}
+    return fps, reused, prior.id
+
+def _record_decision(job, decision, analyze_stats, llm_usage, fps=None, reused=None, base_job=None):
+    fps, reused = fps or {}, reused or {}
+    if analyze_stats is not None:
+        log(job.id, "info", "analyze", analyze_stats)
+    if llm_usage:
+        log(job.id, "info", "llm_usage", {"calls": llm_usage,
+                                          "cache_hits": sum(1 for u in llm_usage if u["cache_hit"]),
+                                          "saved_tokens": sum(u.get("saved_tokens", {}).get("total_tokens", 0) for u in llm_usage),
+                                          "saved_ms": round(sum(u.get("saved_ms", 0) for u in llm_usage), 2)})
     items = decision.get("items", [])
     findings = []
     for it in items:
@@ -57,10 +202,140 @@ def run_pipeline(job):
                     risk=it.get("risk",""),
                     recommendation=it.get("recommendation",""),
                     repro=it.get("repro",[]),
-                    raw=it)
-        db.session.add(f); db.session.commit()
+                    raw=it,
+                    fingerprint=fps.get(it.get("control_id")))
+        db.session.add(f)
         findings.append(f)
+    # 재사용: 이전 판정을 그대로 복사 (증거 sha256 이 같으므로 evidence_refs 도 유효)
+    for cid, prev in reused.items():
+        for p in prev:
+            f = Finding(job_id=job.id, control_id=p.control_id, status=p.status, evidence_refs=p.evidence_refs,
+                        finding=p.finding, risk=p.risk, recommendation=p.recommendation, repro=p.repro,
+                        raw=p.raw, fingerprint=p.fingerprint, reused_from=p.reused_from or p.job_id)
+            db.session.add(f)
+            findings.append(f)
+    job.rescan = {"base_job": base_job, "reused": sorted(reused),
+                  "recomputed": sorted(cid for cid in fps if cid not in reused)}
+    with span("db_commit", what="findings"):
+        db.session.commit()
+    for f in findings:
+        inc("findings", control=f.control_id, outcome=f.status)
+    log(job.id, "info", "rescan", job.rescan)
+    return findings
+
+def _tool_callbacks(job):
+    on_call = lambda st, n: log(job.id, "info", "tool_call", {"tool": st["tool"], "args": st["args"], "steps": n})
+    on_done = lambda out, n: log(job.id, "info", "tool_done", {"tool": out["tool"], "sha256": out["sha256"], "steps": n,
+                                                               "cache": out.get("cache", {}).get("hit"),
+                                                               **out.get("timing", {})})
+    return on_call, on_done
+
+@contextmanager
+def _stage(job, name, timings):
+    """stage 이벤트를 남기고 소요 시간을 timings 와 stage histogram 에 기록."""
+    log(job.id, "stage", name)
+    with span("stage", stage=name) as sp:
+        yield sp
+    timings[name] = sp.ms
+
+def _log_timings(job, timings):
+    log(job.id, "info", "timings", {"stages_ms": timings, "total_ms": round(sum(timings.values()), 2)})
+
+def _pipeline(job):
+    """
+    run_pipeline / run_pipeline_async 가 공유하는 단계 흐름 (generator).
+    I/O 가 있는 단계는 (step, *args) 를 yield 하고, 실행기가 동기 또는 async 로 실행해 결과를 send 한다
+    (실패하면 throw). 이벤트/DB 쓰기는 여기서 await 없이 한 번에 한다.
+    """
+    timings = {}
+    # 1) RAG
+    with _stage(job, "RAG", timings):
+        controls = yield ("rag", job.controls)
+    log(job.id, "info", "rag_index", index_stats())
+
+    # 2) PLAN (LLM or fallback)
+    llm_usage = []
+    with _stage(job, "PLAN", timings):
+        plan = yield ("plan", job.target, controls, llm_usage)
+    if not plan:
+        log(job.id, "warn", "No plan produced; marking unknown")
+    # 3) EXECUTE (동일 (tool,args) 는 한 번만 실행, 독립 step 은 병렬 실행)
+    options = job.options or {}
+    on_call, on_done = _tool_callbacks(job)
+    with _stage(job, "EXECUTE", timings):
+        outs = yield ("execute", plan, on_call, on_done, bool(options.get("force_fresh")))
+        evidence = _record_outputs(job, outs, options)
+
+    # 4) ANALYZE (control/그룹 단위 병렬 판정: LLM structured decision or fallback)
+    #    직전 job 과 fingerprint 가 같은 control 은 판정을 복사하고 ANALYZE 에서 제외
+    fps, reused, base_job = _plan_reuse(job, controls, evidence)
+    todo = {cid: c for cid, c in controls.items() if cid not in reused}
+    decision, analyze_stats = {"items": []}, None
+    if todo:
+        with _stage(job, "ANALYZE", timings):
+            decision, analyze_stats = yield ("analyze", todo, evidence, llm_usage)
+    findings = _record_decision(job, decision, analyze_stats, llm_usage, fps, reused, base_job)
 
     # 5) REPORT
-    log(job.id, "stage", "REPORT")
+    with _stage(job, "REPORT", timings):
+        pass
+    _log_timings(job, timings)
     return findings
+
+_SYNC_STEPS = {
+    "rag": control_snippets_batch,
+    "plan": lambda target, controls, usage: plan_steps_with_llm(target, controls, usage=usage),
+    "execute": lambda plan, on_call, on_done, force_fresh: execute_plan(plan, on_call=on_call, on_done=on_done,
+                                                                        force_fresh=force_fresh),
+    "analyze": lambda controls, evidence, usage: analyze(controls, evidence, usage=usage),
+}
+
+def run_pipeline(job):
+    steps = _pipeline(job)
+    res = err = None
+    while True:
+        try:
+            step, *args = steps.throw(err) if err is not None else steps.send(res)
+        except StopIteration as done:
+            return done.value
+        res = err = None
+        try:
+            res = _SYNC_STEPS[step](*args)
+        except Exception as e:
+            err = e
+
+async def analyze_async(controls, evidence, usage=None):
+    """analyze 의 async 판: 규칙 판정 후 남은 그룹의 판정 호출을 gather."""
+    t0 = time.perf_counter()
+    items, summary, pending, groups = _analyze_prepare(controls, evidence)
+    sem = asyncio.Semaphore(ANALYZE_CONCURRENCY)
+    async def one(g):
+        async with sem:
+            return await adecide_with_llm(g["evidence"], g["controls"], usage=usage)
+    results = await asyncio.gather(*(one(g) for g in groups))
+    return _analyze_merge(results, items, summary, controls, evidence, pending, groups, t0)
+
+async def run_pipeline_async(job, http=None):
+    """
+    run_pipeline 의 async 판. await 지점(LLM, HTTP, thread 로 넘긴 RAG/SSH/DB)에서
+    같은 event loop 의 다른 job 이 진행되므로 job 들의 단계가 겹쳐 돈다.
+    """
+    async_steps = {
+        "rag": lambda ids: asyncio.to_thread(control_snippets_batch, ids),
+        "plan": lambda target, controls, usage: aplan_steps_with_llm(target, controls, usage=usage),
+        "execute": lambda plan, on_call, on_done, force_fresh: execute_plan_async(
+            plan, on_call=on_call, on_done=on_done, force_fresh=force_fresh, http=http),
+        "analyze": lambda controls, evidence, usage: analyze_async(controls, evidence, usage=usage),
+    }
+    steps = _pipeline(job)
+    res = err = None
+    while True:
+        try:
+            step, *args = steps.throw(err) if err is not None else steps.send(res)
+        except StopIteration as done:
+            return done.value
+        res = err = None
+        try:
+            res = await async_steps[step](*args)
+        except Exception as e:
+            err = e
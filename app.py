@@ -1,65 +1,391 @@
-from flask import Flask, request, jsonify, Response, send_file, render_template, redirect, url_for
-from models import db, Job, Event, Artifact, Finding
+from flask import Flask, request, jsonify, Response, send_file, render_template, redirect, url_for, stream_with_context
+from models import db, Job, Fleet, Event, EventRollup, Artifact, Finding, upgrade_schema, referenced_blobs
+import blobstore
 from config import SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS, DEFAULT_TARGET
-from rq import Queue
-from redis import Redis
-from worker import run_job
-import time, json
-from report import build_pdf
-import os, tempfile
+from config import SSE_HEARTBEAT_SEC
+from bus import get_redis, job_channel, fleet_channel
+import fleet as fleets
+import scheduler
+import metrics
+import time, json, base64, re, sys
+import click
+from datetime import datetime
+from sqlalchemy import tuple_
+import report
+import export as exporter
+import retention
+import itertools
+import hashlib, os
 
 app = Flask(__name__)
 app.config["SQLALCHEMY_DATABASE_URI"] = SQLALCHEMY_DATABASE_URI
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = SQLALCHEMY_TRACK_MODIFICATIONS
 db.init_app(app)
 
-redis = Redis.from_url("redis://localhost:6379/0")
-q = Queue("jobs", connection=redis)
-
 @app.cli.command("db_init")
 def db_init():
     with app.app_context():
-        db.create_all()
+        upgrade_schema()
         print("DB initialized.")
 
+@app.cli.command("blobs_gc")
+@click.option("--dry-run", is_flag=True, help="Only report what would be removed.")
+def blobs_gc(dry_run):
+    """Delete artifact blobs no longer referenced by any Artifact row."""
+    with app.app_context():
+        print(blobstore.gc(referenced_blobs(), dry_run=dry_run))
+
+@app.cli.command("export_ndjson")
+@click.option("--out", "-o", default="-", help="Output file ('.gz' suffix = gzip), '-' for stdout.")
+@click.option("--since", help="Watermark returned by a previous export.")
+@click.option("--state", "state_file", help="Watermark file: read before, rewritten after a complete export.")
+@click.option("--from", "start", help="Jobs created at or after (ISO 8601).")
+@click.option("--to", "end", help="Jobs created before (ISO 8601).")
+@click.option("--job-ids", help="Comma-separated job ids.")
+@click.option("--fleet-id", type=int)
+@click.option("--kinds", help="Comma-separated subset of findings,events,artifacts.")
+def export_ndjson(out, since, state_file, start, end, job_ids, fleet_id, kinds):
+    """Stream findings, events and artifact metadata as NDJSON (same format as GET /api/export)."""
+    if state_file and not since and os.path.exists(state_file):
+        since = open(state_file).read().strip() or None
+    with app.app_context():
+        try:
+            p = exporter.plan(since, start, end, _csv(job_ids), fleet_id, _csv(kinds))
+        except exporter.ExportError as e:
+            raise click.UsageError(str(e))
+        chunks = exporter.iter_ndjson(p)
+        if out == "-":
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            tmp = out + ".part"  # 끝까지 쓴 파일만 보이도록
+            with open(tmp, "wb") as f:
+                for chunk in (exporter.gzip_stream(chunks) if out.endswith(".gz") else chunks):
+                    f.write(chunk)
+            os.replace(tmp, out)
+    if state_file:
+        with open(state_file, "w") as f:
+            f.write(p["watermark"] + "\n")
+    click.echo(f"watermark {p['watermark']}", err=True)
+
+@app.cli.command("retention")
+@click.option("--days", type=float, default=None, help="Archive events of jobs finished more than N days ago.")
+@click.option("--dry-run", is_flag=True, help="Only count the jobs that would be archived.")
+@click.option("--enable-incremental-vacuum", is_flag=True, help="Convert an existing SQLite DB once (full VACUUM).")
+@click.option("--schedule", is_flag=True, help="Start the periodic task (EVENT_RETENTION_INTERVAL_SEC).")
+def retention_cmd(days, dry_run, enable_incremental_vacuum, schedule):
+    """Roll up old events, move them to compressed archives and vacuum incrementally."""
+    with app.app_context():
+        if enable_incremental_vacuum:
+            print("incremental vacuum enabled" if retention.enable_incremental_vacuum() else "already enabled")
+        if schedule:
+            print("scheduled" if retention.schedule() else "not scheduled (interval 0 or already running)")
+            return
+        kw = {"days": days} if days is not None else {}
+        print(retention.run(dry_run=dry_run, **kw))
+
+def _csv(raw):
+    return [x.strip() for x in raw.split(",") if x.strip()] if raw else None
+
 @app.route("/")
 def dashboard():
-    jobs = Job.query.order_by(Job.created_at.desc()).limit(20).all()
-    return render_template("dashboard.html", jobs=jobs, default_target=DEFAULT_TARGET)
+    jobs = Job.query.order_by(Job.created_at.desc(), Job.id.desc()).limit(20).all()
+    fleet_list = Fleet.query.order_by(Fleet.created_at.desc(), Fleet.id.desc()).limit(10).all()
+    return render_template("dashboard.html", jobs=jobs, fleets=fleet_list, default_target=DEFAULT_TARGET)
 
 @app.post("/api/jobs")
 def create_job():
     data = request.get_json()
     if not data.get("target"):
         return jsonify({"error":"target required"}), 400
+    rq_job, job = _submit_job(data)
+    return jsonify({"job_id": job.id, "rq_id": rq_job.id, "priority": job.priority})
+
+def _submitter(data) -> str:
+    return data.get("submitter") or request.headers.get("X-Submitter") or request.remote_addr or ""
+
+def _submit_job(data):
+    """priority lane 결정(요청값/ control 수/ submitter 공정성) 후 저장, enqueue."""
+    data = {**data, "submitter": _submitter(data)}
+    data["priority"] = scheduler.choose_priority(data.get("priority"), data.get("controls"), data["submitter"])
     job = Job.from_request(data)
     db.session.add(job); db.session.commit()
-    rq_job = q.enqueue(run_job, job.id)
-    return jsonify({"job_id": job.id, "rq_id": rq_job.id})
+    return scheduler.submit(job), job
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """stage/tool/LLM/DB commit/report histogram + findings/jobs counter (worker 분은 Redis 에서 합산)."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.get("/api/scheduler/stats")
+def scheduler_stats():
+    """lane 별 queue 깊이/평균 대기, throttle 이벤트, submitter 별 active job (worker 수 산정용)."""
+    st = scheduler.stats()
+    return jsonify(st), 503 if "error" in st else 200
+
+PAGE_DEFAULT, PAGE_MAX = 50, 500
+
+def _page_limit() -> int:
+    try:
+        n = int(request.args.get("limit", PAGE_DEFAULT))
+    except ValueError:
+        n = PAGE_DEFAULT
+    return max(1, min(n, PAGE_MAX))
+
+def _page(items, limit, cursor_of, to_dict=lambda x: x.to_dict()):
+    """limit+1 개를 읽어 다음 페이지 존재 여부 판단. 다음 cursor 는 X-Next-After / Link 헤더로 전달."""
+    more = len(items) > limit
+    items = items[:limit]
+    resp = jsonify([to_dict(x) for x in items])
+    if more:
+        nxt = cursor_of(items[-1])
+        resp.headers["X-Next-After"] = nxt
+        args = {**request.args.to_dict(), "after": nxt, "limit": limit}
+        resp.headers["Link"] = f'<{url_for(request.endpoint, **request.view_args, **args)}>; rel="next"'
+    return resp
+
+def _job_cursor(job) -> str:
+    return base64.urlsafe_b64encode(f"{job.created_at.isoformat()}|{job.id}".encode()).decode()
+
+def _parse_job_cursor(raw):
+    try:
+        ts, jid = base64.urlsafe_b64decode(raw.encode()).decode().split("|")
+        return datetime.fromisoformat(ts), int(jid)
+    except Exception:
+        return None
 
 @app.get("/api/jobs")
 def list_jobs():
-    jobs = Job.query.order_by(Job.created_at.desc()).all()
-    return jsonify([j.to_dict() for j in jobs])
+    """최신순 keyset pagination: ?limit=&after=<X-Next-After>. (created_at, id) index 를 그대로 탄다."""
+    limit = _page_limit()
+    q = Job.query
+    after = request.args.get("after")
+    if after:
+        cur = _parse_job_cursor(after)
+        if cur is None:
+            return jsonify({"error": "invalid cursor"}), 400
+        q = q.filter(tuple_(Job.created_at, Job.id) < tuple_(*cur))
+    jobs = q.order_by(Job.created_at.desc(), Job.id.desc()).limit(limit + 1).all()
+    return _page(jobs, limit, _job_cursor)
+
+def _id_page(model, jid, to_dict=lambda x: x.to_dict()):
+    limit = _page_limit()
+    after = request.args.get("after", "0")
+    if not after.isdigit():
+        return jsonify({"error": "invalid cursor"}), 400
+    rows = (model.query.filter(model.job_id == jid, model.id > int(after))
+            .order_by(model.id.asc()).limit(limit + 1).all())
+    return _page(rows, limit, lambda x: str(x.id), to_dict)
+
+@app.get("/api/jobs/<jid>/events")
+def list_events(jid):
+    if not jid.isdigit() or db.session.get(EventRollup, int(jid)) is None:
+        return _id_page(Event, jid, lambda e: e.to_json())
+    # retention 으로 archive 된 job: archive(+남은 row) 에서 같은 cursor 규칙으로 페이지
+    limit = _page_limit()
+    after = request.args.get("after", "0")
+    if not after.isdigit():
+        return jsonify({"error": "invalid cursor"}), 400
+    rows = list(itertools.islice(retention.replay(jid, int(after)), limit + 1))
+    return _page(rows, limit, lambda x: str(x["id"]), lambda x: x)
+
+@app.get("/api/jobs/<jid>/findings")
+def list_findings(jid):
+    return _id_page(Finding, jid)
+
+@app.get("/api/export")
+def export_stream():
+    """
+    findings/events/artifact metadata NDJSON streaming export (SIEM 용).
+    ?since=<watermark>&from=&to=&job_ids=1,2&fleet_id=&kinds=findings,events
+    X-Export-Watermark (와 마지막 줄) 의 값을 다음 요청의 since 로 쓰면 새 row 만 온다.
+    gzip 을 받는 client 에는 압축하면서 보낸다.
+    """
+    args = request.args
+    try:
+        p = exporter.plan(args.get("since"), args.get("from"), args.get("to"), _csv(args.get("job_ids")),
+                          args.get("fleet_id", type=int), _csv(args.get("kinds")))
+    except exporter.ExportError as e:
+        return jsonify({"error": str(e)}), 400
+    body = exporter.iter_ndjson(p)
+    headers = {"X-Export-Watermark": p["watermark"], "Cache-Control": "no-store", "X-Accel-Buffering": "no"}
+    if request.accept_encodings["gzip"]:
+        body = exporter.gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    return Response(stream_with_context(body), mimetype="application/x-ndjson", headers=headers)
 
 @app.get("/api/jobs/<jid>")
 def get_job(jid):
     job = Job.query.get_or_404(jid)
-    return jsonify(job.to_dict())
+    rollup = db.session.get(EventRollup, job.id)
+    return jsonify({**job.to_dict(), "events_rollup": rollup.to_dict() if rollup else None})
+
+TERMINAL_LEVELS = ("done", "error")
+
+def _sse(ev: dict) -> str:
+    return f"id: {ev['id']}\nevent: {ev['level']}\ndata: {json.dumps(ev, ensure_ascii=False)}\n\n"
 
 @app.get("/api/jobs/<jid>/stream")
 def stream(jid):
+    """
+    Redis pub/sub 으로 push 되는 job 이벤트를 SSE 로 중계.
+    - Last-Event-ID (또는 ?last_event_id=) 가 있으면 그 이후 이벤트만 DB 에서 replay
+    - 이미 끝난 job 에 cursor 없이 붙으면 전체 이력을 replay
+    - done/error 이벤트를 보내면 스트림 종료, 조용할 때는 heartbeat 주석 전송
+    """
+    last = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    cursor = int(last) if last and last.isdigit() else None
+
+    def replay(after):
+        yield from retention.replay(jid, after)  # archive 된 event 가 있으면 그것부터
+
+    def gen():
+        nonlocal cursor
+        pubsub = None
+        try:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(job_channel(jid))  # replay 전에 구독 → 사이에 publish 된 이벤트도 놓치지 않음
+        except Exception:
+            pubsub = None
+        job = Job.query.get(jid)
+        if job is None:
+            return
+        if cursor is None and job.status in ("DONE", "FAILED"):
+            cursor = 0
+        if cursor is not None:
+            for ev in replay(cursor):
+                cursor = ev["id"]
+                yield _sse(ev)
+                if ev["level"] in TERMINAL_LEVELS:
+                    return
+        db.session.remove()  # 이후로는 DB 를 쓰지 않음
+        yield "retry: 3000\n\n"
+        if pubsub is None:
+            # Redis 를 쓸 수 없으면 예전처럼 DB polling 으로 대체
+            while True:
+                for ev in replay(cursor or 0):
+                    cursor = ev["id"]
+                    yield _sse(ev)
+                    if ev["level"] in TERMINAL_LEVELS:
+                        return
+                db.session.remove()
+                time.sleep(1)
+        try:
+            while True:
+                msg = pubsub.get_message(timeout=SSE_HEARTBEAT_SEC)
+                if msg is None:
+                    yield ": ping\n\n"
+                    continue
+                ev = json.loads(msg["data"])
+                if cursor is not None and ev["id"] <= cursor:
+                    continue
+                cursor = ev["id"]
+                yield _sse(ev)
+                if ev["level"] in TERMINAL_LEVELS:
+                    return
+        finally:
+            pubsub.close()
+
+    return Response(stream_with_context(gen()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _submit_fleet(data):
+    data = {**data, "priority": data.get("priority") if data.get("priority") in scheduler.LANES else "low"}
+    fleet, job_ids = fleets.create_fleet(data)
+    batches = fleets.enqueue_fleet(scheduler.queue(data["priority"]), fleet, job_ids)
+    return fleet, batches
+
+@app.post("/api/fleets")
+def create_fleet():
+    """{"targets":[...], "cidr":"10.0.0.0/24"|[...], "hosts":"<host 파일>", "controls":[...], "batch_size", "parallelism"}"""
+    try:
+        fleet, batches = _submit_fleet(request.get_json() or {})
+    except fleets.FleetError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"fleet_id": fleet.id, "targets": fleet.targets_total, "batches": batches})
+
+@app.get("/api/fleets")
+def list_fleets():
+    limit = _page_limit()
+    q_ = Fleet.query
+    after = request.args.get("after")
+    if after:
+        cur = _parse_job_cursor(after)
+        if cur is None:
+            return jsonify({"error": "invalid cursor"}), 400
+        q_ = q_.filter(tuple_(Fleet.created_at, Fleet.id) < tuple_(*cur))
+    rows = q_.order_by(Fleet.created_at.desc(), Fleet.id.desc()).limit(limit + 1).all()
+    return _page(rows, limit, _job_cursor)
+
+@app.get("/api/fleets/<int:fid>")
+def get_fleet(fid):
+    """집계는 Fleet row 의 증분 counter 에서 바로 읽음 (findings 재집계 없음)."""
+    return jsonify(Fleet.query.get_or_404(fid).to_dict())
+
+@app.get("/api/fleets/<int:fid>/jobs")
+def list_fleet_jobs(fid):
+    """fleet 소속 job, id 순 keyset pagination (?status= 로 필터 가능)."""
+    limit = _page_limit()
+    after = request.args.get("after", "0")
+    if not after.isdigit():
+        return jsonify({"error": "invalid cursor"}), 400
+    q_ = Job.query.filter(Job.fleet_id == fid, Job.id > int(after))
+    if request.args.get("status"):
+        q_ = q_.filter(Job.status == request.args["status"].upper())
+    rows = q_.order_by(Job.id.asc()).limit(limit + 1).all()
+    return _page(rows, limit, lambda x: str(x.id))
+
+@app.get("/api/fleets/<int:fid>/stream")
+def fleet_stream(fid):
+    """
+    fleet 집계 snapshot 을 SSE 로 중계. 접속 즉시 현재 snapshot, 이후 job 이 끝날 때마다 갱신본.
+    DONE 이 되면 종료. Redis 를 못 쓰면 DB polling.
+    """
     def gen():
-        last_id = 0
-        while True:
-            events = (Event.query
-                      .filter(Event.job_id==jid, Event.id>last_id)
-                      .order_by(Event.id.asc()).all())
-            for e in events:
-                last_id = e.id
-                yield f"event: {e.level}\ndata: {json.dumps(e.to_json(), ensure_ascii=False)}\n\n"
-            time.sleep(1)
-    return Response(gen(), mimetype="text/event-stream")
+        pubsub = None
+        try:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(fleet_channel(fid))
+        except Exception:
+            pubsub = None
+        fleet = db.session.get(Fleet, fid)
+        if fleet is None:
+            return
+        snap = fleet.to_dict()
+        db.session.remove()
+        yield f"event: summary\ndata: {json.dumps(snap)}\n\n"
+        if snap["status"] == "DONE":
+            return
+        yield "retry: 3000\n\n"
+        try:
+            while True:
+                if pubsub is None:
+                    time.sleep(1)
+                    fleet = db.session.get(Fleet, fid); cur = fleet.to_dict(); db.session.remove()
+                    if cur["updated_at"] == snap["updated_at"]:
+                        continue
+                else:
+                    msg = pubsub.get_message(timeout=SSE_HEARTBEAT_SEC)
+                    if msg is None:
+                        yield ": ping\n\n"
+                        continue
+                    cur = json.loads(msg["data"])
+                snap = cur
+                yield f"event: summary\ndata: {json.dumps(snap)}\n\n"
+                if snap["status"] == "DONE":
+                    return
+        finally:
+            if pubsub is not None:
+                pubsub.close()
+
+    return Response(stream_with_context(gen()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/fleets/<int:fid>")
+def fleet_detail(fid):
+    fleet = Fleet.query.get_or_404(fid)
+    return render_template("fleet.html", fleet=fleet)
 
 @app.get("/jobs/<jid>")
 def job_detail(jid):
@@ -68,34 +394,83 @@ def job_detail(jid):
     artifacts = Artifact.query.filter_by(job_id=jid).all()
     return render_template("job.html", job=job, findings=findings, artifacts=artifacts)
 
+@app.get("/api/blobs/<sha>")
+def get_blob(sha):
+    """artifact blob 원문(압축 해제)을 스트리밍. 내용 주소라 영구 캐시 가능."""
+    if not re.fullmatch(r"[0-9a-f]{64}", sha) or not blobstore.exists(sha):
+        return jsonify({"error": "not found"}), 404
+    def gen():
+        with blobstore.open_blob(sha) as f:
+            while True:
+                chunk = f.read(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+    return Response(gen(), mimetype="application/octet-stream",
+                    headers={"ETag": f'"{sha}"', "Cache-Control": "public, max-age=31536000, immutable"})
+
 @app.post("/web/new_job")
 def web_new_job():
     target = request.form.get("target") or DEFAULT_TARGET
     controls = [c.strip() for c in (request.form.get("controls") or "U31").split(",") if c.strip()]
-    data = {"target": target, "controls": controls, "ike_patches": [], "depth": "safe"}
-    job = Job.from_request(data)
-    db.session.add(job); db.session.commit()
-    q.enqueue(run_job, job.id)
+    data = {"target": target, "controls": controls, "ike_patches": [], "depth": "safe",
+            "options": {"force_fresh": bool(request.form.get("force_fresh"))},
+            "priority": request.form.get("priority") or None}
+    _, job = _submit_job(data)
     return redirect(url_for("job_detail", jid=job.id))
 
+@app.post("/web/new_fleet")
+def web_new_fleet():
+    upload = request.files.get("hosts_file")
+    data = {"name": request.form.get("name") or "",
+            "targets": [t for t in re.split(r"[\s,]+", request.form.get("targets") or "") if t],
+            "hosts": upload.read().decode("utf-8", "replace") if upload else "",
+            "controls": [c.strip() for c in (request.form.get("controls") or "U31").split(",") if c.strip()],
+            "batch_size": request.form.get("batch_size") or None,
+            "parallelism": request.form.get("parallelism") or None,
+            "options": {"force_fresh": bool(request.form.get("force_fresh"))}}
+    try:
+        fleet, _ = _submit_fleet(data)
+    except fleets.FleetError as e:
+        return jsonify({"error": str(e)}), 400
+    return redirect(url_for("fleet_detail", fid=fleet.id))
+
+REPORT_MIMETYPES = {"json": "application/json", "pdf": "application/pdf"}
+
+def _send_report(jid, kind):
+    """
+    DONE job 은 worker 가 저장해 둔 blob 을 ETag(sha256) 와 함께 보냄 (If-None-Match 가 맞으면 304).
+    gzip 을 받는 client 에는 저장된 .gz 파일을 그대로 보내 렌더/압축 비용이 없다.
+    아직 안 끝난 job 은 그때그때 렌더만 하고 저장하지 않는다.
+    """
+    job = Job.query.get_or_404(jid)
+    with metrics.span("report", format=kind) as sp:
+        if job.status != "DONE":
+            data = report.render(job, kind)
+            etag, resp = hashlib.sha256(data).hexdigest(), Response(data, mimetype=REPORT_MIMETYPES[kind])
+            sp.outcome = "live"
+        else:
+            sha, hit = report.stored(job, kind)
+            sp.outcome = "hit" if hit else "miss"
+            if request.accept_encodings["gzip"]:
+                etag = sha + ".gz"  # 표현(encoding)이 다르면 ETag 도 다르게
+                resp = send_file(os.path.abspath(blobstore.path_of(sha)), mimetype=REPORT_MIMETYPES[kind], etag=False, conditional=False)
+                resp.headers["Content-Encoding"] = "gzip"
+            else:
+                etag, resp = sha, Response(blobstore.get_bytes(sha), mimetype=REPORT_MIMETYPES[kind])
+        resp.set_etag(etag)
+        resp.vary.add("Accept-Encoding")
+        resp.cache_control.no_cache = True  # 캐시는 하되 매번 ETag 로 재검증
+        if kind == "pdf":
+            resp.headers["Content-Disposition"] = f'attachment; filename="job_{job.id}_report.pdf"'
+        resp = resp.make_conditional(request)
+        sp.size = resp.content_length
+    return resp
+
 @app.get("/api/jobs/<jid>/report.json")
 def report_json(jid):
-    findings = Finding.query.filter_by(job_id=jid).all()
-    items = []
-    summary = {"pass":0,"fail":0,"na":0,"unknown":0}
-    for f in findings:
-        items.append(f.raw)
-        summary[f.status] = summary.get(f.status,0)+1
-    return jsonify({"items": items, "summary": summary})
+    return _send_report(jid, "json")
 
 @app.get("/api/jobs/<jid>/report.pdf")
 def report_pdf(jid):
-    job = Job.query.get_or_404(jid)
-    findings = Finding.query.filter_by(job_id=jid).all()
-    summary = {"pass":0,"fail":0,"na":0,"unknown":0}
-    for f in findings: summary[f.status] = summary.get(f.status,0)+1
-    meta = {"Target": job.target, "Controls": ",".join(job.controls), "JobID": str(job.id)}
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    tmp.close()
-    build_pdf(tmp.name, "Security Check Report", meta, findings, summary)
-    return send_file(tmp.name, as_attachment=True, download_name=f"job_{job.id}_report.pdf")
+    return _send_report(jid, "pdf")
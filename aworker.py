@@ -0,0 +1,141 @@
+# aworker.py
+# asyncio 기반 worker: 한 process 가 여러 job 을 동시에 처리.
+# LLM(AsyncOpenAI), HTTP(httpx.AsyncClient) 는 await, paramiko/pymysql 은 thread 로 넘긴다.
+# 한 job 이 LLM/네트워크를 기다리는 동안 다른 job 의 단계가 진행 (A 의 ANALYZE 와 B 의 EXECUTE 가 겹침).
+#
+#   python aworker.py [--concurrency 16] [--burst] [jobs-high jobs jobs-low]
+#
+# 지연 재등록(enqueue_in)은 RQ scheduler 가 처리하므로 `rq worker --with-scheduler` 하나는 같이 띄운다.
+import argparse, asyncio, traceback
+from datetime import datetime, timezone
+import httpx
+from rq import Queue
+from rq.exceptions import DequeueTimeout
+from rq.job import JobStatus
+from app import app
+from agent import run_pipeline_async
+from bus import get_redis
+import fleet as fleets
+import scheduler
+import worker
+from config import ASYNC_WORKER_CONCURRENCY, ASYNC_HTTP_MAX_CONNECTIONS, ASYNC_WORKER_HEARTBEAT_SEC
+
+DEQUEUE_TIMEOUT = 5
+HEARTBEAT_TTL = int(ASYNC_WORKER_HEARTBEAT_SEC) + 60  # 갱신이 한두 번 늦어도 registry 에서 빠지지 않게
+
+async def run_job_async(job_id, http=None, rq_job=None):
+    """worker.run_job 의 async 판. task 마다 app context(=DB session)를 따로 연다."""
+    with app.app_context():
+        job, token = worker._begin(job_id, rq_job)
+        if job is None:
+            return
+        ok, statuses = False, []
+        try:
+            ok, statuses = worker._done(job, await run_pipeline_async(job, http))
+        except Exception as e:
+            ok, statuses = worker._failed(job, e)
+        finally:
+            worker._finish(job, token, ok, statuses)
+
+async def run_next_async(priority="normal", http=None, rq_job=None):
+    job_id = await asyncio.to_thread(scheduler.next_job, priority)
+    if job_id is not None:
+        await run_job_async(job_id, http, rq_job)
+
+async def run_fleet_batch_async(job_ids, fleet_id=None, http=None, rq_job=None):
+    if fleet_id:
+        with app.app_context():
+            fleets.mark_running(fleet_id)
+    left = list(job_ids)
+    try:
+        while left:
+            await run_job_async(left[0], http)
+            left.pop(0)
+    finally:
+        if left and fleet_id:
+            with app.app_context():
+                worker.abort_batch(fleet_id, left)
+
+ASYNC_FUNCS = {"worker.run_job": run_job_async, "worker.run_next": run_next_async,
+               "worker.run_fleet_batch": run_fleet_batch_async}
+
+async def _heartbeat(rq_job):
+    """실행 중인 동안 started registry 의 TTL 을 주기적으로 갱신 (긴 fleet batch 가 '버려진 job' 으로 정리되지 않게)."""
+    while True:
+        await asyncio.sleep(ASYNC_WORKER_HEARTBEAT_SEC)
+        try:
+            await asyncio.to_thread(rq_job.heartbeat, datetime.now(timezone.utc), HEARTBEAT_TTL)
+        except Exception:
+            pass  # Redis 가 잠깐 끊겨도 job 은 계속, 다음 주기에 다시
+
+def _set_started(rq_job):
+    rq_job.set_status(JobStatus.STARTED)
+    rq_job.heartbeat(datetime.now(timezone.utc), HEARTBEAT_TTL)
+
+def _set_finished(rq_job, queue, exc_string):
+    if exc_string is not None:
+        rq_job.set_status(JobStatus.FAILED)
+        queue.failed_job_registry.add(rq_job, exc_string=exc_string)
+    else:
+        rq_job.set_status(JobStatus.FINISHED)
+        queue.finished_job_registry.add(rq_job, rq_job.result_ttl or 500)
+    queue.started_job_registry.remove(rq_job)
+
+async def perform(rq_job, queue, http):
+    """RQ job 하나 실행 + RQ 상태/registry 갱신. 알려진 함수는 async 판, 그 밖은 thread 에서 동기 실행.
+    Redis 호출(상태/registry/후속 job 등록)은 thread 로 넘겨 event loop 의 다른 job 을 막지 않는다."""
+    await asyncio.to_thread(_set_started, rq_job)
+    beat = asyncio.create_task(_heartbeat(rq_job))
+    exc_string = None
+    try:
+        fn = ASYNC_FUNCS.get(rq_job.func_name)
+        if fn is not None:
+            await fn(*rq_job.args, **rq_job.kwargs, http=http, rq_job=rq_job)
+        else:
+            await asyncio.to_thread(rq_job.perform)
+    except Exception:
+        exc_string = traceback.format_exc()
+    finally:
+        beat.cancel()
+    await asyncio.to_thread(_set_finished, rq_job, queue, exc_string)
+    await asyncio.to_thread(queue.enqueue_dependents, rq_job)  # fleet lane 의 다음 batch (allow_failure 라 실패해도 진행)
+
+async def serve(queue_names, concurrency: int, burst: bool = False):
+    conn = get_redis()
+    queues = [Queue(n, connection=conn) for n in queue_names]
+    slots = asyncio.Semaphore(concurrency)
+    tasks = set()
+    limits = httpx.Limits(max_connections=ASYNC_HTTP_MAX_CONNECTIONS)
+    async with httpx.AsyncClient(limits=limits) as http:
+        while True:
+            await slots.acquire()
+            try:
+                # 앞 queue 가 우선 (jobs-high → jobs → jobs-low)
+                res = await asyncio.to_thread(Queue.dequeue_any, queues, None if burst else DEQUEUE_TIMEOUT,
+                                              connection=conn)
+            except DequeueTimeout:
+                res = None
+            if res is None:
+                slots.release()
+                if burst:
+                    if not tasks:
+                        break
+                    await asyncio.sleep(0.1)
+                continue
+            rq_job, queue = res
+            t = asyncio.create_task(perform(rq_job, queue, http))
+            tasks.add(t)
+            t.add_done_callback(lambda t: (tasks.discard(t), slots.release()))
+        await asyncio.gather(*tasks)
+
+def main():
+    ap = argparse.ArgumentParser(description="asyncio worker: many jobs concurrently in one process")
+    ap.add_argument("queues", nargs="*", default=[scheduler.LANES[p] for p in ("high", "normal", "low")])
+    ap.add_argument("--concurrency", type=int, default=ASYNC_WORKER_CONCURRENCY)
+    ap.add_argument("--burst", action="store_true", help="exit when the queues are empty")
+    args = ap.parse_args()
+    import preload  # noqa: F401  pipeline import + RAG index 예열 (첫 job 이 비용을 떠안지 않게)
+    asyncio.run(serve(args.queues, args.concurrency, args.burst))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Offline end-to-end benchmark: POST /api/jobs -> RQ -> worker.run_job -> agent.run_pipeline.
+
+Every external dependency is a local stand-in (bench/standins.py):
+  HTTP    threaded local server, header profile + --http-delay-ms
+  SSH/DB  AGENT_DRY_RUN with AGENT_DRY_RUN_DELAY_MS (--tool-delay-ms)
+  LLM     stub OpenAI client answering after --llm-ms (0 = offline rule path)
+  RAG     synthetic markdown corpus of `docs` documents
+
+With a reachable Redis (REDIS_URL) jobs go through the real RQ queues and a
+burst SimpleWorker; without one the submitted job ids are run by worker.run_job
+in submission order. Each scenario runs in its own process and reports jobs/sec,
+p50/p99 per stage (from the `timings` events), DB writes (INSERT/UPDATE/DELETE
+statements and commits) and peak RSS.
+
+    python bench/bench_e2e.py                       # all scenarios
+    python bench/bench_e2e.py --quick               # scaled down (1/10 targets and docs)
+    python bench/bench_e2e.py --json base.json      # save results
+    python bench/bench_e2e.py --baseline base.json  # compare against saved results
+"""
+import argparse, json, os, resource, subprocess, sys, tempfile, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+from standins import serve_http, stub_llm, write_corpus, BENCH_ENV
+
+RULE_CONTROLS = ["U31", "U32", "U33", "U01", "D01"]
+
+# name → (controls, targets, docs). jobs = targets (한 target 당 job 하나), 단 target 1 개면 --repeat 개
+SCENARIOS = {
+    "baseline":     (1, 1, 10),
+    "controls-100": (100, 1, 10),
+    "targets-1000": (1, 1000, 10),
+    "docs-10000":   (1, 1, 10000),
+}
+
+def _controls(n):
+    return (RULE_CONTROLS + [f"C{i:03d}" for i in range(n)])[:n]
+
+def _pct(xs, p):
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return round(xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))], 2)
+
+def _count_writes(engine):
+    from sqlalchemy import event
+    counts = {"statements": 0, "commits": 0}
+    @event.listens_for(engine, "before_cursor_execute")
+    def _stmt(conn, cursor, statement, params, context, executemany):
+        if statement.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+            counts["statements"] += 1
+    @event.listens_for(engine, "commit")
+    def _commit(conn):
+        counts["commits"] += 1
+    return counts
+
+class _InlineRQJob:
+    """inline 모드에서 scheduler.submit 대신 돌려주는 RQ job 흉내 (create_job 은 .id 만 씀)."""
+    def __init__(self, jid):
+        self.id = f"inline-{jid}"
+
+def _run_jobs(submitted, use_rq):
+    import worker
+    if use_rq:
+        from rq import SimpleWorker
+        import scheduler
+        queues = [scheduler.queue(p) for p in ("high", "normal", "low")]
+        SimpleWorker(queues, connection=queues[0].connection).work(burst=True)
+    else:
+        for jid in submitted:
+            worker.run_job(jid)
+
+def child(a):
+    d = tempfile.mkdtemp()
+    os.chdir(d)
+    os.environ.update({**BENCH_ENV, "DATABASE_URL": "sqlite:///" + os.path.join(d, "bench.db"),
+                       "RAG_DOC_DIR": os.path.join(d, "docs"), "RAG_INDEX_DIR": os.path.join(d, ".rag_index"),
+                       "AGENT_DRY_RUN_DELAY_MS": str(a.tool_delay_ms)})
+    n_controls, n_targets, n_docs = a.controls, a.targets, a.docs
+    write_corpus(os.path.join(d, "docs"), n_docs)
+    base = serve_http(a.http_delay_ms, a.profile)
+    import app as appmod
+    import scheduler
+    from bus import get_redis
+    from models import db, Event, Job, upgrade_schema
+    if a.llm_ms:
+        stub_llm(a.llm_ms)
+    try:
+        use_rq = not a.inline and get_redis().ping()
+    except Exception:
+        use_rq = False
+    submitted = []
+    if not use_rq:
+        scheduler.submit = lambda job, func="worker.run_job": submitted.append(job.id) or _InlineRQJob(job.id)
+    controls = _controls(n_controls)
+    targets = [f"{base}t{i}" for i in range(n_targets)] if n_targets > 1 else [base] * a.repeat
+    with appmod.app.app_context():
+        upgrade_schema()
+        writes = _count_writes(db.engine)
+        client = appmod.app.test_client()
+        rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        t0 = time.perf_counter()
+        for t in targets:
+            r = client.post("/api/jobs", json={"target": t, "controls": controls, "submitter": "bench"})
+            assert r.status_code == 200, r.data
+        _run_jobs(submitted, use_rq)
+        elapsed = time.perf_counter() - t0
+        stages = {}
+        for e in Event.query.filter(Event.message == "timings").yield_per(500):
+            for k, v in (e.payload_json.get("stages_ms") or {}).items():
+                stages.setdefault(k, []).append(v)
+        done = Job.query.filter_by(status="DONE").count()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({
+        "jobs": len(targets), "done": done, "mode": "rq" if use_rq else "inline",
+        "elapsed_s": round(elapsed, 2), "jobs_per_s": round(len(targets) / elapsed, 2),
+        "stages": {k: {"p50": _pct(v, 50), "p99": _pct(v, 99)} for k, v in stages.items()},
+        "db_writes": writes["statements"], "db_commits": writes["commits"],
+        "peak_rss_mb": round(rss, 1), "rss_before_jobs_mb": round(rss0 / 1024, 1)}))
+
+def _row(name, r, base=None):
+    st = r["stages"]
+    cols = [f"{name:<14}", f"{r['done']:>5}/{r['jobs']:<5}", f"{r['jobs_per_s']:>8}"]
+    for s in ("RAG", "PLAN", "EXECUTE", "ANALYZE"):
+        v = st.get(s) or {}
+        cols.append(f"{v.get('p50', '-')!s:>8} {v.get('p99', '-')!s:>8}")
+    cols += [f"{r['db_writes']:>7}", f"{r['db_commits']:>7}", f"{r['peak_rss_mb']:>7}"]
+    line = " ".join(cols)
+    if base:
+        line += f"   jobs/s {r['jobs_per_s'] / base['jobs_per_s'] - 1:+.0%}  rss {r['peak_rss_mb'] - base['peak_rss_mb']:+.1f}MB"
+    return line
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    ap.add_argument("--quick", action="store_true", help="scale targets/docs down by 10x")
+    ap.add_argument("--repeat", type=int, default=20, help="jobs per single-target scenario")
+    ap.add_argument("--http-delay-ms", type=float, default=20)
+    ap.add_argument("--tool-delay-ms", type=float, default=20, help="dry-run SSH/DB latency")
+    ap.add_argument("--llm-ms", type=float, default=100, help="stub LLM latency (0 = offline rules only)")
+    ap.add_argument("--profile", default="mixed", help="HTTP header profile: none|hsts|secure|mixed")
+    ap.add_argument("--inline", action="store_true", help="skip RQ even if Redis is reachable")
+    ap.add_argument("--json", help="write results to this file")
+    ap.add_argument("--baseline", help="compare against a previous --json file")
+    # child 전용
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--controls", type=int, help=argparse.SUPPRESS)
+    ap.add_argument("--targets", type=int, help=argparse.SUPPRESS)
+    ap.add_argument("--docs", type=int, help=argparse.SUPPRESS)
+    a = ap.parse_args()
+    if a.child:
+        return child(a)
+
+    base = json.load(open(a.baseline)) if a.baseline else {}
+    print(f"http={a.http_delay_ms}ms tool={a.tool_delay_ms}ms llm={a.llm_ms}ms profile={a.profile}"
+          f"{' (quick)' if a.quick else ''}")
+    print(f"{'scenario':<14} {'done/jobs':>11} {'jobs/s':>8} " +
+          " ".join(f"{s + ' p50':>8} {'p99':>8}" for s in ("RAG", "PLAN", "EXEC", "ANLZ")) +
+          f" {'writes':>7} {'commits':>7} {'rss_mb':>7}")
+    results = {}
+    for name in a.scenarios:
+        n_controls, n_targets, n_docs = SCENARIOS[name]
+        if a.quick:
+            n_targets, n_docs = max(1, n_targets // 10), max(10, n_docs // 10)
+        argv = [sys.executable, os.path.abspath(__file__), "--child", "--controls", str(n_controls),
+                "--targets", str(n_targets), "--docs", str(n_docs), "--repeat", str(a.repeat),
+                "--http-delay-ms", str(a.http_delay_ms), "--tool-delay-ms", str(a.tool_delay_ms),
+                "--llm-ms", str(a.llm_ms), "--profile", a.profile] + (["--inline"] if a.inline else [])
+        out = subprocess.run(argv, capture_output=True, text=True)
+        if out.returncode:
+            print(f"{name:<14} failed:\n{out.stderr[-3000:]}")
+            continue
+        results[name] = r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(_row(name, r, base.get(name)))
+    if a.json:
+        with open(a.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Keyset pagination benchmark.
+
+Seeds a throwaway SQLite DB with N events spread over many jobs and times the
+paginated endpoints (first page, a deep page, the last page) through the Flask
+test client. With the (job_id, id) / (created_at, id) indexes the per-page
+latency should stay flat as N grows.
+
+    python bench/bench_pagination.py --sizes 10000 100000 1000000
+"""
+import argparse, os, sys, tempfile, time, statistics
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+def seed(db, Job, Event, n_events, n_jobs):
+    t0 = datetime(2024, 1, 1)
+    db.session.execute(Job.__table__.insert(), [
+        {"id": j + 1, "target": f"https://host{j}", "controls": ["U31"], "ike_patches": [], "depth": "safe",
+         "status": "DONE", "progress": 100, "created_at": t0 + timedelta(seconds=j), "updated_at": t0}
+        for j in range(n_jobs)])
+    batch = []
+    for i in range(n_events):
+        batch.append({"job_id": i % n_jobs + 1, "ts": t0, "level": "info", "message": "tool_done", "payload_json": {}})
+        if len(batch) == 50000:
+            db.session.execute(Event.__table__.insert(), batch); batch = []
+    if batch:
+        db.session.execute(Event.__table__.insert(), batch)
+    db.session.commit()
+
+def timed(client, url, repeat):
+    samples, resp = [], None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        resp = client.get(url)
+        samples.append((time.perf_counter() - t) * 1000)
+        assert resp.status_code == 200, resp.data
+    return statistics.median(samples), resp
+
+def run(n_events, n_jobs, repeat):
+    d = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(d, "bench.db")
+    for m in ("app", "config", "models"):
+        sys.modules.pop(m, None)
+    import app as appmod
+    from models import db, Job, Event, upgrade_schema
+    with appmod.app.app_context():
+        upgrade_schema()
+        seed(db, Job, Event, n_events, n_jobs)
+        c = appmod.app.test_client()
+        jid = n_jobs // 2
+        first, _ = timed(c, f"/api/jobs/{jid}/events?limit=100", repeat)
+        deep_after = Event.query.filter_by(job_id=jid).order_by(Event.id).offset(n_events // n_jobs // 2).first().id
+        deep, _ = timed(c, f"/api/jobs/{jid}/events?limit=100&after={deep_after}", repeat)
+        jobs_first, r = timed(c, "/api/jobs?limit=50", repeat)
+        jobs_next, _ = timed(c, f"/api/jobs?limit=50&after={r.headers['X-Next-After']}", repeat)
+        db.session.remove()
+        db.engine.dispose()
+    return first, deep, jobs_first, jobs_next
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--jobs", type=int, default=1000)
+    ap.add_argument("--repeat", type=int, default=20)
+    a = ap.parse_args()
+    print(f"{'events':>10} {'events p1 ms':>13} {'events deep ms':>15} {'jobs p1 ms':>11} {'jobs p2 ms':>11}")
+    for n in a.sizes:
+        r = run(n, a.jobs, a.repeat)
+        print(f"{n:>10} " + " ".join(f"{x:>{w}.2f}" for x, w in zip(r, (13, 15, 11, 11))))
+
+if __name__ == "__main__":
+    main()
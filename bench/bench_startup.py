@@ -0,0 +1,150 @@
+"""
+Cold-start and per-process memory benchmark.
+
+  web      import app + first GET / (dashboard) in a fresh interpreter
+  fork     rq-style work-horse: the parent has only rq loaded and forks a child per
+           job; the child imports the pipeline, loads the RAG index and runs the job
+  preload  same, but the parent imported preload.py first (`rq worker -c preload`),
+           so each child starts with the pipeline and the RAG index already in memory
+
+Per mode it reports time to ready (web) or fork → job done (workers), peak RSS and,
+for forked children, USS (private memory, what each extra worker process really costs)
+and PSS, plus the heavy libraries the process ended up importing.
+
+    python bench/bench_startup.py --jobs 5 --docs 2000
+"""
+import argparse, json, os, resource, subprocess, sys, tempfile, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+HEAVY = ("openai", "httpx", "requests", "paramiko", "pymysql", "numpy", "scipy", "reportlab", "rq")
+
+def _mem():
+    """(peak RSS, USS, PSS) MB. USS/PSS 는 /proc/self/smaps_rollup 이 있을 때만."""
+    out = {"rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1), "uss_mb": None, "pss_mb": None}
+    try:
+        kb = {}
+        for line in open("/proc/self/smaps_rollup"):
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                kb[parts[0].rstrip(":")] = int(parts[1])
+        out["uss_mb"] = round((kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0)) / 1024, 1)
+        out["pss_mb"] = round(kb.get("Pss", 0) / 1024, 1)
+    except OSError:
+        pass
+    return out
+
+def _heavy():
+    return [m for m in HEAVY if m in sys.modules]
+
+def setup(d, n_jobs, n_docs):
+    """임시 DB + corpus + HTTP stand-in 준비, QUEUED job n_jobs 개. 반환: job id 목록."""
+    from standins import serve_http, write_corpus, BENCH_ENV
+    os.chdir(d)
+    os.environ.update({**BENCH_ENV, "DATABASE_URL": "sqlite:///" + os.path.join(d, "bench.db"),
+                       "RAG_DOC_DIR": os.path.join(d, "docs"), "RAG_INDEX_DIR": os.path.join(d, ".rag_index")})
+    if not os.path.isdir(os.path.join(d, "docs")):
+        write_corpus(os.path.join(d, "docs"), n_docs)
+    return serve_http(0)
+
+def child_web(a):
+    setup(a.dir, 0, a.docs)
+    t0 = time.perf_counter()
+    import app as appmod
+    t_import = time.perf_counter() - t0
+    with appmod.app.app_context():
+        from models import upgrade_schema
+        upgrade_schema()
+    r = appmod.app.test_client().get("/")
+    assert r.status_code == 200, r.status_code
+    return {"import_ms": round(t_import * 1000, 1), "ready_ms": round((time.perf_counter() - t0) * 1000, 1),
+            **_mem(), "heavy": _heavy()}
+
+def child_worker(a):
+    url = setup(a.dir, a.jobs, a.docs)
+    import rq  # noqa: F401  (rq worker 부모가 가진 것)
+    warm = {}
+    if a.mode == "preload":
+        t0 = time.perf_counter()
+        import preload
+        warm = {"preload_ms": round((time.perf_counter() - t0) * 1000, 1), **preload.WARM}
+    parent = {**_mem(), "heavy": _heavy()}
+    runs = []
+    for i in range(a.jobs):
+        r, w = os.pipe()
+        t0 = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:  # work-horse
+            os.close(r)
+            try:
+                import worker
+                from app import app
+                from models import db, Job
+                with app.app_context():
+                    job = Job.from_request({"target": url, "controls": ["U31", "U32"]})
+                    db.session.add(job); db.session.commit()
+                    worker.run_job(job.id)
+                    status = Job.query.get(job.id).status
+                res = {"ms": round((time.perf_counter() - t0) * 1000, 1), "status": status, **_mem(), "heavy": _heavy()}
+            except Exception as e:
+                res = {"error": repr(e)}
+            os.write(w, json.dumps(res).encode()); os._exit(0)
+        os.close(w)
+        data = b""
+        while True:
+            chunk = os.read(r, 65536)
+            if not chunk:
+                break
+            data += chunk
+        os.close(r); os.waitpid(pid, 0)
+        runs.append(json.loads(data))
+    return {"warm": warm, "parent": parent, "runs": runs}
+
+def _avg(xs):
+    xs = [x for x in xs if x is not None]
+    return round(sum(xs) / len(xs), 1) if xs else None
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--jobs", type=int, default=5, help="forked jobs per worker mode")
+    ap.add_argument("--docs", type=int, default=2000, help="RAG corpus size")
+    ap.add_argument("--json", help="write raw results to this file")
+    ap.add_argument("--mode", choices=["web", "fork", "preload"], help=argparse.SUPPRESS)
+    ap.add_argument("--dir", help=argparse.SUPPRESS)
+    a = ap.parse_args()
+    if a.mode:
+        res = child_web(a) if a.mode == "web" else child_worker(a)
+        print(json.dumps(res)); return
+
+    d = tempfile.mkdtemp()
+    # 색인 파일을 미리 만들어 두어 모든 mode 가 "디스크에 index 가 있는" 같은 조건에서 시작
+    subprocess.run([sys.executable, "-c", "import sys; sys.path[:0] = [%r, %r]; import bench_startup as b; b.setup(%r, 0, %d); "
+                    "import rag; rag.get_index()" % (ROOT, HERE, d, a.docs)], check=True)
+    results = {}
+    print(f"jobs={a.jobs} docs={a.docs}")
+    for mode in ("web", "fork", "preload"):
+        out = subprocess.run([sys.executable, "-W", "ignore", os.path.abspath(__file__), "--mode", mode, "--dir", d,
+                              "--jobs", str(a.jobs), "--docs", str(a.docs)], capture_output=True, text=True)
+        if out.returncode:
+            print(mode, "failed:", out.stderr[-2000:]); continue
+        results[mode] = r = json.loads(out.stdout.strip().splitlines()[-1])
+        if mode == "web":
+            print(f"{'web':>8}  import {r['import_ms']} ms, ready (first GET /) {r['ready_ms']} ms, "
+                  f"rss {r['rss_mb']} MB, uss {r['uss_mb']} MB, heavy: {', '.join(r['heavy']) or '-'}")
+            continue
+        runs = [x for x in r["runs"] if "error" not in x]
+        errors = [x["error"] for x in r["runs"] if "error" in x]
+        warm = f", preload {r['warm'].get('preload_ms')} ms" if r["warm"] else ""
+        print(f"{mode:>8}  parent rss {r['parent']['rss_mb']} MB{warm}; per job: fork→done "
+              f"first {runs[0]['ms'] if runs else '-'} ms, avg {_avg([x['ms'] for x in runs])} ms, "
+              f"child uss {_avg([x['uss_mb'] for x in runs])} MB, pss {_avg([x['pss_mb'] for x in runs])} MB, "
+              f"rss {_avg([x['rss_mb'] for x in runs])} MB" + (f"  errors: {errors[:2]}" if errors else ""))
+    if a.json:
+        with open(a.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
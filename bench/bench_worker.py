@@ -0,0 +1,92 @@
+"""
+Sync RQ worker vs asyncio worker benchmark.
+
+Runs N jobs against a local HTTP server that answers after --http-delay-ms,
+optionally with a stub LLM that answers after --llm-ms (PLAN + ANALYZE calls,
+so the LLM wait shows up like it does with USE_GPT=true). Each mode runs in
+its own process so peak RSS is not shared:
+
+  sync   worker.run_job, one job at a time (what one `rq worker` process does)
+  async  aworker.run_job_async, --concurrency jobs in one event loop
+
+Reports jobs/sec and peak RSS per concurrently running job. A sync worker
+needs one process per concurrent job, so its RSS per job is the whole process.
+
+    python bench/bench_worker.py --jobs 40 --concurrency 16 --http-delay-ms 200 --llm-ms 300
+"""
+import argparse, asyncio, json, os, resource, subprocess, sys, tempfile, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+from standins import serve_http, stub_llm, BENCH_ENV
+
+def child(args):
+    d = tempfile.mkdtemp()
+    os.chdir(d)
+    os.environ.update({**BENCH_ENV, "DATABASE_URL": "sqlite:///" + os.path.join(d, "bench.db"),
+                       "RAG_DOC_DIR": os.path.join(d, "docs")})
+    os.makedirs("docs")
+    url = serve_http(args.http_delay_ms)
+    import app as appmod
+    from models import db, Job, upgrade_schema
+    if args.llm_ms:
+        stub_llm(args.llm_ms)
+    # U31 은 규칙으로, X1 은 LLM 으로 판정 (llm-ms 가 있을 때)
+    controls = ["U31", "X1"]
+    with appmod.app.app_context():
+        upgrade_schema()
+        db.session.execute(db.insert(Job), [{"target": url, "controls": controls, "ike_patches": [], "depth": "safe",
+                                             "options": {}, "priority": "normal", "status": "QUEUED", "progress": 0}
+                                            for _ in range(args.jobs)])
+        db.session.commit()
+        ids = [j for (j,) in db.session.query(Job.id).order_by(Job.id)]
+        rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        t0 = time.perf_counter()
+        if args.mode == "sync":
+            import worker
+            for jid in ids:
+                worker.run_job(jid)
+            conc = 1
+        else:
+            import aworker, httpx
+            conc = args.concurrency
+            async def go():
+                sem = asyncio.Semaphore(conc)
+                async with httpx.AsyncClient() as http:
+                    async def one(jid):
+                        async with sem:
+                            await aworker.run_job_async(jid, http)
+                    await asyncio.gather(*(one(j) for j in ids))
+            asyncio.run(go())
+        elapsed = time.perf_counter() - t0
+        done = Job.query.filter_by(status="DONE").count()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"mode": args.mode, "jobs": args.jobs, "done": done, "concurrency": conc,
+                      "elapsed_s": round(elapsed, 2), "jobs_per_s": round(args.jobs / elapsed, 2),
+                      "rss_mb": round(rss, 1), "rss_growth_mb": round(rss - rss0 / 1024, 1),
+                      "rss_mb_per_concurrent_job": round(rss / conc, 1)}))
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--jobs", type=int, default=40)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--http-delay-ms", type=int, default=200)
+    ap.add_argument("--llm-ms", type=int, default=0, help="stub LLM latency per call (0 = offline rules only)")
+    ap.add_argument("--mode", choices=["sync", "async"], help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.mode:
+        return child(args)
+    print(f"jobs={args.jobs} concurrency={args.concurrency} http_delay={args.http_delay_ms}ms llm={args.llm_ms}ms")
+    print(f"{'mode':>6} {'done':>5} {'elapsed_s':>10} {'jobs/s':>8} {'rss_mb':>8} {'mb/job':>8}")
+    for mode in ("sync", "async"):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--mode", mode] + sys.argv[1:],
+                             capture_output=True, text=True)
+        if out.returncode:
+            print(mode, "failed:", out.stderr[-2000:]); continue
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{mode:>6} {r['done']:>5} {r['elapsed_s']:>10} {r['jobs_per_s']:>8} {r['rss_mb']:>8} "
+              f"{r['rss_mb_per_concurrent_job']:>8}")
+
+if __name__ == "__main__":
+    main()
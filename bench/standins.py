@@ -0,0 +1,92 @@
+"""
+Local stand-ins for the external dependencies, shared by the benchmarks.
+
+- serve_http: threaded HTTP server with a header profile and per-request latency
+- stub_llm: replaces the OpenAI clients (sync + async) with fixed answers after a delay
+- write_corpus: synthetic markdown corpus for the RAG index
+- SSH/DB: use AGENT_DRY_RUN=true with AGENT_DRY_RUN_DELAY_MS (see config.py)
+"""
+import asyncio, json, os, random, threading, time, zlib
+from types import SimpleNamespace as NS
+
+# 결과를 흐리는 기능은 끄고(캐시, 증분 재검사), 모든 job 이 같은 stand-in host 를 치므로 host 속도 제한은 사실상 해제
+BENCH_ENV = {"LLM_CACHE": "off", "TOOL_CACHE": "off", "INCREMENTAL_RESCAN": "false", "AGENT_DRY_RUN": "true",
+             "SCHED_HOST_RATE": "1e9/1e9", "SCHED_TARGET_MAX_ACTIVE": "1000000",
+             "SCHED_SUBMITTER_MAX_ACTIVE": "0"}
+
+HEADER_PROFILES = {
+    "none": {},
+    "hsts": {"Strict-Transport-Security": "max-age=31536000"},
+    "secure": {"Strict-Transport-Security": "max-age=31536000",
+               "Content-Security-Policy": "default-src 'self'; frame-ancestors 'none'",
+               "X-Frame-Options": "DENY"},
+}
+
+def serve_http(delay_ms: float = 0, profile: str = "hsts", body_bytes: int = 2):
+    """
+    profile: HEADER_PROFILES 이름 또는 "mixed" (path hash 로 profile 을 골라 target 마다 결과가 다름).
+    반환: base URL (http://127.0.0.1:<port>/)
+    """
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    names = sorted(HEADER_PROFILES)
+    body = b"x" * body_bytes
+
+    class H(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay_ms / 1000)
+            name = names[zlib.crc32(self.path.encode()) % len(names)] if profile == "mixed" else profile
+            self.send_response(200)
+            for k, v in HEADER_PROFILES[name].items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers(); self.wfile.write(body)
+        def log_message(self, *a): pass
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), H)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{srv.server_port}/"
+
+def _llm_response(kw):
+    import rules
+    payload = json.loads(kw["messages"][-1]["content"])
+    if payload["task"] == "plan":
+        steps = rules.collect_steps(list(payload["controls"]), payload["target"])
+        steps.append({"tool": "http_check", "args": {"url": payload["target"]}})
+        calls = [NS(function=NS(name=s["tool"], arguments=json.dumps(s["args"]))) for s in steps]
+        return NS(choices=[NS(message=NS(tool_calls=calls))], usage=None)
+    items = [{"control_id": c, "status": "unknown", "evidence_refs": [], "recommendation": "", "repro": []}
+             for c in payload["controls"]]
+    return NS(choices=[NS(message=NS(parsed={"items": items, "summary": {}}))], usage=None)
+
+def stub_llm(latency_ms: float):
+    """
+    OpenAI client 대신 latency_ms 뒤에 답하는 stub (USE_GPT=true 경로를 그대로 탐).
+    PLAN: 규칙이 필요로 하는 수집 step + target http_check, DECIDE: 넘어온 control 전부 unknown.
+    """
+    import llm_client
+    def sync_call(**kw):
+        time.sleep(latency_ms / 1000); return _llm_response(kw)
+    async def async_call(**kw):
+        await asyncio.sleep(latency_ms / 1000); return _llm_response(kw)
+    sync = NS(chat=NS(completions=NS(create=sync_call, parse=sync_call)))
+    aio = NS(chat=NS(completions=NS(create=async_call, parse=async_call)))
+    llm_client.USE_GPT = True
+    llm_client._get_client = lambda: sync
+    llm_client._get_async_client = lambda: aio
+
+_WORDS = ("header policy server config audit password account root login ssh tls cipher cookie session "
+          "frame ancestors script source nonce hash strict transport security content database grant").split()
+
+def write_corpus(doc_dir: str, n_docs: int, words_per_doc: int = 300, seed: int = 7):
+    """control id 와 보안 용어가 섞인 synthetic markdown 문서 n_docs 개."""
+    rnd = random.Random(seed)
+    os.makedirs(doc_dir, exist_ok=True)
+    ids = ["U31", "U32", "U33", "U01", "D01"]
+    for i in range(n_docs):
+        cid = ids[i % len(ids)]
+        parts = [f"# {cid} guide {i}\n"]
+        for s in range(0, words_per_doc, 60):
+            parts.append(f"\n## section {s // 60}\n" + " ".join(rnd.choice(_WORDS) for _ in range(60)) + "\n")
+        with open(os.path.join(doc_dir, f"doc_{i:05d}.md"), "w") as f:
+            f.write("".join(parts))
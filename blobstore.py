@@ -0,0 +1,105 @@
+# blobstore.py
+# 내용 주소(content-addressed) blob 저장소: BLOB_DIR/<sha[:2]>/<sha[2:4]>/<sha>.gz
+# 같은 내용은 한 번만 저장되고, Artifact 는 "blob:<sha256>" ref 로만 가리킨다.
+import gzip, hashlib, json, os, shutil, time, uuid
+from config import BLOB_DIR, BLOB_GC_GRACE_SEC
+
+PREFIX = "blob:"
+
+def ref(sha: str) -> str:
+    return PREFIX + sha
+
+def sha_of(r: str) -> str:
+    return r[len(PREFIX):] if r and r.startswith(PREFIX) else ""
+
+def path_of(sha: str) -> str:
+    return os.path.join(BLOB_DIR, sha[:2], sha[2:4], sha + ".gz")
+
+def exists(sha: str) -> bool:
+    return os.path.exists(path_of(sha))
+
+def _tmp_path() -> str:
+    d = os.path.join(BLOB_DIR, "tmp")
+    os.makedirs(d, exist_ok=True)
+    return os.path.join(d, uuid.uuid4().hex)
+
+def _commit(tmp: str, sha: str):
+    dst = path_of(sha)
+    if os.path.exists(dst):
+        os.remove(tmp)
+        os.utime(dst)  # GC 유예 기간 갱신
+        return
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    os.replace(tmp, dst)
+
+def put_bytes(data: bytes) -> str:
+    sha = hashlib.sha256(data).hexdigest()
+    if exists(sha):
+        os.utime(path_of(sha))
+        return sha
+    tmp = _tmp_path()
+    with gzip.open(tmp, "wb", compresslevel=6) as f:
+        f.write(data)
+    _commit(tmp, sha)
+    return sha
+
+def dumps(obj) -> bytes:
+    """blob 용 정규화 JSON (같은 값 → 같은 bytes → 같은 sha256)."""
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode()
+
+def put_json(obj) -> str:
+    return put_bytes(dumps(obj))
+
+def put_file(src: str, sha: str) -> str:
+    """이미 sha256 을 아는 평문 파일을 압축해 넣고 원본은 지움."""
+    if exists(sha):
+        os.remove(src); os.utime(path_of(sha))
+        return sha
+    tmp = _tmp_path()
+    with open(src, "rb") as fi, gzip.open(tmp, "wb", compresslevel=6) as fo:
+        shutil.copyfileobj(fi, fo, 1024 * 1024)
+    os.remove(src)
+    _commit(tmp, sha)
+    return sha
+
+def open_blob(sha: str):
+    return gzip.open(path_of(sha), "rb")
+
+def get_bytes(sha: str) -> bytes:
+    with open_blob(sha) as f:
+        return f.read()
+
+def get_json(sha: str):
+    return json.loads(get_bytes(sha))
+
+def iter_blobs():
+    for d, _, names in os.walk(BLOB_DIR):
+        if os.path.basename(d) == "tmp":
+            continue
+        for n in names:
+            if n.endswith(".gz"):
+                yield n[:-3], os.path.join(d, n)
+
+def gc(referenced, grace_sec: float = BLOB_GC_GRACE_SEC, dry_run: bool = False):
+    """
+    referenced 에 없는 blob 삭제. 진행 중인 job / 도구 캐시가 막 쓴 blob 을 지우지 않도록
+    grace_sec 보다 최근에 쓰이거나 재사용된 blob 은 남긴다.
+    """
+    now = time.time()
+    removed = kept = freed = 0
+    for sha, p in iter_blobs():
+        if sha in referenced:
+            kept += 1
+            continue
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        if now - st.st_mtime < grace_sec:
+            kept += 1
+            continue
+        if not dry_run:
+            try: os.remove(p)
+            except OSError: continue
+        removed += 1; freed += st.st_size
+    return {"removed": removed, "kept": kept, "freed_bytes": freed}
@@ -0,0 +1,38 @@
+# bus.py
+# Redis pub/sub 기반 job 이벤트 push. worker 는 flush 된 이벤트를 publish, SSE 는 subscribe.
+import json
+from redis import Redis
+from config import REDIS_URL
+
+_redis = None
+
+def get_redis() -> Redis:
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(REDIS_URL, socket_connect_timeout=2)
+    return _redis
+
+def job_channel(job_id) -> str:
+    return f"secagent:job:{job_id}:events"
+
+def publish_events(events):
+    """events: Event.to_json() dict 리스트. Redis 장애는 job 진행을 막지 않도록 무시 (DB 가 원본)."""
+    if not events:
+        return
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for ev in events:
+            pipe.publish(job_channel(ev["job_id"]), json.dumps(ev, ensure_ascii=False))
+        pipe.execute()
+    except Exception:
+        pass
+
+def fleet_channel(fleet_id) -> str:
+    return f"secagent:fleet:{fleet_id}:summary"
+
+def publish_fleet(summary: dict):
+    """fleet 집계 snapshot(Fleet.to_dict) publish. 실패는 무시 (DB 가 원본)."""
+    try:
+        get_redis().publish(fleet_channel(summary["id"]), json.dumps(summary, ensure_ascii=False))
+    except Exception:
+        pass
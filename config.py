@@ -6,17 +6,105 @@ from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv())
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+SSE_HEARTBEAT_SEC = float(os.getenv("SSE_HEARTBEAT_SEC", "15"))
 SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///secagent.db")
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+# SQLite: 여러 worker 가 동시에 쓰고 web 이 읽으므로 WAL + busy timeout (다른 DB 에는 적용 안 됨)
+SQLITE_WAL = os.getenv("SQLITE_WAL", "true").lower() == "true"
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # WAL 에서는 NORMAL 이면 충분
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# event 보존: 끝난 지 EVENT_RETENTION_DAYS 가 지난 job 의 event 는 rollup + 압축 archive 로 옮김
+EVENT_RETENTION_DAYS = float(os.getenv("EVENT_RETENTION_DAYS", "30"))
+EVENT_RETENTION_BATCH = int(os.getenv("EVENT_RETENTION_BATCH", "50"))  # transaction 하나에 archive 할 job 수
+EVENT_RETENTION_VACUUM_PAGES = int(os.getenv("EVENT_RETENTION_VACUUM_PAGES", "2000"))  # 한 번에 돌려줄 page 수
+EVENT_RETENTION_INTERVAL_SEC = float(os.getenv("EVENT_RETENTION_INTERVAL_SEC", "0"))  # >0 이면 주기 실행
 
 AGENT_DRY_RUN = os.getenv("AGENT_DRY_RUN", "true").lower() == "true"
+AGENT_DRY_RUN_DELAY_MS = float(os.getenv("AGENT_DRY_RUN_DELAY_MS", "0"))  # dry-run SSH/DB 응답 지연 (benchmark 용)
 DEFAULT_TARGET = os.getenv("DEMO_TARGET", "https://example.com")
 
+# 도구 출력 캡처: 메모리에는 head/tail 만, 전체는 ARTIFACT_DIR 파일로
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "artifacts")
+CAPTURE_HEAD_BYTES = int(os.getenv("CAPTURE_HEAD_BYTES", "8192"))
+CAPTURE_TAIL_BYTES = int(os.getenv("CAPTURE_TAIL_BYTES", "8192"))
+CAPTURE_CHUNK = int(os.getenv("CAPTURE_CHUNK", "65536"))
+# 요청마다 값이 바뀌는 HTTP 응답 header: 증거 sha256 계산에서만 빼서 같은 응답이 같은 증거가 되게 함
+# (result.headers 에는 그대로 남음. Set-Cookie 는 빼지 않고 이름 + 속성만 hash)
+HTTP_VOLATILE_HEADERS = {h.strip().lower() for h in os.getenv(
+    "HTTP_VOLATILE_HEADERS", "date,expires,age,last-modified,x-request-id,x-amzn-trace-id,"
+    "x-amz-request-id,x-amz-id-2,cf-ray,server-timing,x-runtime,x-served-by,x-cache,x-cache-hits,x-timer,"
+    "request-id,traceparent,x-correlation-id,nel,report-to").split(",") if h.strip()}
+# 내용 주소 blob 저장소 (artifact 결과/출력 본문, gzip)
+BLOB_DIR = os.getenv("BLOB_DIR", os.path.join(ARTIFACT_DIR, "blobs"))
+BLOB_GC_GRACE_SEC = float(os.getenv("BLOB_GC_GRACE_SEC", str(24 * 3600)))
+
 SSH_HOST = os.getenv("SSH_HOST", "localhost")
 SSH_USER = os.getenv("SSH_USER", "ubuntu")
 SSH_KEY  = os.getenv("SSH_KEY")
+SSH_POOL_MAX_SESSIONS = int(os.getenv("SSH_POOL_MAX_SESSIONS", "8"))  # transport 당 동시 channel 수
+SSH_POOL_IDLE_SEC = float(os.getenv("SSH_POOL_IDLE_SEC", "300"))
+SSH_HEALTH_SEC = float(os.getenv("SSH_HEALTH_SEC", "30"))
 
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_USER = os.getenv("DB_USER", "readonly")
 DB_PASS = os.getenv("DB_PASS", "")
 DB_PORT = int(os.getenv("DB_PORT", "3306"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "4"))
+DB_POOL_IDLE_SEC = float(os.getenv("DB_POOL_IDLE_SEC", "120"))
+DB_MAX_ROWS = int(os.getenv("DB_MAX_ROWS", "1000"))            # artifact 에 남길 최대 행 수
+DB_MAX_BYTES = int(os.getenv("DB_MAX_BYTES", str(1024 * 1024)))  # artifact 에 남길 최대 바이트
+DB_SCAN_MAX_ROWS = int(os.getenv("DB_SCAN_MAX_ROWS", "1000000")) # 해시용으로 읽을 최대 행 수
+
+# 도구 결과 캐시 (opt-in): off | disk | redis, 도구별 TTL(초, 0 이면 캐시 안 함)
+TOOL_CACHE = os.getenv("TOOL_CACHE", "off").lower()
+TOOL_CACHE_DIR = os.getenv("TOOL_CACHE_DIR", ".tool_cache")
+TOOL_CACHE_TTLS = {k.strip(): float(v) for k, v in
+                   (kv.split("=") for kv in os.getenv("TOOL_CACHE_TTLS", "http_check=300,ssh_exec=900,mariadb_query=900").split(",") if "=" in kv)}
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "10000"))
+
+# 이벤트 버퍼: 개수/시간 임계치에서 bulk insert, urgent 레벨은 즉시 기록
+EVENT_FLUSH_SIZE = int(os.getenv("EVENT_FLUSH_SIZE", "50"))
+EVENT_FLUSH_MS = int(os.getenv("EVENT_FLUSH_MS", "500"))
+EVENT_URGENT_LEVELS = [x.strip() for x in os.getenv("EVENT_URGENT_LEVELS", "stage,error,done,warn").split(",") if x.strip()]
+
+# EXECUTE 단계 병렬도: 전체 worker 수 + 도구별 동시 실행 상한 ("tool=n,tool=n")
+EXEC_MAX_WORKERS = int(os.getenv("EXEC_MAX_WORKERS", "8"))
+EXEC_TOOL_LIMITS = {k.strip(): int(v) for k, v in
+                    (kv.split("=") for kv in os.getenv("EXEC_TOOL_LIMITS", "http_check=8,ssh_exec=4,mariadb_query=2").split(",") if "=" in kv)}
+
+# ANALYZE: control 별 증거 token 예산, 병렬 판정 호출 수
+ANALYZE_TOKEN_BUDGET = int(os.getenv("ANALYZE_TOKEN_BUDGET", "2000"))
+ANALYZE_CONCURRENCY = int(os.getenv("ANALYZE_CONCURRENCY", "4"))
+ANALYZE_GROUP_MAX = int(os.getenv("ANALYZE_GROUP_MAX", "8"))
+
+# fleet: target 목록/CIDR 을 batch 단위 RQ job 으로 나누고, parallelism 개 lane 으로 depends_on chain 실행
+FLEET_BATCH_SIZE = int(os.getenv("FLEET_BATCH_SIZE", "25"))
+FLEET_PARALLELISM = int(os.getenv("FLEET_PARALLELISM", "4"))
+FLEET_JOB_TIMEOUT_SEC = int(os.getenv("FLEET_JOB_TIMEOUT_SEC", "300"))  # batch 의 RQ job_timeout = 이 값 x batch 크기
+FLEET_MAX_TARGETS = int(os.getenv("FLEET_MAX_TARGETS", "4096"))
+FLEET_URL_TEMPLATE = os.getenv("FLEET_URL_TEMPLATE", "https://{host}/")  # scheme 없는 host/IP 를 URL 로
+
+# scheduler: priority lane, submitter 공정성, target 동시성, 호출 속도 ("rate/burst", rate 는 초당 토큰)
+def _rate(v: str):
+    rate, _, burst = v.partition("/")
+    return float(rate), float(burst or rate)
+
+SCHED_HIGH_MAX_CONTROLS = int(os.getenv("SCHED_HIGH_MAX_CONTROLS", "1"))   # 이 수 이하의 control 만 요청한 job 은 high lane
+SCHED_SUBMITTER_MAX_ACTIVE = int(os.getenv("SCHED_SUBMITTER_MAX_ACTIVE", "20"))  # 넘으면 low lane 으로 강등 (0=off)
+SCHED_FAIR_SHARE = os.getenv("SCHED_FAIR_SHARE", "true").lower() == "true"  # lane 안에서 submitter 별 round-robin
+SCHED_TARGET_MAX_ACTIVE = int(os.getenv("SCHED_TARGET_MAX_ACTIVE", "1"))   # host 당 동시 실행 job 수
+SCHED_TARGET_LEASE_SEC = float(os.getenv("SCHED_TARGET_LEASE_SEC", "900")) # worker 가 죽어도 lease 는 만료
+SCHED_REQUEUE_DELAY_SEC = float(os.getenv("SCHED_REQUEUE_DELAY_SEC", "10"))
+SCHED_HOST_RATE = _rate(os.getenv("SCHED_HOST_RATE", "5/10"))
+# 도구별 상한은 (도구, host) 단위이고 기본은 없음 (opt-in, 예: "ssh_exec=5/10,mariadb_query=5/10")
+SCHED_TOOL_RATES = {k.strip(): _rate(v) for k, v in
+                    (kv.split("=") for kv in os.getenv("SCHED_TOOL_RATES", "").split(",") if "=" in kv)}
+
+# async worker (aworker.py): 한 process 에서 동시에 돌릴 job 수, 공유 httpx connection 상한
+ASYNC_WORKER_CONCURRENCY = int(os.getenv("ASYNC_WORKER_CONCURRENCY", "16"))
+ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", "100"))
+ASYNC_WORKER_HEARTBEAT_SEC = float(os.getenv("ASYNC_WORKER_HEARTBEAT_SEC", "30"))  # 실행 중 job 의 started registry TTL 갱신 주기
+
+# 증분 재검사: 같은 target/control 집합의 직전 job 과 control 별 fingerprint 가 같으면 판정 재사용
+INCREMENTAL_RESCAN = os.getenv("INCREMENTAL_RESCAN", "false").lower() == "true"  # opt-in, job options.incremental 로 덮어씀
+INCREMENTAL_LOOKBACK = int(os.getenv("INCREMENTAL_LOOKBACK", "20"))  # 직전 job 을 찾을 때 볼 최근 job 수
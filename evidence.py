@@ -0,0 +1,104 @@
+# evidence.py
+# ANALYZE 전처리: control 별로 판정에 필요한 증거 필드만 남기고 token 예산 안으로 줄임.
+import json, hashlib
+from typing import List, Dict
+from config import ANALYZE_TOKEN_BUDGET
+import rules
+
+# control → 도구별로 남길 필드. headers 는 (소문자) 헤더 이름 목록만 남김.
+RELEVANCE = {
+    "U31": {"http_check": {"fields": ["url", "status"], "headers": ["strict-transport-security"]}},
+    "U32": {"http_check": {"fields": ["url", "status"], "headers": ["content-security-policy"]}},
+    "U33": {"http_check": {"fields": ["url", "status"],
+                           "headers": ["x-frame-options", "content-security-policy"]}},
+}
+
+# 규칙이 없는 control 에 쓰는 기본값: 스칼라 필드 + 잘린 본문
+_DEFAULT_TEXT_CHARS = 2000
+_DEFAULT_ROWS = 50
+_MIN_TEXT_CHARS = 200
+_VOLATILE_KEYS = ("elapsed_ms", "collected_at", "cache_hit")
+
+def estimate_tokens(obj) -> int:
+    """대략적인 token 수 (JSON 문자 수 / 4)."""
+    return len(json.dumps(obj, ensure_ascii=False)) // 4 + 1
+
+def _pick(result: Dict, spec: Dict) -> Dict:
+    out = {k: result[k] for k in spec.get("fields", []) if k in result}
+    if "headers" in spec:
+        want = set(spec["headers"])
+        out["headers"] = {k: v for k, v in (result.get("headers") or {}).items() if k.lower() in want}
+    return out
+
+def _generic(result: Dict, text_chars: int, rows: int) -> Dict:
+    out = {}
+    for k, v in result.items():
+        if k in _VOLATILE_KEYS:
+            continue
+        if isinstance(v, str):
+            out[k] = v if len(v) <= text_chars else v[:text_chars] + f"...[{len(v) - text_chars} chars truncated]"
+        elif isinstance(v, list) and k == "rows":
+            out[k] = v[:rows]
+            if len(v) > rows:
+                out["rows_omitted"] = len(v) - rows
+        elif isinstance(v, dict):
+            out[k] = _generic(v, text_chars, rows)
+        else:
+            out[k] = v
+    return out
+
+def compact_for_control(control_id: str, evidence: List[Dict], budget: int = ANALYZE_TOKEN_BUDGET) -> List[Dict]:
+    """
+    control 하나에 대한 증거만 추림.
+    - RELEVANCE 에 정의된 control: 정의된 도구/필드만
+    - 그 외: 모든 증거의 스칼라 필드 + 잘린 문자열/행, 예산을 넘으면 더 줄이고 그래도 넘으면 뒤쪽 증거를 뺌
+    """
+    spec = RELEVANCE.get(control_id.upper())
+    if spec is not None:
+        return [{"tool": ev["tool"], "sha256": ev["sha256"], "result": _pick(ev["result"], spec[ev["tool"]])}
+                for ev in evidence if ev.get("tool") in spec]
+    text_chars, rows = _DEFAULT_TEXT_CHARS, _DEFAULT_ROWS
+    while True:
+        items = [{"tool": ev["tool"], "sha256": ev["sha256"], "result": _generic(ev["result"], text_chars, rows)}
+                 for ev in evidence]
+        if estimate_tokens(items) <= budget or text_chars <= _MIN_TEXT_CHARS:
+            break
+        text_chars, rows = text_chars // 2, max(1, rows // 2)
+    while len(items) > 1 and estimate_tokens(items) > budget:
+        items.pop()
+    return items
+
+def group_controls(controls: Dict[str, Dict], evidence: List[Dict], budget: int = ANALYZE_TOKEN_BUDGET,
+                   max_group: int = 8) -> List[Dict]:
+    """
+    control 별 압축 증거를 만든 뒤, 압축 결과가 같은 control 끼리 묶음 (한 번의 판정 호출로 처리).
+    반환: [{"controls": {cid: control}, "evidence": [...]}]
+    """
+    groups: List[Dict] = []
+    open_group: Dict[str, Dict] = {}  # 증거 hash -> 아직 max_group 이 안 찬 그룹
+    for cid, c in controls.items():
+        items = compact_for_control(cid, evidence, budget)
+        key = hashlib.sha256(json.dumps(items, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+        g = open_group.get(key)
+        if g is None or len(g["controls"]) >= max_group:
+            g = open_group[key] = {"controls": {}, "evidence": items}
+            groups.append(g)
+        g["controls"][cid] = c
+    return groups
+
+def relevant_evidence(control_id: str, evidence: List[Dict]) -> List[Dict]:
+    """control 판정에 쓰이는 증거: RELEVANCE 또는 규칙의 도구, 둘 다 없으면 전체."""
+    spec = RELEVANCE.get(control_id.upper())
+    tools = set(spec) if spec else ({rules.COMPILED[control_id.upper()].tool} if rules.has_rule(control_id) else None)
+    return [ev for ev in evidence if tools is None or ev.get("tool") in tools]
+
+def control_fingerprint(control_id: str, control: Dict, evidence: List[Dict], salt=None) -> str:
+    """
+    control 정의 + 관련 증거 sha256 + 판정 로직 버전(salt) 의 hash.
+    같으면 이전 판정을 그대로 재사용할 수 있다. RAG 점수처럼 판정과 무관한 값은 제외.
+    """
+    definition = {k: v for k, v in control.items() if k != "rag_support"}
+    definition["rag"] = [r.get("excerpt", "") for r in control.get("rag_support", [])]
+    shas = sorted(ev.get("sha256", "") for ev in relevant_evidence(control_id, evidence))
+    raw = json.dumps([control_id.upper(), definition, salt, shas], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
@@ -0,0 +1,142 @@
+# executor.py
+# EXECUTE 단계용 도구 실행 엔진: 동일 (tool, args) 중복 제거 + bounded 병렬 실행.
+import asyncio, json, threading, weakref
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Callable, Optional
+from mcp_bridge import http_check, ssh_exec, mariadb_query, cached_call, ahttp_check, acached_call
+from config import EXEC_MAX_WORKERS, EXEC_TOOL_LIMITS
+from scheduler import throttle
+from metrics import span
+
+TOOL_FUNCS = {
+    "http_check": lambda a: http_check(a["url"]),
+    "ssh_exec": lambda a: ssh_exec(a["cmd"]),
+    "mariadb_query": lambda a: mariadb_query(a["sql"]),
+}
+
+_limits = {tool: threading.BoundedSemaphore(n) for tool, n in EXEC_TOOL_LIMITS.items()}
+
+def normalize_step(step: Dict) -> Dict:
+    tool = (step.get("tool") or "").strip()
+    args = {k: v.strip() if isinstance(v, str) else v for k, v in (step.get("args") or {}).items()}
+    return {"tool": tool, "args": args, "controls": [step["control"]] if step.get("control") else []}
+
+def _control_label(step: Dict) -> str:
+    """tool_call span 의 control label: 이 호출을 요청한 control 들 (LLM plan 처럼 모르면 "-").
+    여러 control 이 공유하는 호출은 label 값이 너무 길어지지 않게 앞 3개 + 나머지 수."""
+    cids = sorted(set(step.get("controls") or []))
+    return ",".join(cids[:3] + ([f"+{len(cids) - 3}"] if len(cids) > 3 else [])) or "-"
+
+def step_key(step: Dict) -> str:
+    return json.dumps([step["tool"], step["args"]], sort_keys=True, ensure_ascii=False)
+
+def _invoke(step: Dict) -> Dict:
+    fn = TOOL_FUNCS[step["tool"]]
+    throttle(step["tool"], step["args"])  # host/도구별 token bucket
+    sem = _limits.get(step["tool"])
+    if sem is None:
+        return fn(step["args"])
+    with sem:
+        return fn(step["args"])
+
+def _output_bytes(result: Dict) -> int:
+    """수집한 원본 크기: capture 의 *_bytes (본문/stdout/stderr) 또는 DB 의 bytes_kept."""
+    return sum(v for k, v in result.items() if isinstance(v, int) and (k.endswith("_bytes") or k == "bytes_kept"))
+
+def _timed(sp, out: Dict) -> Dict:
+    """span 결과를 tool_call histogram/이벤트용으로 정리. out["timing"] = {"ms", "bytes"}"""
+    sp.outcome = {True: "hit", False: "miss"}.get(out.get("cache", {}).get("hit"), "ok")
+    sp.size = _output_bytes(out.get("result") or {})
+    return out
+
+def _run(step: Dict, force_fresh: bool = False) -> Dict:
+    if step["tool"] not in TOOL_FUNCS:
+        return {"tool": step["tool"], "args": step["args"], "result": {"note":"unknown tool"}, "sha256": ""}
+    # 캐시 hit 이면 도구별 동시성 슬롯도 잡지 않음
+    with span("tool_call", tool=step["tool"], control=_control_label(step)) as sp:
+        out = _timed(sp, cached_call(step["tool"], step["args"], lambda: _invoke(step), force_fresh))
+    out["timing"] = {"ms": sp.ms, "bytes": sp.size}
+    return out
+
+def _dedupe(steps: List[Dict]):
+    """반환: (step 별 key, key → 대표 step, key → 요청한 step 수)"""
+    norm = [normalize_step(s) for s in steps]
+    keys = [step_key(s) for s in norm]
+    unique: Dict[str, Dict] = {}
+    for k, s in zip(keys, norm):
+        if k in unique:
+            unique[k]["controls"] += s["controls"]  # 중복 step 은 한 번만 실행, 요청한 control 은 모두 label 로
+        else:
+            unique[k] = s
+    return keys, unique, {k: keys.count(k) for k in unique}
+
+def execute_plan(steps: List[Dict],
+                 on_call: Optional[Callable[[Dict, int], None]] = None,
+                 on_done: Optional[Callable[[Dict, int], None]] = None,
+                 force_fresh: bool = False) -> List[Dict]:
+    """
+    plan step 들을 정규화/중복 제거 후 병렬 실행.
+    force_fresh=True 면 도구 결과 캐시를 건너뛰고 새로 수집(결과는 캐시에 다시 저장).
+    on_call(step, n_requesters) / on_done(out, n_requesters) 는 호출 스레드에서 불림 (DB 로깅용).
+    반환: 입력 steps 와 같은 순서의 결과 리스트 (중복 step 은 같은 결과 객체를 공유).
+    """
+    keys, unique, fanout = _dedupe(steps)
+    results: Dict[str, Dict] = {}
+    if unique:
+        with ThreadPoolExecutor(max_workers=min(EXEC_MAX_WORKERS, len(unique))) as pool:
+            futs = {}
+            for k, s in unique.items():
+                if on_call: on_call(s, fanout[k])
+                futs[pool.submit(_run, s, force_fresh)] = k
+            try:
+                for fut in as_completed(futs):
+                    k = futs[fut]
+                    results[k] = fut.result()
+                    if on_done: on_done(results[k], fanout[k])
+            except BaseException:
+                for f in futs: f.cancel()
+                raise
+    return [results[k] for k in keys]
+
+# ---- async worker 용 ----
+
+# asyncio.Semaphore 는 처음 쓰인 event loop 에 묶이므로 loop 마다 따로 둔다 (loop 가 사라지면 같이 정리)
+_alimits: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+def _alimit(tool: str) -> asyncio.Semaphore:
+    sems = _alimits.setdefault(asyncio.get_running_loop(), {})
+    sem = sems.get(tool)
+    if sem is None:
+        sem = sems[tool] = asyncio.Semaphore(EXEC_TOOL_LIMITS.get(tool, EXEC_MAX_WORKERS))
+    return sem
+
+async def _arun(step: Dict, force_fresh: bool, http) -> Dict:
+    """http_check 는 공유 httpx.AsyncClient 로, 나머지(paramiko/pymysql)는 thread 로 넘겨 실행."""
+    if step["tool"] != "http_check" or http is None:
+        return await asyncio.to_thread(_run, step, force_fresh)
+    sem = _alimit(step["tool"])
+    async def fetch():
+        await asyncio.to_thread(throttle, step["tool"], step["args"])
+        async with sem:
+            return await ahttp_check(step["args"]["url"], http)
+    with span("tool_call", tool=step["tool"], control=_control_label(step)) as sp:
+        out = _timed(sp, await acached_call(step["tool"], step["args"], fetch, force_fresh))
+    out["timing"] = {"ms": sp.ms, "bytes": sp.size}
+    return out
+
+async def execute_plan_async(steps: List[Dict],
+                             on_call: Optional[Callable[[Dict, int], None]] = None,
+                             on_done: Optional[Callable[[Dict, int], None]] = None,
+                             force_fresh: bool = False, http=None) -> List[Dict]:
+    """execute_plan 의 async 판. 도구별 동시 실행 상한은 같은 event loop 안의 모든 job 이 공유."""
+    keys, unique, fanout = _dedupe(steps)
+    results: Dict[str, Dict] = {}
+
+    async def one(k, s):
+        results[k] = await _arun(s, force_fresh, http)
+        if on_done: on_done(results[k], fanout[k])
+
+    for k, s in unique.items():
+        if on_call: on_call(s, fanout[k])
+    await asyncio.gather(*(one(k, s) for k, s in unique.items()))
+    return [results[k] for k in keys]
@@ -0,0 +1,132 @@
+# export.py
+# SIEM 용 bulk export: findings / events / artifact metadata 를 NDJSON 한 줄씩 streaming.
+# - 각 table 을 id 순으로 yield_per 로 읽어 row 를 바로 직렬화 → 행 수와 무관하게 메모리 일정
+# - watermark = 종류별 마지막 id ("<findings>.<events>.<artifacts>"). 시작 시 max(id) 를 찍어 두고
+#   그 범위까지만 내보내므로, 다음 pull 은 ?since=<watermark> 로 새 row 만 받는다.
+# - retention 으로 archive 된 event 도 같은 id 구간이면 archive blob 에서 읽어 내보낸다.
+import json, zlib
+from datetime import datetime
+from sqlalchemy import func, select
+from models import db, Job, Event, EventRollup, Artifact, Finding
+import metrics
+import retention
+
+KINDS = ("findings", "events", "artifacts")
+_MODELS = {"findings": Finding, "events": Event, "artifacts": Artifact}
+_ROW = {"findings": Finding.to_dict, "events": Event.to_json, "artifacts": Artifact.to_dict}
+YIELD_PER = 1000
+CHUNK_BYTES = 64 * 1024  # 응답/압축기에 넘기는 단위
+
+class ExportError(ValueError):
+    pass
+
+def parse_watermark(raw) -> dict:
+    """"12.340.56" → {"findings": 12, "events": 340, "artifacts": 56}. 없으면 전부 0."""
+    if not raw:
+        return {k: 0 for k in KINDS}
+    parts = raw.split(".")
+    if len(parts) != len(KINDS) or not all(p.isdigit() for p in parts):
+        raise ExportError("invalid watermark")
+    return dict(zip(KINDS, map(int, parts)))
+
+def format_watermark(marks: dict) -> str:
+    return ".".join(str(marks[k]) for k in KINDS)
+
+def _parse_time(raw):
+    if not raw:
+        return None
+    try:
+        return datetime.fromisoformat(raw.rstrip("Z"))
+    except ValueError:
+        raise ExportError(f"invalid time: {raw}")
+
+def plan(since=None, start=None, end=None, job_ids=None, fleet_id=None, kinds=None) -> dict:
+    """
+    요청 인자를 검사하고 이번 export 의 범위를 고정: (since, upto] id 구간 + job 조건.
+    start/end 는 job 의 created_at 기준 (findings 에는 시각이 없으므로 세 종류 모두 job 으로 거름).
+    """
+    unknown = set(kinds or ()) - set(KINDS)
+    if unknown:
+        raise ExportError(f"unknown kinds: {', '.join(sorted(unknown))}")
+    kinds = [k for k in KINDS if k in (kinds or KINDS)]
+    try:
+        job_ids = [int(j) for j in job_ids] if job_ids else None
+    except ValueError:
+        raise ExportError("invalid job_ids")
+    since = parse_watermark(since)
+    upto = {k: db.session.query(func.coalesce(func.max(_MODELS[k].id), 0)).scalar() for k in KINDS}
+    upto["events"] = max(upto["events"], db.session.query(func.coalesce(func.max(EventRollup.last_event_id), 0)).scalar())
+    # 고르지 않은 종류는 watermark 를 그대로 두어 나중에 따로 받아갈 수 있게
+    upto = {k: max(upto[k], since[k]) if k in kinds else since[k] for k in KINDS}
+    return {"kinds": kinds, "since": since, "upto": upto, "start": _parse_time(start), "end": _parse_time(end),
+            "job_ids": job_ids, "fleet_id": fleet_id,
+            "watermark": format_watermark(upto)}
+
+def _job_filter(p):
+    conds = []
+    if p["job_ids"] is not None:
+        conds.append(Job.id.in_(p["job_ids"]))
+    if p["fleet_id"] is not None:
+        conds.append(Job.fleet_id == p["fleet_id"])
+    if p["start"] is not None:
+        conds.append(Job.created_at >= p["start"])
+    if p["end"] is not None:
+        conds.append(Job.created_at < p["end"])
+    return conds
+
+def iter_rows(p):
+    """(kind, dict) 를 id 순으로 (archive 된 event 는 테이블 분 뒤에). row 마다 job 의 target 을 붙인다."""
+    conds = _job_filter(p)
+    for kind in p["kinds"]:
+        model = _MODELS[kind]
+        if p["upto"][kind] <= p["since"][kind]:
+            continue
+        q = (select(model, Job.target).join(Job, Job.id == model.job_id)
+             .where(model.id > p["since"][kind], model.id <= p["upto"][kind], *conds)
+             .order_by(model.id.asc()).execution_options(yield_per=YIELD_PER))
+        n = 0
+        for row, target in db.session.execute(q):
+            n += 1
+            yield kind, {"type": kind[:-1], "target": target, **_ROW[kind](row)}
+        if kind == "events":
+            # 테이블 다음에 archive 를 읽으므로, 그 사이 retention 이 돌아도 빠지는 event 는 없다 (중복은 가능)
+            for ev in _iter_archived_events(p, conds):
+                n += 1
+                yield kind, ev
+        metrics.inc("export_rows", by=n, kind=kind)
+
+def _iter_archived_events(p, conds):
+    """archive 된 event 중 (since, upto] 구간, job 조건에 맞는 것 (job 순, job 안에서는 id 순)."""
+    since, upto = p["since"]["events"], p["upto"]["events"]
+    q = (select(EventRollup.job_id, Job.target).join(Job, Job.id == EventRollup.job_id)
+         .where(EventRollup.last_event_id > since, EventRollup.archive_sha.isnot(None), *conds)
+         .order_by(EventRollup.job_id))
+    for job_id, target in db.session.execute(q).all():
+        for ev in retention.iter_archived(job_id, since):
+            if ev["id"] <= upto:
+                yield {"type": "event", "target": target, **ev}
+
+def iter_ndjson(p, chunk_bytes: int = CHUNK_BYTES):
+    """NDJSON bytes 를 chunk_bytes 단위로. 마지막 줄은 {"type": "watermark", ...}."""
+    buf, size = [], 0
+    for _, row in iter_rows(p):
+        line = (json.dumps(row, ensure_ascii=False, default=str) + "\n").encode()
+        buf.append(line); size += len(line)
+        if size >= chunk_bytes:
+            yield b"".join(buf); buf, size = [], 0
+    buf.append((json.dumps({"type": "watermark", "watermark": p["watermark"], "upto": p["upto"]}) + "\n").encode())
+    yield b"".join(buf)
+
+def gzip_stream(chunks, flush_bytes: int = CHUNK_BYTES):
+    """chunk iterator 를 gzip stream 으로 (압축된 출력이 flush_bytes 이상 모일 때마다 내보냄)."""
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)
+    buf = []
+    size = 0
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            buf.append(out); size += len(out)
+        if size >= flush_bytes:
+            yield b"".join(buf); buf, size = [], 0
+    buf.append(z.flush())
+    yield b"".join(buf)
@@ -0,0 +1,141 @@
+# fleet.py
+# 여러 target 을 하나의 fleet(campaign)으로 묶어 스캔.
+# - target 목록 / CIDR / host 파일을 펼쳐 Job 을 bulk 생성
+# - batch_size 개씩 묶은 RQ job 을 parallelism 개 lane 에 depends_on chain 으로 enqueue
+# - job 이 끝날 때마다 Fleet counter 를 UPDATE ... SET x = x + n 으로 증분 갱신하고 snapshot publish
+import ipaddress
+from collections import Counter
+from typing import List, Dict, Iterable, Tuple
+from models import db, Job, Fleet
+from bus import publish_fleet
+from config import FLEET_BATCH_SIZE, FLEET_PARALLELISM, FLEET_MAX_TARGETS, FLEET_URL_TEMPLATE, FLEET_JOB_TIMEOUT_SEC
+
+class FleetError(ValueError):
+    pass
+
+def _to_url(host: str, template: str) -> str:
+    return host if "://" in host else template.format(host=host)
+
+def parse_host_file(text: str) -> List[str]:
+    """한 줄에 target 하나, '#' 이후는 주석. CIDR 줄도 허용."""
+    out = []
+    for line in text.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if line:
+            out.append(line)
+    return out
+
+def expand_targets(items: Iterable[str], template: str = FLEET_URL_TEMPLATE,
+                   max_targets: int = FLEET_MAX_TARGETS) -> List[str]:
+    """target/CIDR 목록을 중복 없는 URL 목록으로. CIDR 은 host 주소만 (네트워크/브로드캐스트 제외)."""
+    seen, out = set(), []
+    def add(url):
+        if url not in seen:
+            if len(out) >= max_targets:
+                raise FleetError(f"too many targets (max {max_targets})")
+            seen.add(url); out.append(url)
+    for item in items:
+        item = (item or "").strip()
+        if not item:
+            continue
+        if "/" in item and "://" not in item:
+            try:
+                net = ipaddress.ip_network(item, strict=False)
+            except ValueError:
+                raise FleetError(f"invalid CIDR: {item}")
+            if net.num_addresses > max_targets + 2:
+                raise FleetError(f"CIDR {item} exceeds max {max_targets} targets")
+            for ip in (net.hosts() if net.num_addresses > 2 else net):
+                add(_to_url(f"[{ip}]" if ip.version == 6 else str(ip), template))
+        else:
+            add(_to_url(item, template))
+    return out
+
+def _positive_int(data: Dict, key: str, default: int) -> int:
+    """요청 값이 없으면 default, 1 이상의 정수(또는 정수 문자열)가 아니면 FleetError."""
+    raw = data.get(key)
+    if raw is None or raw == "":
+        return default
+    if isinstance(raw, bool) or not isinstance(raw, (int, str)) or not str(raw).strip().isdigit() or int(raw) < 1:
+        raise FleetError(f"{key} must be a positive integer")
+    return int(raw)
+
+def create_fleet(data: Dict) -> Tuple[Fleet, List[int]]:
+    """
+    data: {"name", "targets":[...], "cidr": str|[...], "hosts": "<host 파일 내용>", "controls", "depth",
+           "options", "batch_size", "parallelism", "url_template"}
+    Fleet 과 Job 들을 한 transaction 으로 만들고 (fleet, job_ids) 반환.
+    """
+    cidr = data.get("cidr") or []
+    items = list(data.get("targets") or []) + ([cidr] if isinstance(cidr, str) else list(cidr)) \
+        + parse_host_file(data.get("hosts") or "")
+    batch_size = _positive_int(data, "batch_size", FLEET_BATCH_SIZE)
+    parallelism = _positive_int(data, "parallelism", FLEET_PARALLELISM)
+    targets = expand_targets(items, data.get("url_template") or FLEET_URL_TEMPLATE)
+    if not targets:
+        raise FleetError("no targets")
+    fleet = Fleet(name=data.get("name") or "", controls=data.get("controls", []), depth=data.get("depth", "safe"),
+                  options=data.get("options", {}), targets_total=len(targets),
+                  batch_size=batch_size, parallelism=parallelism, status="QUEUED")
+    db.session.add(fleet); db.session.flush()
+    rows = [{"fleet_id": fleet.id, "target": t, "controls": fleet.controls, "ike_patches": [],
+             "depth": fleet.depth, "options": fleet.options, "priority": data.get("priority") or "low",
+             "status": "QUEUED", "progress": 0}
+            for t in targets]
+    db.session.execute(db.insert(Job), rows)
+    db.session.commit()
+    job_ids = [jid for (jid,) in db.session.query(Job.id).filter(Job.fleet_id == fleet.id).order_by(Job.id)]
+    return fleet, job_ids
+
+def enqueue_fleet(queue, fleet: Fleet, job_ids: List[int], func="worker.run_fleet_batch") -> int:
+    """
+    job_ids 를 batch_size 로 나눠 lane i 에 batch i, i+P, i+2P ... 를 depends_on chain 으로 건다.
+    앞 batch 가 실패해도 다음 batch 는 실행 (allow_failure). 반환: enqueue 한 RQ job 수
+    """
+    from rq.job import Dependency
+    batches = [job_ids[i:i + fleet.batch_size] for i in range(0, len(job_ids), fleet.batch_size)]
+    lanes = [None] * min(fleet.parallelism, len(batches))
+    for n, batch in enumerate(batches):
+        lane = n % len(lanes)
+        prev = lanes[lane]
+        dep = Dependency(jobs=[prev], allow_failure=True) if prev is not None else None
+        lanes[lane] = queue.enqueue(func, batch, fleet_id=fleet.id, depends_on=dep,
+                                    job_timeout=FLEET_JOB_TIMEOUT_SEC * len(batch),
+                                    description=f"fleet {fleet.id} batch {n + 1}/{len(batches)}")
+    return len(batches)
+
+def mark_running(fleet_id: int):
+    db.session.execute(db.update(Fleet).where(Fleet.id == fleet_id, Fleet.status == "QUEUED")
+                       .values(status="RUNNING"))
+    db.session.commit()
+
+def fail_unfinished(fleet_id: int, job_ids: List[int]) -> List[int]:
+    """
+    batch 가 중간에 끊겼을 때: 아직 QUEUED/RUNNING 인 job 을 FAILED 로 바꾸고 fleet counter 에 실패로 더함.
+    조건부 UPDATE 라 이미 끝난 job 이나 두 번 호출돼도 중복 집계하지 않는다. 반환: FAILED 로 바꾼 job id
+    """
+    failed = []
+    for jid in job_ids:
+        res = db.session.execute(db.update(Job).where(Job.id == jid, Job.status.in_(("QUEUED", "RUNNING")))
+                                 .values(status="FAILED"))
+        db.session.commit()
+        if res.rowcount:
+            failed.append(jid)
+            record_job(fleet_id, False, [])
+    return failed
+
+def record_job(fleet_id: int, ok: bool, statuses: List[str]):
+    """job 하나의 결과를 fleet counter 에 원자적으로 더하고, 전부 끝났으면 DONE. 갱신된 snapshot 을 publish."""
+    field = "jobs_done" if ok else "jobs_failed"
+    inc = {field: getattr(Fleet, field) + 1}
+    for st, n in Counter(s if s in ("pass", "fail", "na") else "unknown" for s in statuses).items():
+        inc[f"{st}_count"] = getattr(Fleet, f"{st}_count") + n
+    db.session.execute(db.update(Fleet).where(Fleet.id == fleet_id).values(**inc))
+    db.session.execute(db.update(Fleet).where(Fleet.id == fleet_id,
+                                              Fleet.jobs_done + Fleet.jobs_failed >= Fleet.targets_total)
+                       .values(status="DONE"))
+    db.session.commit()
+    fleet = db.session.get(Fleet, fleet_id)
+    if fleet is not None:
+        db.session.refresh(fleet)
+        publish_fleet(fleet.to_dict())
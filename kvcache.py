@@ -0,0 +1,88 @@
+# kvcache.py
+# TTL + 크기 상한이 있는 간단한 key/value 캐시 (디스크 또는 Redis). 도구 결과 캐시, LLM 응답 캐시에서 사용.
+import json, os, threading, time, uuid
+from config import REDIS_URL
+
+class DiskCache:
+    """root/<key[:2]>/<key>.json. 읽을 때 mtime 을 갱신해 LRU 순서로 쓰고, 넘치면 오래된 것부터 삭제."""
+    def __init__(self, root: str, max_entries: int):
+        self.root, self.max_entries = root, max_entries
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def get(self, key):
+        p = self._path(key)
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires", 0) < time.time():
+            try: os.remove(p)
+            except OSError: pass
+            return None
+        try: os.utime(p)
+        except OSError: pass
+        return entry
+
+    def put(self, key, entry, ttl):
+        p = self._path(key)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = p + ".%s.tmp" % uuid.uuid4().hex
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({**entry, "expires": time.time() + ttl}, f, ensure_ascii=False)
+        os.replace(tmp, p)
+        with self._lock:
+            self._puts += 1
+            check = self._puts % 50 == 0
+        if check:
+            self.evict()
+
+    def evict(self):
+        files = []
+        for d, _, names in os.walk(self.root):
+            files.extend(os.path.join(d, n) for n in names if n.endswith(".json"))
+        if len(files) <= self.max_entries:
+            return
+        files.sort(key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0)
+        for p in files[:len(files) - self.max_entries]:
+            try: os.remove(p)
+            except OSError: pass
+
+class RedisCache:
+    """key 별 EX ttl + 최근 사용 시각 sorted set 으로 LRU 상한 유지."""
+    def __init__(self, url: str, max_entries: int, prefix: str):
+        from redis import Redis
+        self.r = Redis.from_url(url, socket_connect_timeout=2)
+        self.max_entries = max_entries
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.r.get(self.prefix + key)
+        if raw is None:
+            return None
+        self.r.zadd(self.prefix + "lru", {key: time.time()})
+        return json.loads(raw)
+
+    def put(self, key, entry, ttl):
+        pipe = self.r.pipeline()
+        pipe.set(self.prefix + key, json.dumps(entry, ensure_ascii=False), ex=int(ttl))
+        pipe.zadd(self.prefix + "lru", {key: time.time()})
+        pipe.zcard(self.prefix + "lru")
+        n = pipe.execute()[-1]
+        if n > self.max_entries:
+            old = self.r.zrange(self.prefix + "lru", 0, n - self.max_entries - 1)
+            if old:
+                self.r.delete(*[self.prefix + k.decode() for k in old])
+                self.r.zrem(self.prefix + "lru", *old)
+
+def make_cache(kind: str, root: str, max_entries: int, redis_prefix: str):
+    """kind: "disk" | "redis" | 그 외(None, 캐시 안 씀)."""
+    if kind == "redis":
+        return RedisCache(REDIS_URL, max_entries, redis_prefix)
+    if kind == "disk":
+        return DiskCache(root, max_entries)
+    return None
@@ -1,11 +1,19 @@
 # llm_client.py
-import os, json
-from typing import List, Dict
-from openai import OpenAI
+import os, json, time, hashlib
+from typing import List, Dict, Optional
+from kvcache import make_cache
+import rules
+from metrics import span
 
 USE_GPT = os.getenv("USE_GPT", "false").lower() == "true"
 GPT_MODEL = os.getenv("GPT_MODEL", "gpt-5-mini")
 
+# 응답 캐시: temperature=0 + 같은 입력이면 같은 결과로 보고 재사용
+LLM_CACHE = os.getenv("LLM_CACHE", "disk").lower()   # disk | redis | off
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".llm_cache")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
 _client = None  # lazy
 
 def _get_client():
@@ -21,6 +29,17 @@ def _get_client():
     _client = OpenAI()
     return _client
 
+_aclient = None
+
+def _get_async_client():
+    """async worker 용 AsyncOpenAI (connection pool 을 job 들이 공유)."""
+    global _aclient
+    if _aclient is None:
+        _get_client()  # 설정 검증
+        from openai import AsyncOpenAI
+        _aclient = AsyncOpenAI()
+    return _aclient
+
 TOOLS = [
     {
         "type": "function",
@@ -97,105 +116,186 @@ SYSTEM = """You are a security check operator.
 - Output only valid structured JSON per schema (no extra fields). 
 - If evidence is missing, mark 'unknown' and propose next steps."""
 
-def plan_steps_with_llm(target: str, controls: Dict[str, Dict]) -> List[Dict]:
+# 수집할 때마다 달라지는 값: 판정과 무관하므로 프롬프트/캐시 key 에서 제외
+_VOLATILE_KEYS = ("elapsed_ms", "collected_at", "cache_hit")
+
+def _canonical(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+# SYSTEM/TOOLS/DECISION_SCHEMA 가 바뀌면 버전이 바뀌어 이전 캐시는 자연히 무효화
+PROMPT_VERSION = hashlib.sha256(_canonical([SYSTEM, TOOLS, DECISION_SCHEMA]).encode()).hexdigest()[:16]
+
+_cache = None
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        _cache = make_cache(LLM_CACHE, LLM_CACHE_DIR, LLM_CACHE_MAX_ENTRIES, "secagent:llmcache:")
+    return _cache
+
+def _cache_key(task: str, payload: Dict) -> str:
+    return hashlib.sha256(_canonical([PROMPT_VERSION, GPT_MODEL, task, payload]).encode()).hexdigest()
+
+def _usage_of(resp) -> Dict:
+    u = getattr(resp, "usage", None)
+    if u is None:
+        return {}
+    return {"prompt_tokens": getattr(u, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(u, "completion_tokens", 0) or 0,
+            "total_tokens": getattr(u, "total_tokens", 0) or 0}
+
+def _cache_lookup(task: str, payload: Dict, usage: Optional[List[Dict]]):
+    """반환: (key, entry|None, t0). hit 이면 usage 기록까지 남김."""
+    cache, key = _get_cache(), _cache_key(task, payload)
+    t0 = time.perf_counter()
+    entry = None
+    if cache is not None:
+        try:
+            entry = cache.get(key)
+        except Exception:
+            entry = None
+    if entry is not None and usage is not None:
+        usage.append({"task": task, "cache_hit": True, "latency_ms": round((time.perf_counter() - t0) * 1000, 2),
+                      "tokens": {}, "saved_tokens": entry.get("tokens", {}), "saved_ms": entry.get("latency_ms", 0)})
+    return key, entry, t0
+
+def _cache_store(task: str, key: str, t0: float, value, resp, usage: Optional[List[Dict]]):
+    latency_ms = round((time.perf_counter() - t0) * 1000, 2)
+    tokens = _usage_of(resp)
+    cache = _get_cache()
+    if cache is not None:
+        try:
+            cache.put(key, {"value": value, "tokens": tokens, "latency_ms": latency_ms, "model": GPT_MODEL}, LLM_CACHE_TTL)
+        except Exception:
+            pass
+    if usage is not None:
+        usage.append({"task": task, "cache_hit": False, "latency_ms": latency_ms, "tokens": tokens})
+    return value
+
+def _cached_completion(task: str, payload: Dict, call, usage: Optional[List[Dict]]):
     """
-    GPT에게 어떤 툴을 어떤 인자로 호출할지 계획시킴.
-    반환: [{"tool":"http_check","args":{"url":target}}, ...]
+    call() → (value, resp). 캐시에 있으면 네트워크 호출 없이 value 반환.
+    usage 리스트에 호출 기록을 남김: cache_hit, latency_ms, tokens, (hit 이면) 절약한 tokens/latency.
     """
-    if not USE_GPT:
-        # fallback: U31/U32/U33 → http_check만
-        steps = []
-        for cid, c in controls.items():
-            if any(k in c.get("check","").lower() for k in ["hsts","csp","x-frame","frame-ancestors"]):
-                steps.append({"tool":"http_check","args":{"url": target}})
-        return steps
-
-    client = _get_client()
-
-    user = {
-        "role":"user",
-        "content": json.dumps({
-            "task":"plan",
-            "target": target,
-            "controls": controls
-        }, ensure_ascii=False)
-    }
-    resp = client.chat.completions.create(
-        model=GPT_MODEL,
-        messages=[{"role":"system","content": SYSTEM}, user],
-        tools=TOOLS,
-        tool_choice="auto",
-        temperature=0
-    )
+    with span("llm_call", task=task) as sp:
+        key, entry, t0 = _cache_lookup(task, payload, usage)
+        sp.outcome = "hit" if entry is not None else "miss"
+        if entry is not None:
+            return entry["value"]
+        value, resp = call()
+        return _cache_store(task, key, t0, value, resp, usage)
+
+async def _acached_completion(task: str, payload: Dict, acall, usage: Optional[List[Dict]]):
+    """_cached_completion 의 async 판. acall() 은 coroutine → (value, resp)."""
+    with span("llm_call", task=task) as sp:
+        key, entry, t0 = _cache_lookup(task, payload, usage)
+        sp.outcome = "hit" if entry is not None else "miss"
+        if entry is not None:
+            return entry["value"]
+        value, resp = await acall()
+        return _cache_store(task, key, t0, value, resp, usage)
+
+def _fallback_plan(target: str, controls: Dict[str, Dict]) -> List[Dict]:
+    # fallback: 규칙이 있는 control 은 규칙이 필요로 하는 증거, 나머지는 키워드로 http_check
+    steps = rules.collect_steps(list(controls), target)
+    for cid, c in controls.items():
+        if rules.has_rule(cid):
+            continue
+        if any(k in c.get("check","").lower() for k in ["hsts","csp","x-frame","frame-ancestors"]):
+            steps.append({"tool":"http_check","args":{"url": target},"control": cid})
+    return steps
+
+def _plan_request(payload: Dict) -> Dict:
+    user = {"role":"user", "content": json.dumps(payload, ensure_ascii=False)}
+    return dict(model=GPT_MODEL, messages=[{"role":"system","content": SYSTEM}, user],
+                tools=TOOLS, tool_choice="auto", temperature=0)
+
+def _plan_parse(resp):
     steps = []
     for c in resp.choices:
         tc = c.message.tool_calls or []
         for t in tc:
             steps.append({"tool": t.function.name, "args": json.loads(t.function.arguments or "{}")})
-    return steps
+    return steps, resp
 
-def decide_with_llm(evidence: List[Dict], controls: Dict[str, Dict]) -> Dict:
+def plan_steps_with_llm(target: str, controls: Dict[str, Dict], usage: Optional[List[Dict]] = None) -> List[Dict]:
     """
-    GPT에게 구조화 출력 스키마로 판정.
-    evidence: [{"tool":"http_check","result":{...},"sha256":"..."}]
+    GPT에게 어떤 툴을 어떤 인자로 호출할지 계획시킴.
+    반환: [{"tool":"http_check","args":{"url":target}}, ...]
+    usage: 넘기면 LLM 호출 기록(캐시 hit, tokens, latency)을 추가함.
     """
     if not USE_GPT:
-        # 로컬 규칙: HSTS/CSP/XFO 간단 판정
-        items = []; summary = {"pass":0,"fail":0,"na":0,"unknown":0}
-        hdrs = {}
-        for ev in evidence:
-            if ev.get("tool")=="http_check":
-                for k,v in ev["result"].get("headers", {}).items():
-                    hdrs[k.lower()] = v
-        for cid, c in controls.items():
-            if cid.upper()=="U31":
-                ok = "strict-transport-security" in hdrs
-                st = "pass" if ok else "fail"
-                items.append({"control_id":cid,"status":st,"evidence_refs":[],
-                              "finding":"HSTS present" if ok else "HSTS missing",
-                              "risk": "" if ok else "Downgrade/SSL stripping risk",
-                              "recommendation":"Add HSTS header",
-                              "repro":["curl -I "+evidence[0]["result"].get("url","")]})
-                summary[st]+=1
-            elif cid.upper()=="U32":
-                ok = "content-security-policy" in hdrs
-                st = "pass" if ok else "fail"
-                items.append({"control_id":cid,"status":st,"evidence_refs":[],
-                              "finding":"CSP present" if ok else "CSP missing",
-                              "risk": "" if ok else "XSS/MiTM risk",
-                              "recommendation":"Add CSP with strict directives",
-                              "repro":["curl -I "+evidence[0]["result"].get("url","")]})
-                summary[st]+=1
-            elif cid.upper()=="U33":
-                ok = ("x-frame-options" in hdrs) or \
-                     ("content-security-policy" in hdrs and "frame-ancestors" in hdrs.get("content-security-policy","").lower())
-                st = "pass" if ok else "fail"
-                items.append({"control_id":cid,"status":st,"evidence_refs":[],
-                              "finding":"Clickjacking protection present" if ok else "No clickjacking protection",
-                              "risk": "" if ok else "UI redress attack risk",
-                              "recommendation":"Set CSP frame-ancestors or X-Frame-Options",
-                              "repro":["curl -I "+evidence[0]["result"].get("url","")]})
-                summary[st]+=1
-            else:
-                items.append({"control_id":cid,"status":"unknown","evidence_refs":[],
-                              "finding":"No rule","risk":"","recommendation":"Add rule","repro":[]})
-                summary["unknown"]+=1
-        return {"items":items, "summary":summary}
-    
-    client = _get_client()
+        return _fallback_plan(target, controls)
+    payload = {"task":"plan", "target": target, "controls": controls}
+    call = lambda: _plan_parse(_get_client().chat.completions.create(**_plan_request(payload)))
+    return _cached_completion("plan", payload, call, usage)
+
+async def aplan_steps_with_llm(target: str, controls: Dict[str, Dict], usage: Optional[List[Dict]] = None) -> List[Dict]:
+    """plan_steps_with_llm 의 async 판 (AsyncOpenAI)."""
+    if not USE_GPT:
+        return _fallback_plan(target, controls)
+    payload = {"task":"plan", "target": target, "controls": controls}
+    async def acall():
+        return _plan_parse(await _get_async_client().chat.completions.create(**_plan_request(payload)))
+    return await _acached_completion("plan", payload, acall, usage)
 
+def _decide_local(evidence: List[Dict], controls: Dict[str, Dict]):
+    """
+    규칙 엔진으로 판정 가능한 control 은 LLM 없이 결정.
+    반환: (decided items, 최종 결과 | None, LLM payload | None)
+    """
+    decided, pending = rules.evaluate(controls, evidence)
+    if not pending:
+        return decided, _with_summary(decided), None
+    if not USE_GPT:
+        return decided, _with_summary(decided + [
+            {"control_id":cid,"status":"unknown","evidence_refs":[],
+             "finding":"No rule" if why == "no rule" else f"Rule undecided: {why}",
+             "risk":"","recommendation":"Add rule" if why == "no rule" else "Collect evidence and re-run","repro":[]}
+            for cid, why in pending.items()]), None
     # GPT 사용 경로: Structured Output
-    msgs = [{"role":"system","content": SYSTEM}]
-    msgs.append({"role":"user","content": json.dumps({
+    payload = {
         "task":"decide",
-        "controls": controls,
-        "evidence": evidence
-    }, ensure_ascii=False)})
-
-    resp = client.chat.completions.parse(
-        model=GPT_MODEL,
-        messages=msgs,
-        response_format=DECISION_SCHEMA,
-        temperature=0
-    )
-    return resp.choices[0].message.parsed  # dict
+        "controls": {cid: c for cid, c in controls.items() if cid in pending},
+        "evidence": [{**ev, "result": {k: v for k, v in ev.get("result", {}).items() if k not in _VOLATILE_KEYS}}
+                     for ev in evidence]
+    }
+    return decided, None, payload
+
+def _decide_request(payload: Dict) -> Dict:
+    msgs = [{"role":"system","content": SYSTEM}]
+    msgs.append({"role":"user","content": json.dumps(payload, ensure_ascii=False)})
+    return dict(model=GPT_MODEL, messages=msgs, response_format=DECISION_SCHEMA, temperature=0)
+
+def _decide_parse(resp):
+    return resp.choices[0].message.parsed, resp  # dict
+
+def decide_with_llm(evidence: List[Dict], controls: Dict[str, Dict], usage: Optional[List[Dict]] = None) -> Dict:
+    """
+    GPT에게 구조화 출력 스키마로 판정.
+    evidence: [{"tool":"http_check","result":{...},"sha256":"..."}]
+    usage: 넘기면 LLM 호출 기록(캐시 hit, tokens, latency)을 추가함.
+    """
+    decided, done, payload = _decide_local(evidence, controls)
+    if done is not None:
+        return done
+    call = lambda: _decide_parse(_get_client().chat.completions.parse(**_decide_request(payload)))
+    llm = _cached_completion("decide", payload, call, usage) or {}
+    return _with_summary(decided + list(llm.get("items", [])))
+
+async def adecide_with_llm(evidence: List[Dict], controls: Dict[str, Dict], usage: Optional[List[Dict]] = None) -> Dict:
+    """decide_with_llm 의 async 판 (AsyncOpenAI)."""
+    decided, done, payload = _decide_local(evidence, controls)
+    if done is not None:
+        return done
+    async def acall():
+        return _decide_parse(await _get_async_client().chat.completions.parse(**_decide_request(payload)))
+    llm = await _acached_completion("decide", payload, acall, usage) or {}
+    return _with_summary(decided + list(llm.get("items", [])))
+
+def _with_summary(items: List[Dict]) -> Dict:
+    summary = {"pass":0,"fail":0,"na":0,"unknown":0}
+    for it in items:
+        st = it.get("status", "unknown")
+        summary[st] = summary.get(st, 0) + 1
+    return {"items": items, "summary": summary}
@@ -1,56 +1,578 @@
 # Minimal MCP-like bridge with safe defaults.
 # http_check: real; ssh_exec & mariadb_query: stubs unless AGENT_DRY_RUN=false.
-import hashlib, json, time
-import requests
-import paramiko
-import pymysql
-from config import AGENT_DRY_RUN, SSH_HOST, SSH_USER, SSH_KEY, DB_HOST, DB_USER, DB_PASS, DB_PORT
+import atexit, hashlib, json, os, re, time, threading, uuid
+from datetime import datetime
+from contextlib import contextmanager
+# requests / paramiko / pymysql 은 처음 쓸 때 import (dry-run 이나 web process 는 올리지 않음)
+import blobstore
+from kvcache import make_cache
+from config import AGENT_DRY_RUN, AGENT_DRY_RUN_DELAY_MS, SSH_HOST, SSH_USER, SSH_KEY, DB_HOST, DB_USER, DB_PASS, DB_PORT
+from config import SSH_POOL_MAX_SESSIONS, SSH_POOL_IDLE_SEC, SSH_HEALTH_SEC
+from config import DB_POOL_MAX, DB_POOL_IDLE_SEC, DB_MAX_ROWS, DB_MAX_BYTES, DB_SCAN_MAX_ROWS
+from config import ARTIFACT_DIR, CAPTURE_HEAD_BYTES, CAPTURE_TAIL_BYTES, CAPTURE_CHUNK, HTTP_VOLATILE_HEADERS
+from config import TOOL_CACHE, TOOL_CACHE_DIR, TOOL_CACHE_TTLS, TOOL_CACHE_MAX_ENTRIES
+from urllib.parse import urlsplit
 
 def _sha256(data: bytes) -> str:
     h = hashlib.sha256(); h.update(data); return h.hexdigest()
 
-def http_check(url: str, timeout: int = 10):
-    t0 = time.time()
-    r = requests.get(url, timeout=timeout, allow_redirects=False)
+class _Capture:
+    """
+    도구 출력 스트림 캡처: 증분 sha256 + 앞/뒤 일부만 메모리에 보관.
+    head+tail 을 넘는 출력은 전체를 ARTIFACT_DIR/tmp 파일로 흘려 쓰고,
+    닫을 때 blobstore 로 옮겨 "blob:<sha256>" ref 로 남긴다 (동일 내용은 blob 하나).
+    """
+    def __init__(self, head: int = CAPTURE_HEAD_BYTES, tail: int = CAPTURE_TAIL_BYTES):
+        self._h = hashlib.sha256()
+        self._head_max, self._tail_max = head, tail
+        self.head, self.tail = bytearray(), bytearray()
+        self.size = 0
+        self.sha256 = ""
+        self.ref = ""
+        self._spool = None
+        self._spool_path = ""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def feed(self, data: bytes):
+        if not data:
+            return
+        self._h.update(data)
+        self.size += len(data)
+        if self._spool is not None:
+            self._spool.write(data)
+        elif self.size > self._head_max + self._tail_max:
+            # 처음 넘치는 순간: 지금까지(head+tail 전체)를 spool 파일로 옮기고 이후는 계속 흘려 씀
+            os.makedirs(os.path.join(ARTIFACT_DIR, "tmp"), exist_ok=True)
+            self._spool_path = os.path.join(ARTIFACT_DIR, "tmp", uuid.uuid4().hex)
+            self._spool = open(self._spool_path, "wb")
+            self._spool.write(self.head); self._spool.write(self.tail); self._spool.write(data)
+        room = self._head_max - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data[-self._tail_max:] if self._tail_max else b""
+            if len(self.tail) > self._tail_max:
+                del self.tail[:len(self.tail) - self._tail_max]
+
+    @property
+    def truncated(self) -> bool:
+        return self.size > len(self.head) + len(self.tail)
+
+    def close(self):
+        self.sha256 = self._h.hexdigest()
+        if self._spool is not None:
+            self._spool.close(); self._spool = None
+            blobstore.put_file(self._spool_path, self.sha256)
+            self.ref = blobstore.ref(self.sha256)
+        return self
+
+    def discard(self):
+        if self._spool is not None:
+            self._spool.close(); self._spool = None
+            try: os.remove(self._spool_path)
+            except OSError: pass
+
+    def text(self, encoding: str = "utf-8") -> str:
+        head = self.head.decode(encoding, errors="replace")
+        if not self.truncated:
+            return head + self.tail.decode(encoding, errors="replace")
+        skipped = self.size - len(self.head) - len(self.tail)
+        return head + f"\n...[{skipped} bytes truncated]...\n" + self.tail.decode(encoding, errors="replace")
+
+    def summary(self, prefix: str) -> dict:
+        return {f"{prefix}_bytes": self.size, f"{prefix}_sha256": self.sha256,
+                f"{prefix}_truncated": self.truncated}
+
+def _captured(data: bytes) -> _Capture:
+    with _Capture() as cap:
+        cap.feed(data)
+    return cap
+
+_COOKIE_SPLIT = re.compile(r",\s*(?=[^;,=\s]+=)")  # 합쳐진 Set-Cookie 사이의 ", " (Expires 안의 ", " 는 제외)
+
+def _cookie_shape(value: str) -> str:
+    """Set-Cookie 를 이름 + 속성으로 (값/Expires 는 요청마다 바뀜). Secure/HttpOnly/SameSite 가 바뀌면 hash 도 바뀜."""
+    out = []
+    for cookie in _COOKIE_SPLIT.split(value):
+        name, *attrs = [p.strip() for p in cookie.split(";")]
+        attrs = sorted(a.split("=")[0].lower() if a.lower().startswith("expires") else a.lower() for a in attrs if a)
+        out.append("; ".join([name.split("=")[0]] + attrs))
+    return ", ".join(sorted(out))
+
+def _hash_headers(headers: dict) -> dict:
+    """sha256 계산용 header: 요청마다 바뀌는 header(HTTP_VOLATILE_HEADERS)는 빼고 Set-Cookie 는 모양만.
+    result["headers"] 에는 원래 header 를 그대로 둬서 규칙/LLM 이 쿠키 속성 등을 볼 수 있게 함."""
+    out = {}
+    for k, v in headers.items():
+        if k.lower() == "set-cookie":
+            out[k.lower()] = _cookie_shape(v)
+        elif k.lower() not in HTTP_VOLATILE_HEADERS:
+            out[k.lower()] = v
+    return out
+
+def _http_result(url, status, headers, encoding, body, t0):
     info = {
         "url": url,
-        "status": r.status_code,
-        "headers": dict(r.headers),
-        "text_sample": r.text[:512],
+        "status": status,
+        "headers": headers,
+        "text_sample": bytes(body.head[:512]).decode(encoding, errors="replace"),
+        **body.summary("body"),
         "elapsed_ms": int((time.time() - t0) * 1000),
     }
-    raw = json.dumps(info, ensure_ascii=False).encode()
-    return {"tool":"http_check", "args":{"url":url}, "result":info, "sha256":_sha256(raw)}
+    if body.ref:
+        info["body_ref"] = body.ref
+    # 본문은 스트림 해시로만 반영 (elapsed_ms, Date/쿠키 값 같은 가변값은 제외)
+    raw = json.dumps({"url": url, "status": status, "headers": _hash_headers(headers), "body_sha256": body.sha256},
+                     ensure_ascii=False, sort_keys=True).encode()
+    return {"tool":"http_check", "args":{"url":url}, "result":info, "sha256":_sha256(raw), "ref": body.ref}
+
+def http_check(url: str, timeout: int = 10):
+    import requests
+    t0 = time.time()
+    with requests.get(url, timeout=timeout, allow_redirects=False, stream=True) as r, _Capture() as body:
+        for chunk in r.iter_content(CAPTURE_CHUNK):
+            body.feed(chunk)
+        status, headers, encoding = r.status_code, dict(r.headers), r.encoding or "utf-8"
+    return _http_result(url, status, headers, encoding, body, t0)
+
+async def ahttp_check(url: str, client, timeout: int = 10):
+    """http_check 의 async 판. client: 공유 httpx.AsyncClient. 결과/sha256 형식은 동기판과 같다."""
+    t0 = time.time()
+    with _Capture() as body:
+        async with client.stream("GET", url, timeout=timeout, follow_redirects=False) as r:
+            async for chunk in r.aiter_bytes(CAPTURE_CHUNK):
+                body.feed(chunk)
+        headers = {}
+        for k, v in r.headers.raw:  # requests 와 같게: 원래 대소문자, 중복 header 는 ", " 로 합침
+            k, v = k.decode("latin-1"), v.decode("latin-1")
+            headers[k] = f"{headers[k]}, {v}" if k in headers else v
+        status, encoding = r.status_code, r.encoding or "utf-8"
+    return _http_result(url, status, headers, encoding, body, t0)
+
+class _SSHPool:
+    """
+    (host, user, key) 별로 SSH transport 하나를 유지하고 명령마다 channel 만 새로 연다.
+    - max_sessions: transport 당 동시 channel 상한 (sshd MaxSessions 기본 10)
+    - idle_sec: 이 시간 이상 쓰이지 않은 연결은 닫음
+    - health_sec: 이 시간 이상 쉬었던 연결은 재사용 전에 keepalive 로 확인
+    """
+    def __init__(self, max_sessions: int, idle_sec: float, health_sec: float):
+        self.max_sessions = max_sessions
+        self.idle_sec = idle_sec
+        self.health_sec = health_sec
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "handshakes": 0, "evictions": 0, "health_failures": 0}
+
+    def _evict_idle(self, now):
+        for key, e in list(self._entries.items()):
+            if e["in_use"] == 0 and now - e["last"] > self.idle_sec:
+                self._close(key)
+                self.stats["evictions"] += 1
+
+    def _close(self, key):
+        e = self._entries.pop(key, None)
+        if e and e["client"] is not None:
+            try: e["client"].close()
+            except Exception: pass
+
+    def _healthy(self, e, now) -> bool:
+        t = e["client"].get_transport()
+        if t is None or not t.is_active():
+            return False
+        if now - e["last"] > self.health_sec:
+            try:
+                t.send_ignore()
+            except Exception:
+                return False
+        return True
+
+    def _acquire(self, host, user, key_filename):
+        """
+        lock 안에서는 entry 를 찾거나 자리(placeholder)만 잡고, handshake 와 health check 는 lock 밖에서 한다.
+        같은 key 로 동시에 들어온 호출은 자리를 먼저 잡은 쪽의 connect 결과를 기다린다.
+        """
+        key = (host, user, key_filename)
+        while True:
+            with self._lock:
+                now = time.time()
+                self._evict_idle(now)
+                e = self._entries.get(key)
+                owner = e is None
+                if owner:
+                    self.stats["misses"] += 1
+                    e = self._entries[key] = {"client": None, "ready": threading.Event(), "error": None,
+                                              "last": now, "in_use": 0,
+                                              "sem": threading.BoundedSemaphore(self.max_sessions)}
+                e["in_use"] += 1
+            if owner:
+                return key, self._connect(key, e)
+            e["ready"].wait()
+            if e["error"] is None and self._healthy(e, now):
+                with self._lock:
+                    self.stats["hits"] += 1
+                return key, e
+            with self._lock:
+                e["in_use"] -= 1
+                if e["error"] is not None:
+                    raise e["error"]
+                self.stats["health_failures"] += 1
+                if self._entries.get(key) is e:
+                    self._close(key)
+            # 끊긴 연결: 다시 자리를 잡아 새로 연결
+
+    def _connect(self, key, e):
+        import paramiko
+        try:
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            client.connect(key[0], username=key[1], key_filename=key[2], timeout=8)
+        except Exception as exc:
+            with self._lock:
+                e["error"] = exc
+                e["in_use"] -= 1
+                if self._entries.get(key) is e:
+                    del self._entries[key]
+            e["ready"].set()
+            raise
+        with self._lock:
+            e["client"] = client
+            self.stats["handshakes"] += 1
+        e["ready"].set()
+        return e
+
+    @contextmanager
+    def channel(self, host=None, user=None, key_filename=None, timeout: int = 10):
+        import paramiko
+        key, e = self._acquire(host or SSH_HOST, user or SSH_USER, key_filename or SSH_KEY)
+        try:
+            with e["sem"]:
+                chan = e["client"].get_transport().open_session(timeout=timeout)
+                chan.settimeout(timeout)
+                try:
+                    yield chan
+                finally:
+                    chan.close()
+        except TimeoutError:
+            # 느린 명령 하나(_pump / socket.timeout): 그 channel 만 닫고, 다른 channel 이 쓰는 transport 는 유지
+            raise
+        except (paramiko.SSHException, EOFError, OSError) as exc:
+            t = e["client"].get_transport()
+            if isinstance(exc, (paramiko.SSHException, EOFError)) or t is None or not t.is_active():
+                with self._lock:
+                    if self._entries.get(key) is e:
+                        self._close(key)
+            raise
+        finally:
+            with self._lock:
+                e["in_use"] -= 1
+                e["last"] = time.time()
+
+    def close_all(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._close(key)
+
+_ssh_pool = _SSHPool(SSH_POOL_MAX_SESSIONS, SSH_POOL_IDLE_SEC, SSH_HEALTH_SEC)
+atexit.register(_ssh_pool.close_all)
+
+def ssh_pool_stats():
+    return {**_ssh_pool.stats, "open": len(_ssh_pool._entries)}
+
+def _ssh_result(cmd, out: _Capture, err: _Capture, code):
+    info = {"cmd": cmd, "stdout": out.text(), "stderr": err.text(), "code": code,
+            **out.summary("stdout"), **err.summary("stderr")}
+    if out.ref or err.ref:
+        info["refs"] = {"stdout": out.ref, "stderr": err.ref}
+    raw = json.dumps({"cmd": cmd, "code": code, "stdout_sha256": out.sha256, "stderr_sha256": err.sha256}).encode()
+    return {"tool":"ssh_exec", "args":{"cmd":cmd}, "result": info, "sha256": _sha256(raw), "ref": out.ref or err.ref}
+
+def _pump(chan, on_out, on_err, timeout: float = 10):
+    """stdout/stderr 를 CAPTURE_CHUNK 단위로 번갈아 읽음. timeout 초 동안 아무 출력이 없으면 중단."""
+    idle_since = time.time()
+    while True:
+        got = False
+        if chan.recv_ready():
+            on_out(chan.recv(CAPTURE_CHUNK)); got = True
+        if chan.recv_stderr_ready():
+            on_err(chan.recv_stderr(CAPTURE_CHUNK)); got = True
+        if got:
+            idle_since = time.time()
+            continue
+        if chan.eof_received or chan.closed:
+            if not chan.recv_ready() and not chan.recv_stderr_ready():
+                return
+            continue
+        if time.time() - idle_since > timeout:
+            raise TimeoutError("ssh command produced no output for %ss" % timeout)
+        time.sleep(0.005)
 
 def ssh_exec(cmd: str):
     if AGENT_DRY_RUN:
         # Safe stub output
-        info = {"cmd": cmd, "stdout": "DRY_RUN: no-op", "stderr": "", "code": 0}
-        raw = json.dumps(info).encode()
-        return {"tool":"ssh_exec", "args":{"cmd":cmd}, "result": info, "sha256": _sha256(raw)}
-    # Real SSH (key-based)
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    client.connect(SSH_HOST, username=SSH_USER, key_filename=SSH_KEY, timeout=8)
-    stdin, stdout, stderr = client.exec_command(cmd, timeout=10)
-    out, err = stdout.read().decode(), stderr.read().decode()
-    code = stdout.channel.recv_exit_status()
-    client.close()
-    info = {"cmd": cmd, "stdout": out, "stderr": err, "code": code}
-    raw = json.dumps(info).encode()
-    return {"tool":"ssh_exec", "args":{"cmd":cmd}, "result": info, "sha256": _sha256(raw)}
-
-def mariadb_query(sql: str):
+        time.sleep(AGENT_DRY_RUN_DELAY_MS / 1000)
+        return _ssh_result(cmd, _captured(b"DRY_RUN: no-op"), _captured(b""), 0)
+    # Real SSH (key-based, pooled transport), 출력은 스트림으로 캡처
+    with _ssh_pool.channel() as chan, _Capture() as out, _Capture() as err:
+        chan.exec_command(cmd)
+        _pump(chan, out.feed, err.feed)
+        code = chan.recv_exit_status()
+    return _ssh_result(cmd, out, err, code)
+
+class _Demux:
+    """batch 출력 스트림을 marker 기준으로 명령별 capture 에 나눠 넣음. marker 뒤 줄의 값은 종료 코드."""
+    def __init__(self, tag: bytes, caps):
+        self.tag, self.caps = tag, caps
+        self.i, self.buf, self.in_rc = 0, b"", False
+        self.codes = []
+
+    def feed(self, data: bytes):
+        self.buf += data
+        while True:
+            if self.in_rc:
+                nl = self.buf.find(b"\n")
+                if nl < 0:
+                    return
+                rc = self.buf[:nl].strip()
+                self.codes.append(int(rc) if rc.lstrip(b"-").isdigit() else -1)
+                self.buf, self.in_rc = self.buf[nl + 1:], False
+                self.i += 1
+                continue
+            k = self.buf.find(self.tag)
+            if k < 0:
+                keep = len(self.tag) - 1  # marker 가 chunk 경계에 걸칠 수 있음
+                if len(self.buf) > keep:
+                    self._emit(self.buf[:len(self.buf) - keep]); self.buf = self.buf[len(self.buf) - keep:]
+                return
+            self._emit(self.buf[:k])
+            self.buf, self.in_rc = self.buf[k + len(self.tag):], True
+
+    def _emit(self, data: bytes):
+        if data and self.i < len(self.caps):
+            self.caps[self.i].feed(data)
+
+    def finish(self):
+        self._emit(self.buf); self.buf = b""
+
+def ssh_exec_batch(cmds):
+    """
+    여러 read-only 명령을 channel 하나(한 번의 round trip)로 실행하고 명령별 결과로 나눠 돌려줌.
+    각 명령 뒤에 stdout/stderr 양쪽으로 종료 코드 marker 를 찍어 구분한다.
+    """
+    if AGENT_DRY_RUN or not cmds:
+        return [ssh_exec(c) for c in cmds]
+    tag = "__SECAGENT_%s__" % uuid.uuid4().hex
+    script = "\n".join("( %s )\nrc=$?; echo \"%s $rc\"; echo \"%s\" >&2" % (c, tag, tag) for c in cmds)
+    outs, errs = [_Capture() for _ in cmds], [_Capture() for _ in cmds]
+    out_mux, err_mux = _Demux(tag.encode(), outs), _Demux(tag.encode(), errs)
+    try:
+        with _ssh_pool.channel() as chan:
+            chan.exec_command("sh -s")
+            chan.sendall((script + "\n").encode()); chan.shutdown_write()
+            _pump(chan, out_mux.feed, err_mux.feed)
+            chan.recv_exit_status()
+        out_mux.finish(); err_mux.finish()
+    except BaseException:
+        for c in outs + errs: c.discard()
+        raise
+    codes = out_mux.codes + [-1] * (len(cmds) - len(out_mux.codes))
+    return [_ssh_result(c, o.close(), e.close(), code) for c, o, e, code in zip(cmds, outs, errs, codes)]
+
+class _DBPool:
+    """
+    pymysql 연결 재사용 풀. 최대 max_size 개까지 열고, idle_sec 넘게 놀던 연결은 닫는다.
+    오래 쉰 연결은 꺼낼 때 ping 으로 확인.
+    """
+    def __init__(self, max_size: int, idle_sec: float):
+        self.idle_sec = idle_sec
+        self._idle = []  # [(conn, last_used)]
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "connects": 0, "evictions": 0, "discarded": 0}
+
+    def _get(self):
+        now = time.time()
+        with self._lock:
+            keep = []
+            for conn, last in self._idle:
+                if now - last > self.idle_sec:
+                    self._close(conn); self.stats["evictions"] += 1
+                else:
+                    keep.append((conn, last))
+            self._idle = keep
+            conn = self._idle.pop()[0] if self._idle else None
+        if conn is not None:
+            try:
+                conn.ping(reconnect=False)
+                self.stats["hits"] += 1
+                return conn
+            except Exception:
+                self._close(conn); self.stats["discarded"] += 1
+        self.stats["misses"] += 1
+        import pymysql
+        conn = pymysql.connect(host=DB_HOST, user=DB_USER, password=DB_PASS, port=DB_PORT,
+                               connect_timeout=5, autocommit=True)
+        self.stats["connects"] += 1
+        return conn
+
+    @staticmethod
+    def _close(conn):
+        try: conn.close()
+        except Exception: pass
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        conn = None
+        reusable = False
+        try:
+            conn = self._get()
+            holder = {"reusable": True}
+            yield conn, holder
+            reusable = holder["reusable"]
+        finally:
+            if conn is not None:
+                if reusable:
+                    with self._lock:
+                        self._idle.append((conn, time.time()))
+                else:
+                    self._close(conn); self.stats["discarded"] += 1
+            self._slots.release()
+
+_db_pool = _DBPool(DB_POOL_MAX, DB_POOL_IDLE_SEC)
+
+def db_pool_stats():
+    return {**_db_pool.stats, "idle": len(_db_pool._idle)}
+
+def _db_json(v):
+    if isinstance(v, (bytes, bytearray)):
+        return v.hex()
+    return str(v)
+
+def mariadb_query(sql: str, max_rows: int = None, max_bytes: int = None):
     if AGENT_DRY_RUN:
+        time.sleep(AGENT_DRY_RUN_DELAY_MS / 1000)
         info = {"sql": sql, "rows": [], "cols": [], "note":"DRY_RUN: no DB connection"}
         raw = json.dumps(info).encode()
         return {"tool":"mariadb_query","args":{"sql":sql},"result":info,"sha256":_sha256(raw)}
-    conn = pymysql.connect(host=DB_HOST, user=DB_USER, password=DB_PASS, port=DB_PORT, connect_timeout=5)
-    cur = conn.cursor()
-    cur.execute(sql)
-    rows = cur.fetchall()
-    cols = [d[0] for d in cur.description] if cur.description else []
-    cur.close(); conn.close()
-    info = {"sql": sql, "rows": rows, "cols": cols}
-    raw = json.dumps(info).encode()
-    return {"tool":"mariadb_query","args":{"sql":sql},"result":info,"sha256":_sha256(raw)}
+    max_rows = DB_MAX_ROWS if max_rows is None else max_rows
+    max_bytes = DB_MAX_BYTES if max_bytes is None else max_bytes
+    # unbuffered(SSCursor) 로 행을 흘려 받으며 전체 스트림은 증분 해시, 메모리에는 예산만큼만 보관
+    rows, kept_bytes, total, complete = [], 0, 0, True
+    import pymysql.cursors
+    with _db_pool.connection() as (conn, holder), _Capture() as cap:
+        cur = conn.cursor(pymysql.cursors.SSCursor)
+        drained = False  # 결과를 끝까지 읽었을 때만 cur.close() (SSCursor 는 close 때 남은 행을 전부 받아 버림)
+        try:
+            cur.execute(sql)
+            cols = [d[0] for d in cur.description] if cur.description else []
+            cap.feed(json.dumps(cols, ensure_ascii=False).encode() + b"\n")
+            while True:
+                batch = cur.fetchmany(500)
+                if not batch:
+                    break
+                for row in batch:
+                    line = json.dumps(list(row), ensure_ascii=False, default=_db_json).encode()
+                    cap.feed(line + b"\n")
+                    total += 1
+                    if len(rows) < max_rows and kept_bytes + len(line) <= max_bytes:
+                        rows.append(json.loads(line)); kept_bytes += len(line)
+                if total >= DB_SCAN_MAX_ROWS:
+                    complete = False
+                    break
+            drained = complete
+        finally:
+            if drained:
+                cur.close()
+            else:
+                # scan 상한/도중 예외: 남은 행을 끝까지 읽지 않도록 연결째 버림
+                holder["reusable"] = False
+    info = {"sql": sql, "rows": rows, "cols": cols,
+            "truncated": len(rows) < total or not complete,
+            "rows_total": total, "rows_kept": len(rows), "bytes_kept": kept_bytes,
+            "stream_complete": complete, "budget": {"max_rows": max_rows, "max_bytes": max_bytes}}
+    if cap.ref:
+        info["ref"] = cap.ref
+    # sha256 = 열 이름 + 모든 행(JSON line) 스트림의 해시. 전체 스트림은 ref 파일에 남아 검증 가능
+    return {"tool":"mariadb_query","args":{"sql":sql},"result":info,"sha256":cap.sha256,"ref":cap.ref}
+
+# ---- cross-job tool result cache (opt-in: TOOL_CACHE=disk|redis) ----
+
+def _target_identity(tool: str, args: dict):
+    """같은 인자라도 실제로 어디에 붙는지가 다르면 다른 결과이므로 key 에 포함."""
+    if tool == "http_check":
+        u = urlsplit(args.get("url", ""))
+        return [u.scheme.lower(), u.netloc.lower()]
+    if tool == "ssh_exec":
+        return [SSH_HOST, SSH_USER, SSH_KEY or ""]
+    if tool == "mariadb_query":
+        return [DB_HOST, DB_PORT, DB_USER]
+    return []
+
+def cache_key(tool: str, args: dict) -> str:
+    raw = json.dumps([tool, args, _target_identity(tool, args), AGENT_DRY_RUN], sort_keys=True, ensure_ascii=False)
+    return _sha256(raw.encode())
+
+_tool_cache = None
+
+def _get_cache():
+    global _tool_cache
+    if _tool_cache is None and TOOL_CACHE in ("disk", "redis"):
+        _tool_cache = make_cache(TOOL_CACHE, TOOL_CACHE_DIR, TOOL_CACHE_MAX_ENTRIES, "secagent:toolcache:")
+    return _tool_cache
+
+def _cache_get(tool: str, args: dict, force_fresh: bool):
+    """반환: (cache|None, key, ttl, hit 결과|None)"""
+    ttl = TOOL_CACHE_TTLS.get(tool, 0)
+    cache = _get_cache() if ttl > 0 else None
+    if cache is None:
+        return None, None, ttl, None
+    key = cache_key(tool, args)
+    if not force_fresh:
+        try:
+            entry = cache.get(key)
+        except Exception:
+            entry = None
+        if entry is not None:
+            out = entry["out"]
+            out["result"] = {**out["result"], "cache_hit": True}
+            out["cache"] = {"hit": True, "collected_at": out["result"].get("collected_at")}
+            return cache, key, ttl, out
+    return cache, key, ttl, None
+
+def _cache_put(cache, key, ttl, out):
+    collected_at = datetime.utcnow().isoformat() + "Z"
+    out["result"] = {**out["result"], "collected_at": collected_at, "cache_hit": False}
+    out["cache"] = {"hit": False, "collected_at": collected_at}
+    try:
+        cache.put(key, {"out": {k: v for k, v in out.items() if k != "cache"}}, ttl)
+    except Exception:
+        pass
+    return out
+
+def cached_call(tool: str, args: dict, fn, force_fresh: bool = False):
+    """
+    tool 결과 캐시. 결과의 sha256/ref 는 원본 그대로 두고,
+    result 에 collected_at(최초 수집 시각)과 cache_hit 을 남겨 재사용 여부를 감사할 수 있게 한다.
+    캐시 장애 시에는 그냥 도구를 실행.
+    """
+    cache, key, ttl, hit = _cache_get(tool, args, force_fresh)
+    if cache is None:
+        return fn()
+    return hit if hit is not None else _cache_put(cache, key, ttl, fn())
+
+async def acached_call(tool: str, args: dict, afn, force_fresh: bool = False):
+    """cached_call 의 async 판. afn() 은 coroutine."""
+    cache, key, ttl, hit = _cache_get(tool, args, force_fresh)
+    if cache is None:
+        return await afn()
+    return hit if hit is not None else _cache_put(cache, key, ttl, await afn())
@@ -0,0 +1,175 @@
+# metrics.py
+# 가벼운 span/timer + in-process histogram/counter, Prometheus text 형식으로 export.
+# - span("tool_call", tool="http_check") 으로 감싸면 소요 시간(초)과 (지정 시) 크기(bytes)를 histogram 에 기록
+# - worker 는 job 이 끝날 때 push() 로 누적분(delta)을 Redis hash 에 더하고,
+#   app 의 /metrics 는 자기 process 값 + Redis 누적값을 합쳐서 내보낸다.
+import bisect, json, threading, time
+from typing import Dict, Tuple, Optional
+from bus import get_redis
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+_PREFIX = "secagent_"
+_REDIS_KEY = "secagent:metrics"
+
+_HELP = {
+    "stage_seconds": "Pipeline stage duration",
+    "tool_call_seconds": "Bridge tool call duration (outcome: hit, miss, error)",
+    "tool_call_bytes": "Captured tool output size",
+    "llm_call_seconds": "LLM call duration (outcome: hit, miss, error)",
+    "db_commit_seconds": "DB commit duration",
+    "report_seconds": "Report request duration (outcome: hit, miss, live)",
+    "report_bytes": "Report response size",
+    "report_render_seconds": "Report rendering in the worker on job completion",
+    "findings": "Findings by control and status",
+    "jobs": "Finished jobs by outcome",
+    "export_rows": "Rows streamed by the NDJSON export",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class _Registry:
+    """name → labels → [bucket counts..., +Inf count, sum] (histogram) 또는 float (counter)."""
+    def __init__(self):
+        self.hist: Dict[str, Dict[Labels, list]] = {}
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, value, labels: Labels, buckets):
+        with self.lock:
+            row = self.hist.setdefault(name, {}).get(labels)
+            if row is None:
+                row = self.hist[name][labels] = [0] * (len(buckets) + 2)
+            row[bisect.bisect_left(buckets, value)] += 1
+            row[-1] += value
+
+    def inc(self, name, labels: Labels, by=1.0):
+        with self.lock:
+            d = self.counters.setdefault(name, {})
+            d[labels] = d.get(labels, 0.0) + by
+
+    def drain(self):
+        with self.lock:
+            hist, counters = self.hist, self.counters
+            self.hist, self.counters = {}, {}
+        return hist, counters
+
+_local = _Registry()    # 이 process 의 전체 누적 (/metrics 용)
+_pending = _Registry()  # 아직 Redis 로 보내지 않은 delta (worker 용)
+
+def _labels(d: Dict) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in d.items() if v is not None))
+
+def _buckets(name: str):
+    return BYTES_BUCKETS if name.endswith("_bytes") else SECONDS_BUCKETS
+
+def observe(name: str, value: float, **labels):
+    lb = _labels(labels)
+    for reg in (_local, _pending):
+        reg.observe(name, value, lb, _buckets(name))
+
+def inc(name: str, by: float = 1.0, **labels):
+    lb = _labels(labels)
+    for reg in (_local, _pending):
+        reg.inc(name, lb, by)
+
+class span:
+    """
+    with span("tool_call", tool="http_check") as sp:
+        ...; sp.size = n; sp.outcome = "hit"
+    종료 시 <name>_seconds (outcome 포함) 와, size 가 있으면 <name>_bytes 를 기록. sp.ms 로 소요 시간 확인.
+    """
+    __slots__ = ("name", "labels", "outcome", "size", "ms", "_t0")
+
+    def __init__(self, name: str, **labels):
+        self.name, self.labels = name, labels
+        self.outcome: Optional[str] = None
+        self.size: Optional[int] = None
+        self.ms = 0.0
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        dur = time.perf_counter() - self._t0
+        self.ms = round(dur * 1000, 2)
+        outcome = "error" if exc_type is not None else (self.outcome or "ok")
+        observe(f"{self.name}_seconds", dur, outcome=outcome, **self.labels)
+        if self.size is not None:
+            observe(f"{self.name}_bytes", self.size, **self.labels)
+        return False
+
+# ---- worker → Redis ----
+
+def push():
+    """쌓인 delta 를 Redis 에 더함 (HINCRBYFLOAT). 실패하면 버림: 지표 때문에 job 을 막지 않는다."""
+    hist, counters = _pending.drain()
+    if not hist and not counters:
+        return
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for name, rows in hist.items():
+            for lb, row in rows.items():
+                for i, v in enumerate(row):
+                    if v:
+                        pipe.hincrbyfloat(_REDIS_KEY, json.dumps(["h", name, lb, i]), v)
+        for name, rows in counters.items():
+            for lb, v in rows.items():
+                pipe.hincrbyfloat(_REDIS_KEY, json.dumps(["c", name, lb]), v)
+        pipe.execute()
+    except Exception:
+        pass
+
+def _merged():
+    """이 process 값 + Redis 누적값 (worker 들)."""
+    with _local.lock:
+        hist = {n: {lb: list(r) for lb, r in rows.items()} for n, rows in _local.hist.items()}
+        counters = {n: dict(rows) for n, rows in _local.counters.items()}
+    try:
+        raw = get_redis().hgetall(_REDIS_KEY)
+    except Exception:
+        raw = {}
+    for k, v in raw.items():
+        key = json.loads(k)
+        lb = tuple(tuple(x) for x in key[2])
+        if key[0] == "h":
+            name, i = key[1], key[3]
+            row = hist.setdefault(name, {}).setdefault(lb, [0] * (len(_buckets(name)) + 2))
+            row[i] += float(v)
+        else:
+            rows = counters.setdefault(key[1], {})
+            rows[lb] = rows.get(lb, 0.0) + float(v)
+    return hist, counters
+
+def _fmt_labels(lb: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in lb] + ([extra] if extra else [])
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+def render() -> str:
+    """Prometheus text exposition format (0.0.4)."""
+    hist, counters = _merged()
+    out = []
+    for name in sorted(hist):
+        full = _PREFIX + name
+        out.append(f"# HELP {full} {_HELP.get(name, name)}")
+        out.append(f"# TYPE {full} histogram")
+        buckets = _buckets(name)
+        for lb, row in sorted(hist[name].items()):
+            acc = 0
+            for le, n in zip(list(buckets) + ["+Inf"], row[:-1]):
+                acc += n
+                le_label = f'le="{le}"'
+                out.append(f"{full}_bucket{_fmt_labels(lb, le_label)} {_num(acc)}")
+            out.append(f"{full}_sum{_fmt_labels(lb)} {_num(row[-1])}")
+            out.append(f"{full}_count{_fmt_labels(lb)} {_num(acc)}")
+    for name in sorted(counters):
+        full = f"{_PREFIX}{name}_total"
+        out.append(f"# HELP {full} {_HELP.get(name, name)}")
+        out.append(f"# TYPE {full} counter")
+        for lb, v in sorted(counters[name].items()):
+            out.append(f"{full}{_fmt_labels(lb)} {_num(v)}")
+    return "\n".join(out) + "\n"
@@ -1,16 +1,44 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from sqlalchemy import JSON
+from sqlalchemy import JSON, event, inspect, text
+from sqlalchemy.engine import Engine
+import sqlite3
+import blobstore
+from config import SQLITE_WAL, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS
 
 db = SQLAlchemy()
 
+@event.listens_for(Engine, "connect")
+def _sqlite_pragmas(dbapi_conn, _):
+    """SQLite 연결마다: WAL(읽기/쓰기 동시 진행), synchronous, busy timeout, 증분 vacuum."""
+    if not isinstance(dbapi_conn, sqlite3.Connection):
+        return
+    cur = dbapi_conn.cursor()
+    # table 이 생기기 전(빈 DB)에만 바로 적용됨. 기존 DB 는 retention.enable_incremental_vacuum 으로 한 번 VACUUM
+    cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS:d}")
+    if SQLITE_WAL:
+        cur.execute("PRAGMA journal_mode=WAL")
+    if SQLITE_SYNCHRONOUS.upper() in ("OFF", "NORMAL", "FULL", "EXTRA"):
+        cur.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS.upper()}")
+    cur.close()
+
 class Job(db.Model):
     __tablename__ = "jobs"
+    __table_args__ = (db.Index("ix_jobs_created_at_id", "created_at", "id"),
+                      db.Index("ix_jobs_fleet_id_id", "fleet_id", "id"),
+                      db.Index("ix_jobs_target_id", "target", "id"))
     id = db.Column(db.Integer, primary_key=True)
+    fleet_id = db.Column(db.Integer, db.ForeignKey("fleets.id"), nullable=True)
     target = db.Column(db.String, nullable=False)
     controls = db.Column(JSON, default=list)
     ike_patches = db.Column(JSON, default=list)
     depth = db.Column(db.String, default="safe")
+    options = db.Column(JSON, default=dict)  # {"force_fresh": bool, ...}
+    priority = db.Column(db.String, default="normal")  # high | normal | low (scheduler lane)
+    submitter = db.Column(db.String, nullable=True)
+    rescan = db.Column(JSON, nullable=True)  # 증분 재검사: {"base_job", "reused": [...], "recomputed": [...]}
+    reports = db.Column(JSON, nullable=True)  # 완료 시 렌더된 보고서 blob sha256: {"json": ..., "pdf": ...}
     status = db.Column(db.String, default="QUEUED")
     progress = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -18,9 +46,9 @@ class Job(db.Model):
 
     def to_dict(self):
         return {
-            "id": self.id, "target": self.target, "controls": self.controls,
-            "ike_patches": self.ike_patches, "depth": self.depth,
-            "status": self.status, "progress": self.progress,
+            "id": self.id, "fleet_id": self.fleet_id, "target": self.target, "controls": self.controls,
+            "ike_patches": self.ike_patches, "depth": self.depth, "options": self.options or {},
+            "priority": self.priority, "submitter": self.submitter, "rescan": self.rescan, "status": self.status, "progress": self.progress,
             "created_at": self.created_at.isoformat(), "updated_at": self.updated_at.isoformat()
         }
 
@@ -31,13 +59,56 @@ class Job(db.Model):
             controls=data.get("controls", []),
             ike_patches=data.get("ike_patches", []),
             depth=data.get("depth", "safe"),
+            options=data.get("options", {}),
+            priority=data.get("priority") or "normal",
+            submitter=data.get("submitter"),
             status="QUEUED",
             progress=0
         )
         return job
 
+class Fleet(db.Model):
+    """
+    여러 target 을 한 번에 스캔하는 campaign. job 완료 시 counter 를 증분 갱신하므로
+    진행률/판정 집계는 findings 를 다시 세지 않고 이 row 만 읽으면 된다.
+    """
+    __tablename__ = "fleets"
+    __table_args__ = (db.Index("ix_fleets_created_at_id", "created_at", "id"),)
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, default="")
+    controls = db.Column(JSON, default=list)
+    depth = db.Column(db.String, default="safe")
+    options = db.Column(JSON, default=dict)
+    batch_size = db.Column(db.Integer, default=25)
+    parallelism = db.Column(db.Integer, default=4)
+    status = db.Column(db.String, default="QUEUED")
+    targets_total = db.Column(db.Integer, default=0)
+    jobs_done = db.Column(db.Integer, default=0)
+    jobs_failed = db.Column(db.Integer, default=0)
+    pass_count = db.Column(db.Integer, default=0)
+    fail_count = db.Column(db.Integer, default=0)
+    na_count = db.Column(db.Integer, default=0)
+    unknown_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        finished = (self.jobs_done or 0) + (self.jobs_failed or 0)
+        return {
+            "id": self.id, "name": self.name, "controls": self.controls, "depth": self.depth,
+            "options": self.options or {}, "batch_size": self.batch_size, "parallelism": self.parallelism,
+            "status": self.status, "targets_total": self.targets_total,
+            "jobs_done": self.jobs_done, "jobs_failed": self.jobs_failed,
+            "progress": round(100 * finished / self.targets_total) if self.targets_total else 0,
+            "summary": {"pass": self.pass_count, "fail": self.fail_count,
+                        "na": self.na_count, "unknown": self.unknown_count},
+            "created_at": self.created_at.isoformat(), "updated_at": self.updated_at.isoformat()
+        }
+
 class Event(db.Model):
     __tablename__ = "events"
+    # AUTOINCREMENT: retention 이 최신 event 를 지워도 id 가 재사용되지 않게 (export watermark, SSE Last-Event-ID)
+    __table_args__ = (db.Index("ix_events_job_id_id", "job_id", "id"), {"sqlite_autoincrement": True})
     id = db.Column(db.Integer, primary_key=True)
     job_id = db.Column(db.Integer, db.ForeignKey("jobs.id"), nullable=False)
     ts = db.Column(db.DateTime, default=datetime.utcnow)
@@ -51,8 +122,34 @@ class Event(db.Model):
             "level": self.level, "message": self.message, "payload": self.payload_json
         }
 
+class EventRollup(db.Model):
+    """
+    retention 으로 archive 된 job 의 event 요약. 원본 event 는 blob (gzip NDJSON) 으로 옮겨지고
+    SSE replay / events API 는 archive 에서 다시 읽는다.
+    """
+    __tablename__ = "event_rollups"
+    job_id = db.Column(db.Integer, db.ForeignKey("jobs.id"), primary_key=True)
+    events = db.Column(db.Integer, default=0)
+    levels = db.Column(JSON, default=dict)    # level → 개수
+    messages = db.Column(JSON, default=dict)  # message (tool_call, tool_done, ...) → 개수
+    first_ts = db.Column(db.DateTime, nullable=True)
+    last_ts = db.Column(db.DateTime, nullable=True)
+    last_event_id = db.Column(db.Integer, default=0)
+    archive_sha = db.Column(db.String, default="")
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id, "events": self.events, "levels": self.levels, "messages": self.messages,
+            "first_ts": self.first_ts.isoformat() if self.first_ts else None,
+            "last_ts": self.last_ts.isoformat() if self.last_ts else None,
+            "last_event_id": self.last_event_id, "archive": blobstore.ref(self.archive_sha),
+            "archived_at": self.archived_at.isoformat()
+        }
+
 class Artifact(db.Model):
     __tablename__ = "artifacts"
+    __table_args__ = (db.Index("ix_artifacts_job_id_id", "job_id", "id"),)
     id = db.Column(db.Integer, primary_key=True)
     job_id = db.Column(db.Integer, db.ForeignKey("jobs.id"), nullable=False)
     type = db.Column(db.String, default="json")
@@ -61,8 +158,30 @@ class Artifact(db.Model):
     meta_json = db.Column(JSON, default=dict)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # meta_json 에는 작은 스칼라 요약만 두고 전체 결과는 blob 으로.
+    # 수집마다 달라지는 값은 blob 에서 빼서 같은 증거가 같은 blob 이 되도록 함
+    SUMMARY_MAX_CHARS = 200
+    VOLATILE_KEYS = ("elapsed_ms", "collected_at", "cache_hit")
+
+    @staticmethod
+    def from_tool_output(job_id, out):
+        result = out["result"]
+        sha = blobstore.put_json({k: v for k, v in result.items() if k not in Artifact.VOLATILE_KEYS})
+        payload_refs = sorted({blobstore.sha_of(v) for v in _iter_strings(result) if blobstore.sha_of(v)})
+        meta = {k: v for k, v in result.items()
+                if isinstance(v, (int, float, bool)) or (isinstance(v, str) and len(v) <= Artifact.SUMMARY_MAX_CHARS)}
+        meta.update(tool=out["tool"], blobs=[sha] + payload_refs)
+        return Artifact(job_id=job_id, type="json", ref=blobstore.ref(sha), sha256=out["sha256"], meta_json=meta)
+
+    def to_dict(self):
+        return {
+            "id": self.id, "job_id": self.job_id, "type": self.type, "ref": self.ref,
+            "sha256": self.sha256, "meta": self.meta_json, "created_at": self.created_at.isoformat()
+        }
+
 class Finding(db.Model):
     __tablename__ = "findings"
+    __table_args__ = (db.Index("ix_findings_job_id_id", "job_id", "id"),)
     id = db.Column(db.Integer, primary_key=True)
     job_id = db.Column(db.Integer, db.ForeignKey("jobs.id"), nullable=False)
     control_id = db.Column(db.String, nullable=False)
@@ -73,3 +192,77 @@ class Finding(db.Model):
     recommendation = db.Column(db.String, default="")
     repro = db.Column(JSON, default=list)
     raw = db.Column(JSON, default=dict)
+    fingerprint = db.Column(db.String, nullable=True)   # control 정의 + 관련 증거 hash (증분 재검사용)
+    reused_from = db.Column(db.Integer, nullable=True)  # 이전 job 의 판정을 복사했으면 그 job id
+
+    def to_dict(self):
+        return {
+            "id": self.id, "job_id": self.job_id, "control_id": self.control_id, "status": self.status,
+            "evidence_refs": self.evidence_refs, "finding": self.finding, "risk": self.risk,
+            "recommendation": self.recommendation, "repro": self.repro, "reused_from": self.reused_from
+        }
+
+def _iter_strings(obj):
+    if isinstance(obj, str):
+        yield obj
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            yield from _iter_strings(v)
+    elif isinstance(obj, list):
+        for v in obj:
+            yield from _iter_strings(v)
+
+def referenced_blobs():
+    """GC 용: artifact, 저장된 보고서, event archive 가 가리키는 모든 blob sha256."""
+    refs = set()
+    for (meta,) in db.session.query(Artifact.meta_json).yield_per(1000):
+        refs.update((meta or {}).get("blobs", []))
+    for (reports,) in db.session.query(Job.reports).filter(Job.reports.isnot(None)).yield_per(1000):
+        refs.update((reports or {}).values())
+    refs.update(sha for (sha,) in db.session.query(EventRollup.archive_sha) if sha)
+    return refs
+
+def upgrade_schema():
+    """
+    create_all 은 이미 있는 테이블에 column/index 를 추가하지 않으므로,
+    모델에는 있고 DB 에는 없는 column(ADD COLUMN)과 index 만 보충한다.
+    SQLite 의 events 는 AUTOINCREMENT table 로 한 번 옮긴다.
+    """
+    db.create_all()
+    insp = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        have = {c["name"] for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name not in have:
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(db.engine.dialect)}"
+                db.session.execute(text(ddl))
+        db.session.commit()
+        for idx in table.indexes:
+            idx.create(db.engine, checkfirst=True)
+    _events_autoincrement()
+
+def _events_autoincrement():
+    """
+    SQLite: AUTOINCREMENT 없이 만들어진 기존 events table 을 다시 만들어 옮기고, sequence 를
+    지금까지 나온 가장 큰 event id (retention 으로 archive 된 것 포함) 위로 올린다.
+    """
+    if db.engine.dialect.name != "sqlite":
+        return
+    table = Event.__table__
+    with db.engine.begin() as conn:
+        sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type='table' AND name='events'")).scalar() or ""
+        if "AUTOINCREMENT" not in sql.upper():
+            cols = ", ".join(c["name"] for c in inspect(conn).get_columns("events") if c["name"] in table.c)
+            for idx in table.indexes:
+                conn.execute(text(f"DROP INDEX IF EXISTS {idx.name}"))
+            conn.execute(text("ALTER TABLE events RENAME TO events_pre_autoincrement"))
+            table.create(conn)
+            conn.execute(text(f"INSERT INTO events ({cols}) SELECT {cols} FROM events_pre_autoincrement"))
+            conn.execute(text("DROP TABLE events_pre_autoincrement"))
+        top = max(conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM events")).scalar(),
+                  conn.execute(text("SELECT COALESCE(MAX(last_event_id), 0) FROM event_rollups")).scalar())
+        seq = conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name='events'")).scalar()
+        if seq is None:
+            conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('events', :s)"), {"s": top})
+        elif seq < top:
+            conn.execute(text("UPDATE sqlite_sequence SET seq=:s WHERE name='events'"), {"s": top})
@@ -0,0 +1,31 @@
+# preload.py
+# worker 예열: pipeline 의 import 그래프와 RAG index 를 한 번 올려 둔다.
+# rq 는 job 마다 work-horse 를 fork 하므로, 부모 process 가 이 module 을 설정 module 로 읽게 하면
+#   rq worker -c preload --with-scheduler jobs-high jobs jobs-low
+# 각 fork 는 import/색인 비용 없이 copy-on-write 로 시작한다. aworker 는 시작 시 warm() 을 부른다.
+import gc, time
+from config import REDIS_URL  # rq -c 설정 module 로 쓰일 때 rq 가 읽는 값
+from config import AGENT_DRY_RUN
+
+def warm() -> dict:
+    """pipeline module + (쓰게 될) 외부 client 라이브러리 import, RAG index 적재. 반환: 단계별 ms."""
+    took = {}
+    t = time.perf_counter()
+    import worker, agent, executor, report  # noqa: F401  (pipeline 전체)
+    import llm_client
+    import requests  # noqa: F401  http_check
+    if llm_client.USE_GPT:
+        import openai  # noqa: F401
+    if not AGENT_DRY_RUN:
+        import paramiko, pymysql.cursors  # noqa: F401
+    took["imports_ms"] = round((time.perf_counter() - t) * 1000, 1)
+    t = time.perf_counter()
+    import rag
+    stats = rag.get_index().stats
+    took["rag_index_ms"] = round((time.perf_counter() - t) * 1000, 1)
+    took["rag_docs"] = stats.get("docs")
+    # 이후 생긴 객체만 GC 가 훑게 해서, fork 된 process 가 공유 page 를 건드려 복사하는 일을 줄임
+    gc.collect(); gc.freeze()
+    return took
+
+WARM = warm()
@@ -1,72 +1,433 @@
 # rag.py
-import os, re, glob
+import os, re, glob, json, time, hashlib, threading
 from dataclasses import dataclass
 from typing import List, Dict, Tuple
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
+import scipy.sparse as sp
 
 DOC_DIR = os.getenv("RAG_DOC_DIR", "docs")
+INDEX_DIR = os.getenv("RAG_INDEX_DIR", ".rag_index")
+REFRESH_SEC = float(os.getenv("RAG_REFRESH_SEC", "5"))
+CHUNK_CHARS = int(os.getenv("RAG_CHUNK_CHARS", "800"))
+CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "200"))
+BM25_K1 = float(os.getenv("RAG_BM25_K1", "1.2"))
+BM25_B = float(os.getenv("RAG_BM25_B", "0.75"))
+
+_TOKEN = re.compile(r"(?u)\b\w\w+\b")  # TfidfVectorizer 기본 token_pattern 과 동일
+_HEADING = re.compile(r"^#{1,6}[ \t]+(.*)$", re.M)
 
 @dataclass
 class Snippet:
     path: str
     text: str
     score: float
+    start: int = 0
+    end: int = 0
+    heading: str = ""
 
-def _load_docs():
-    paths = glob.glob(os.path.join(DOC_DIR, "**/*.*"), recursive=True)
-    items = []
-    for p in paths:
-        if any(p.lower().endswith(ext) for ext in (".md", ".txt")):
-            try:
-                with open(p, "r", encoding="utf-8") as f:
-                    items.append((p, f.read()))
-            except Exception:
-                pass
-    return items
+def _tokens(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
 
-def search(query: str, k: int = 3) -> List[Snippet]:
-    docs = _load_docs()
-    if not docs:
-        return []
-    texts = [t for _, t in docs]
-    vec = TfidfVectorizer(max_features=8000).fit(texts + [query])
-    qv = vec.transform([query])
-    dv = vec.transform(texts)
-    sims = cosine_similarity(qv, dv)[0]
-    ranked = sorted(list(enumerate(sims)), key=lambda x: x[1], reverse=True)[:k]
+def _read(p: str):
+    try:
+        with open(p, "r", encoding="utf-8") as f:
+            return f.read()
+    except Exception:
+        return None
+
+def _doc_paths(doc_dir: str):
+    paths = glob.glob(os.path.join(doc_dir, "**/*.*"), recursive=True)
+    return sorted(p for p in paths if any(p.lower().endswith(ext) for ext in (".md", ".txt")))
+
+def _windows(text: str, start: int, end: int):
+    """[start, end) 구간을 CHUNK_CHARS 크기, CHUNK_OVERLAP 겹침의 윈도우로 자름 (공백 경계에 맞춤)."""
+    step = max(1, CHUNK_CHARS - CHUNK_OVERLAP)
+    s = start
+    while s < end:
+        e = min(end, s + CHUNK_CHARS)
+        if e < end:
+            ws = text.rfind(" ", s + step, e)
+            if ws > s:
+                e = ws
+        yield s, e
+        if e >= end:
+            break
+        s = max(s + 1, e - CHUNK_OVERLAP)
+
+def chunk(text: str) -> List[Tuple[int, int, str]]:
+    """
+    문서를 passage 단위로 분할. 반환: [(start, end, heading)] (문자 offset).
+    heading(#..######) 기준으로 섹션을 나누고, 긴 섹션은 슬라이딩 윈도우로 다시 자른다.
+    """
+    bounds = [(m.start(), m.group(1).strip()) for m in _HEADING.finditer(text)]
+    if not bounds or bounds[0][0] > 0:
+        bounds.insert(0, (0, ""))
     out = []
-    for idx, score in ranked:
-        out.append(Snippet(path=docs[idx][0], text=texts[idx], score=float(score)))
+    for i, (s, heading) in enumerate(bounds):
+        e = bounds[i + 1][0] if i + 1 < len(bounds) else len(text)
+        if not text[s:e].strip():
+            continue
+        for ws, we in _windows(text, s, e):
+            if text[ws:we].strip():
+                out.append((ws, we, heading))
     return out
 
-def control_snippets(control_id: str) -> Dict:
+def _passage_sha(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+Passage = Tuple[str, int, int, str, str]  # (path, start, end, heading, passage sha256[:16])
+
+@dataclass(frozen=True)
+class _Snapshot:
+    """질의가 읽는 상태 한 벌. refresh 는 새 snapshot 을 만들어 참조만 바꿔 끼우고 기존 것은 건드리지 않는다."""
+    vocab: Dict[str, int]
+    passages: List[Passage]
+    idf: np.ndarray
+    postings: sp.csc_matrix
+
+_EMPTY = _Snapshot({}, [], np.zeros(0), sp.csc_matrix((0, 0)))
+_FORMAT = 2  # meta.json 형식 (2: passage 마다 내용 hash)
+
+class RagIndex:
     """
-    control_id(U31/U32/U33 등)에 대한 간단 매핑 + RAG 보강.
+    프로세스 단위 passage BM25 인덱스.
+    passage 별 term count 행렬 + vocabulary 를 디스크에 저장해 두고,
+    파일 추가/변경(mtime/size → sha256)/삭제만 증분 반영한다.
+    postings 는 BM25 tf 가중치를 담은 CSC 행렬(term 열 = posting list)로 두고,
+    질의 시에는 질의 term 열만 꺼내 idf 가중합 → argpartition 으로 top-k.
+    refresh 는 lock 안에서 지역 변수로 새 vocab/행렬/통계를 만든 뒤 _snap 하나로 교체하고,
+    질의는 lock 없이 시작 시 잡은 snapshot 만 읽는다.
     """
-    base = {
-        "U31": {
-            "title": "U31: HSTS header required",
-            "check": "Make an HTTPS request and verify Strict-Transport-Security header exists.",
-            "standard": "HSTS must be present for public endpoints (min 6 months).",
-            "improvement": "Enable HSTS on the web server config."
-        },
-        "U32": {
-            "title": "U32: Content-Security-Policy required",
-            "check": "Check response has Content-Security-Policy header with safe directives.",
-            "standard": "CSP must restrict scripts/styles to trusted origins.",
-            "improvement": "Add CSP header; avoid unsafe-inline unless nonce/hash used."
-        },
-        "U33": {
-            "title": "U33: Clickjacking protection",
-            "check": "Check frame-ancestors via CSP or X-Frame-Options set properly.",
-            "standard": "Use CSP frame-ancestors 'none' or specific allowlist; XFO SAMEORIGIN optional.",
-            "improvement": "Prefer CSP frame-ancestors; remove ALLOW-FROM legacy."
-        }
+    def __init__(self, doc_dir: str = DOC_DIR, index_dir: str = INDEX_DIR):
+        self.doc_dir = doc_dir
+        self.index_dir = index_dir
+        # 아래 셋은 refresh(lock 안) 전용 작업 상태
+        self.vocab: Dict[str, int] = {}
+        self.files: Dict[str, Dict] = {}   # path -> {"mtime","size","sha256","passages":[[s,e,heading,sha]]}
+        self.rows: Dict[str, sp.csr_matrix] = {}  # path -> n_passages x V count rows
+        self._snap = _EMPTY
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self.stats = {"docs": 0, "passages": 0, "terms": 0, "build_ms": 0.0, "added": 0, "changed": 0,
+                      "removed": 0, "queries": 0, "last_query_ms": 0.0, "loaded": False}
+        self._load()
+
+    # ---- persistence ----
+    def _meta_path(self):
+        return os.path.join(self.index_dir, "meta.json")
+
+    def _matrix_path(self):
+        return os.path.join(self.index_dir, "counts.npz")
+
+    def _load(self):
+        try:
+            with open(self._meta_path(), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            counts = sp.load_npz(self._matrix_path()).tocsr()
+        except Exception:
+            return
+        if os.path.abspath(meta.get("doc_dir", "")) != os.path.abspath(self.doc_dir) \
+                or meta.get("chunk") != [CHUNK_CHARS, CHUNK_OVERLAP] or meta.get("format") != _FORMAT:
+            return
+        files, rows, i = {}, {}, 0
+        for fm in meta["files"]:
+            p = fm.pop("path")
+            n = len(fm["passages"])
+            files[p] = fm
+            rows[p] = counts[i:i + n]
+            i += n
+        self.vocab, self.rows, self._snap = self._rebuild(meta["vocab"], files, rows)
+        self.files = files
+        self.stats["loaded"] = True
+
+    def _save(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        meta = {"doc_dir": self.doc_dir, "chunk": [CHUNK_CHARS, CHUNK_OVERLAP], "format": _FORMAT,
+                "vocab": self.vocab, "files": [{"path": p, **self.files[p]} for p in sorted(self.rows)]}
+        tmp = self._meta_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        tmp_npz = self._matrix_path() + ".tmp.npz"
+        sp.save_npz(tmp_npz, _stack(self.rows, len(self.vocab)))
+        os.replace(tmp_npz, self._matrix_path())
+        os.replace(tmp, self._meta_path())
+
+    # ---- build ----
+    @staticmethod
+    def _count_rows(text: str, passages, vocab: Dict[str, int]) -> sp.csr_matrix:
+        """passage 별 term count. 처음 보는 term 은 vocab(작업용 사본)에 추가."""
+        data, indices, indptr = [], [], [0]
+        for s, e, *_ in passages:
+            cols = {}
+            for t in _tokens(text[s:e]):
+                j = vocab.get(t)
+                if j is None:
+                    j = vocab[t] = len(vocab)
+                cols[j] = cols.get(j, 0) + 1
+            indices.extend(cols.keys()); data.extend(cols.values())
+            indptr.append(len(indices))
+        return sp.csr_matrix((np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64),
+                              np.asarray(indptr, dtype=np.int64)), shape=(len(passages), len(vocab)))
+
+    def _rebuild(self, vocab: Dict[str, int], files: Dict[str, Dict], rows: Dict[str, sp.csr_matrix]):
+        """
+        count 행렬에서 새 snapshot 을 만든다. 삭제/변경으로 어느 passage 에도 안 남은 term 은
+        vocab 에서 빼고 열 번호를 당겨서, vocab 이 문서 집합과 함께 줄어들게 한다.
+        반환: (vocab, rows, snapshot) — 모두 새 객체.
+        """
+        n_terms = len(vocab)
+        rows = {p: _fit(r, n_terms) for p, r in rows.items()}
+        counts = _stack(rows, n_terms)
+        df = np.bincount(counts.indices, minlength=n_terms)
+        used = np.flatnonzero(df)
+        if len(used) < n_terms:
+            remap = np.full(n_terms, -1, dtype=np.int64)
+            remap[used] = np.arange(len(used))
+            vocab = {t: int(remap[j]) for t, j in vocab.items() if remap[j] >= 0}
+            rows = {p: r[:, used].tocsr() for p, r in rows.items()}
+            counts, df = counts[:, used].tocsr(), df[used]
+        else:
+            vocab = dict(vocab)
+        passages = [(p, s, e, h, sha) for p in sorted(rows) for s, e, h, sha in files[p]["passages"]]
+        n_pass, n_terms = counts.shape
+        idf = np.log(1.0 + (n_pass - df + 0.5) / (df + 0.5))
+        if n_pass:
+            # BM25 tf 부분: tf*(k1+1) / (tf + k1*(1-b+b*dl/avgdl))
+            dl = np.asarray(counts.sum(axis=1)).ravel()
+            avgdl = dl.mean() or 1.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * dl / avgdl)
+            tf = counts.data
+            w = counts.copy()
+            w.data = tf * (BM25_K1 + 1) / (tf + np.repeat(norm, np.diff(counts.indptr)))
+            postings = w.tocsc()
+        else:
+            postings = sp.csc_matrix((0, n_terms))
+        self.stats.update(docs=len(rows), passages=n_pass, terms=n_terms)
+        return vocab, rows, _Snapshot(vocab, passages, idf, postings)
+
+    def refresh(self, force: bool = False) -> bool:
+        """DOC_DIR 변경분만 반영. 변경이 있으면 True."""
+        now = time.time()
+        if not force and now - self._checked < REFRESH_SEC:
+            return False
+        with self._lock:
+            self._checked = now
+            t0 = time.perf_counter()
+            added = changed = removed = 0
+            seen = set()
+            vocab, files, rows = dict(self.vocab), dict(self.files), dict(self.rows)
+            for p in _doc_paths(self.doc_dir):
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                seen.add(p)
+                fm = files.get(p)
+                if fm and fm["mtime"] == st.st_mtime and fm["size"] == st.st_size:
+                    continue
+                text = _read(p)
+                if text is None:
+                    continue
+                digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                if fm and fm["sha256"] == digest:
+                    files[p] = {**fm, "mtime": st.st_mtime, "size": st.st_size}  # touch 만 된 경우
+                    continue
+                passages = [[s, e, h, _passage_sha(text[s:e])] for s, e, h in chunk(text)]
+                rows[p] = self._count_rows(text, passages, vocab)
+                files[p] = {"mtime": st.st_mtime, "size": st.st_size, "sha256": digest, "passages": passages}
+                if fm: changed += 1
+                else: added += 1
+            for p in [p for p in files if p not in seen]:
+                files.pop(p); rows.pop(p, None)
+                removed += 1
+            dirty = bool(added or changed or removed)
+            if dirty:
+                vocab, rows, snap = self._rebuild(vocab, files, rows)
+                self.vocab, self.rows, self._snap = vocab, rows, snap
+            self.files = files
+            if dirty or not os.path.exists(self._meta_path()):
+                try:
+                    self._save()
+                except OSError:
+                    pass
+            if dirty:
+                self.stats.update(build_ms=round((time.perf_counter() - t0) * 1000, 2),
+                                  added=added, changed=changed, removed=removed)
+            return dirty
+
+    # ---- query (모두 snapshot 하나만 읽음) ----
+    @staticmethod
+    def _query_terms(snap: _Snapshot, query: str) -> Dict[int, int]:
+        tf = {}
+        for t in _tokens(query):
+            j = snap.vocab.get(t)
+            if j is not None:
+                tf[j] = tf.get(j, 0) + 1
+        return tf
+
+    def score(self, query: str, snap: _Snapshot = None) -> np.ndarray:
+        """질의 term 의 posting list 만 읽어 passage 별 BM25 점수 계산."""
+        snap = snap or self._snap
+        tf = self._query_terms(snap, query)
+        if not tf:
+            return np.zeros(len(snap.passages))
+        cols = np.fromiter(tf.keys(), dtype=np.int64, count=len(tf))
+        qw = snap.idf[cols] * np.fromiter(tf.values(), dtype=np.float64, count=len(tf))
+        return snap.postings[:, cols] @ qw
+
+    def transform(self, queries: List[str], snap: _Snapshot = None) -> sp.csr_matrix:
+        """질의들을 (n_queries x V) idf 가중 행렬로 변환."""
+        snap = snap or self._snap
+        data, indices, indptr = [], [], [0]
+        for q in queries:
+            tf = self._query_terms(snap, q)
+            indices.extend(tf.keys())
+            data.extend(snap.idf[j] * c for j, c in tf.items())
+            indptr.append(len(indices))
+        return sp.csr_matrix((np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64),
+                              np.asarray(indptr, dtype=np.int64)), shape=(len(queries), len(snap.vocab)))
+
+    def search_batch(self, queries: List[str], k: int = 3) -> List[List[Tuple[Passage, float]]]:
+        """여러 질의를 한 번의 sparse 행렬곱 (Q @ W^T) 으로 채점하고 질의별 top-k 반환."""
+        self.refresh()
+        snap = self._snap
+        t0 = time.perf_counter()
+        out = [[] for _ in queries]
+        if snap.passages and queries:
+            scores = (self.transform(queries, snap) @ snap.postings.T).tocsr()
+            for i in range(len(queries)):
+                s, e = scores.indptr[i], scores.indptr[i + 1]
+                row = np.zeros(len(snap.passages))
+                row[scores.indices[s:e]] = scores.data[s:e]
+                out[i] = [(snap.passages[j], sc) for j, sc in _top_k(row, k)] if e > s else []
+        self.stats["queries"] += len(queries)
+        self.stats["last_query_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        return out
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[Passage, float]]:
+        """반환: [(passage, score)] 점수 내림차순."""
+        self.refresh()
+        snap = self._snap
+        t0 = time.perf_counter()
+        out = []
+        if snap.passages:
+            out = [(snap.passages[j], sc) for j, sc in _top_k(self.score(query, snap), k)]
+        self.stats["queries"] += 1
+        self.stats["last_query_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        return out
+
+def _fit(r: sp.csr_matrix, n: int) -> sp.csr_matrix:
+    """열 수를 n 으로 맞춘 사본 (이전 snapshot 이 쥔 행렬은 건드리지 않음)."""
+    if r.shape[1] == n:
+        return r
+    r = r.copy()
+    r.resize((r.shape[0], n))
+    return r
+
+def _stack(rows: Dict[str, sp.csr_matrix], n: int) -> sp.csr_matrix:
+    if not rows:
+        return sp.csr_matrix((0, n))
+    return sp.vstack([_fit(rows[p], n) for p in sorted(rows)], format="csr")
+
+def _top_k(scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+    """전체 정렬 없이 argpartition 으로 상위 k 개만 추림 (0점 passage 제외)."""
+    nz = np.flatnonzero(scores > 0)
+    if not len(nz):
+        return []
+    if len(nz) > k:
+        nz = nz[np.argpartition(-scores[nz], k - 1)[:k]]
+    nz = nz[np.argsort(-scores[nz], kind="stable")]
+    return [(int(i), float(scores[i])) for i in nz]
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index() -> RagIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = RagIndex()
+                _index.refresh(force=True)
+    return _index
+
+def index_stats() -> Dict:
+    return dict(get_index().stats)
+
+def _snippets(hits: List[Tuple[Passage, float]]) -> List[Snippet]:
+    """hit 구간을 파일에서 잘라 옴. 색인 후 파일이 바뀌어 구간 hash 가 안 맞으면 그 hit 은 버린다."""
+    out, texts = [], {}
+    for (path, s, e, heading, sha), score in hits:
+        if path not in texts:
+            texts[path] = _read(path)
+        text = texts[path]
+        if text is None or _passage_sha(text[s:e]) != sha:
+            continue
+        out.append(Snippet(path=path, text=text[s:e], score=score, start=s, end=e, heading=heading))
+    return out
+
+def search(query: str, k: int = 3) -> List[Snippet]:
+    return _snippets(get_index().search(query, k))
+
+CONTROLS = {
+    "U31": {
+        "title": "U31: HSTS header required",
+        "check": "Make an HTTPS request and verify Strict-Transport-Security header exists.",
+        "standard": "HSTS must be present for public endpoints (min 6 months).",
+        "improvement": "Enable HSTS on the web server config."
+    },
+    "U32": {
+        "title": "U32: Content-Security-Policy required",
+        "check": "Check response has Content-Security-Policy header with safe directives.",
+        "standard": "CSP must restrict scripts/styles to trusted origins.",
+        "improvement": "Add CSP header; avoid unsafe-inline unless nonce/hash used."
+    },
+    "U33": {
+        "title": "U33: Clickjacking protection",
+        "check": "Check frame-ancestors via CSP or X-Frame-Options set properly.",
+        "standard": "Use CSP frame-ancestors 'none' or specific allowlist; XFO SAMEORIGIN optional.",
+        "improvement": "Prefer CSP frame-ancestors; remove ALLOW-FROM legacy."
+    },
+    "U01": {
+        "title": "U01: Remote root login restricted",
+        "check": "Inspect sshd_config and verify PermitRootLogin is set to no.",
+        "standard": "Direct root login over SSH must be disabled.",
+        "improvement": "Set PermitRootLogin no and use sudo from a named account."
+    },
+    "D01": {
+        "title": "D01: No anonymous database accounts",
+        "check": "Query mysql.user for accounts with an empty user name.",
+        "standard": "Anonymous MariaDB/MySQL accounts must not exist.",
+        "improvement": "Drop anonymous accounts (mysql_secure_installation)."
     }
-    c = base.get(control_id.upper(), {"title": control_id, "check":"N/A","standard":"","improvement":""})
-    # RAG 보강: control_id로 검색해서 상위 스니펫 일부만 붙임
-    hits = search(control_id)
+}
+
+def _control_base(control_id: str) -> Dict:
+    return dict(CONTROLS.get(control_id.upper(), {"title": control_id, "check":"N/A","standard":"","improvement":""}))
+
+def _control_query(control_id: str, c: Dict) -> str:
+    return " ".join([control_id, c.get("title", ""), c.get("check", "") if c.get("check") != "N/A" else ""])
+
+def _attach(c: Dict, hits: List[Snippet]) -> Dict:
     if hits:
-        c["rag_support"] = [{"path": h.path, "score": h.score, "excerpt": h.text[:600]} for h in hits]
+        c["rag_support"] = [{"path": h.path, "score": h.score, "heading": h.heading,
+                             "start": h.start, "end": h.end, "excerpt": h.text} for h in hits]
     return c
+
+def control_snippets(control_id: str) -> Dict:
+    """
+    control_id(U31/U32/U33 등)에 대한 간단 매핑 + RAG 보강.
+    """
+    c = _control_base(control_id)
+    # RAG 보강: control_id + 점검 항목으로 passage 검색, 해당 구간만 offset 과 함께 붙임
+    return _attach(c, search(_control_query(control_id, c)))
+
+def control_snippets_batch(control_ids: List[str], k: int = 3) -> Dict[str, Dict]:
+    """
+    control_snippets 의 배치 버전. 모든 control 질의를 한 번의 행렬곱으로 채점한다.
+    반환: {control_id: control_snippets(control_id) 와 같은 dict}
+    """
+    ids = list(dict.fromkeys(control_ids))
+    bases = [_control_base(cid) for cid in ids]
+    hits = get_index().search_batch([_control_query(cid, c) for cid, c in zip(ids, bases)], k)
+    return {cid: _attach(c, _snippets(h)) for cid, c, h in zip(ids, bases, hits)}
@@ -1,16 +1,26 @@
 # report.py
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
+# 보고서(JSON/PDF)는 job 이 끝날 때 worker 가 한 번 렌더해 blobstore 에 내용 주소로 저장하고
+# (job.reports), 요청은 저장된 blob 을 sha256 ETag 와 함께 그대로 내보낸다.
+import io, threading
 from datetime import datetime
+from sqlalchemy import func
+from models import db, Finding
+import blobstore
 
-def build_pdf(path: str, title: str, meta: dict, findings: list, summary: dict):
-    c = canvas.Canvas(path, pagesize=A4)
+KINDS = ("json", "pdf")
+_locks = [threading.Lock() for _ in range(64)]  # job id 로 나눠 쓰는 렌더 lock
+
+def build_pdf(out, title: str, meta: dict, findings: list, summary: dict, generated: datetime = None):
+    """out: 파일 경로 또는 file object. invariant 라서 같은 입력이면 같은 bytes (→ 같은 blob)."""
+    from reportlab.lib.pagesizes import A4  # 지연 import: PDF 를 만드는 process 만 reportlab 을 올림
+    from reportlab.pdfgen import canvas
+    c = canvas.Canvas(out, pagesize=A4, invariant=1)
     w, h = A4
     y = h - 40
     c.setFont("Helvetica-Bold", 16)
     c.drawString(40, y, title); y -= 20
     c.setFont("Helvetica", 10)
-    c.drawString(40, y, f"Generated: {datetime.utcnow().isoformat()}Z"); y -= 14
+    c.drawString(40, y, f"Generated: {(generated or datetime.utcnow()).isoformat()}Z"); y -= 14
     for k,v in meta.items():
         c.drawString(40, y, f"{k}: {v}"); y -= 12
     y -= 10
@@ -36,3 +46,43 @@ def _wrap(text, width):
         if len(" ".join(line)) > width:
             yield " ".join(line); line = []
     if line: yield " ".join(line)
+
+def status_summary(job_id) -> dict:
+    """status 별 finding 수 (DB 에서 GROUP BY)."""
+    summary = {"pass": 0, "fail": 0, "na": 0, "unknown": 0}
+    rows = (db.session.query(Finding.status, func.count(Finding.id))
+            .filter(Finding.job_id == job_id).group_by(Finding.status))
+    summary.update({status: n for status, n in rows})
+    return summary
+
+def render(job, kind: str) -> bytes:
+    summary = status_summary(job.id)
+    if kind == "json":
+        items = [raw for (raw,) in db.session.query(Finding.raw).filter(Finding.job_id == job.id).order_by(Finding.id)]
+        return blobstore.dumps({"items": items, "summary": summary})
+    findings = Finding.query.filter_by(job_id=job.id).order_by(Finding.id).all()
+    meta = {"Target": job.target, "Controls": ",".join(job.controls or []), "JobID": str(job.id)}
+    buf = io.BytesIO()
+    build_pdf(buf, "Security Check Report", meta, findings, summary, generated=job.updated_at)
+    return buf.getvalue()
+
+def store(job) -> dict:
+    """두 형식을 렌더해 blob 으로 저장하고 job.reports 에 기록 (DONE job 만, worker 가 완료 시 호출)."""
+    reports = {kind: blobstore.put_bytes(render(job, kind)) for kind in KINDS}
+    job.reports = reports; db.session.commit()
+    return reports
+
+def stored(job, kind: str):
+    """
+    저장된 보고서 sha256 (hit 여부와 함께). 없으면(이전 job, 렌더 실패) 한 번 렌더해 저장.
+    같은 process 의 동시 요청은 lock 으로 한 번만 렌더하고, process 간 중복은 내용 주소라 무해하다.
+    """
+    sha = (job.reports or {}).get(kind)
+    if sha and blobstore.exists(sha):
+        return sha, True
+    with _locks[job.id % len(_locks)]:
+        db.session.refresh(job)
+        sha = (job.reports or {}).get(kind)
+        if sha and blobstore.exists(sha):
+            return sha, True
+        return store(job)[kind], False
@@ -0,0 +1,152 @@
+# retention.py
+# events 테이블 보존 정책. 끝난 지 EVENT_RETENTION_DAYS 가 지난 job 의 event 를
+#  1) job 별 요약(EventRollup: level/message 별 개수, 시각 범위)으로 접고
+#  2) 원본은 gzip NDJSON blob 으로 옮긴 뒤 (SSE replay / events API 는 여기서 다시 읽음)
+#  3) events 에서 지우고, SQLite 면 비워진 page 를 incremental_vacuum 으로 조금씩 돌려준다.
+#   flask --app app retention [--days N] [--dry-run] [--schedule]
+import hashlib, json, os, tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import delete, exists, select
+from models import db, Job, Event, EventRollup
+from bus import get_redis
+import blobstore
+from config import (BLOB_DIR, EVENT_RETENTION_DAYS, EVENT_RETENTION_BATCH, EVENT_RETENTION_VACUUM_PAGES,
+                    EVENT_RETENTION_INTERVAL_SEC)
+
+_SCHEDULE_KEY = "secagent:retention:scheduled"
+
+def eligible_jobs(cutoff: datetime, limit: int):
+    """cutoff 전에 끝났고 아직 archive 되지 않은, event 가 남아 있는 job id (오래된 순)."""
+    q = (select(Job.id).where(Job.status.in_(("DONE", "FAILED")), Job.updated_at < cutoff,
+                              ~exists().where(EventRollup.job_id == Job.id),
+                              exists().where(Event.job_id == Job.id))
+         .order_by(Job.id).limit(limit))
+    return [jid for (jid,) in db.session.execute(q)]
+
+def archive_job(job_id: int) -> EventRollup:
+    """job 의 event 를 blob 으로 옮기고 rollup 을 추가 (commit 은 호출자가)."""
+    rollup = EventRollup(job_id=job_id, events=0, levels={}, messages={})
+    h = hashlib.sha256()
+    os.makedirs(os.path.join(BLOB_DIR, "tmp"), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.join(BLOB_DIR, "tmp"), suffix=".ndjson")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            q = select(Event).where(Event.job_id == job_id).order_by(Event.id).execution_options(yield_per=1000)
+            for (e,) in db.session.execute(q):
+                line = (json.dumps(e.to_json(), ensure_ascii=False, sort_keys=True) + "\n").encode()
+                f.write(line); h.update(line)
+                rollup.events += 1
+                rollup.levels[e.level] = rollup.levels.get(e.level, 0) + 1
+                rollup.messages[e.message] = rollup.messages.get(e.message, 0) + 1
+                rollup.first_ts = rollup.first_ts or e.ts
+                rollup.last_ts, rollup.last_event_id = e.ts, e.id
+        rollup.archive_sha = blobstore.put_file(tmp, h.hexdigest())
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    db.session.add(rollup)
+    db.session.execute(delete(Event).where(Event.job_id == job_id, Event.id <= rollup.last_event_id))
+    return rollup
+
+def run(days: float = EVENT_RETENTION_DAYS, batch: int = EVENT_RETENTION_BATCH,
+        vacuum_pages: int = EVENT_RETENTION_VACUUM_PAGES, dry_run: bool = False) -> dict:
+    """
+    batch 개 job 씩 archive 후 commit (쓰기 lock 을 짧게). 다 끝나면 incremental vacuum.
+    dry_run 이면 대상 job 수만 센다.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    stats = {"jobs": 0, "events": 0, "archive_bytes": 0, "vacuumed_pages": 0}
+    if dry_run:
+        stats["jobs"] = len(eligible_jobs(cutoff, 10 ** 9))
+        return stats
+    while True:
+        ids = eligible_jobs(cutoff, batch)
+        if not ids:
+            break
+        for jid in ids:
+            r = archive_job(jid)
+            stats["jobs"] += 1; stats["events"] += r.events
+            stats["archive_bytes"] += os.path.getsize(blobstore.path_of(r.archive_sha))
+        db.session.commit()
+    stats["vacuumed_pages"] = vacuum(vacuum_pages)
+    return stats
+
+def _is_sqlite() -> bool:
+    return db.engine.dialect.name == "sqlite"
+
+def vacuum(max_pages: int = EVENT_RETENTION_VACUUM_PAGES) -> int:
+    """SQLite: 빈 page 를 최대 max_pages 개 파일에서 돌려주고 WAL 을 비움. 반환: 돌려준 page 수."""
+    if not _is_sqlite() or max_pages <= 0:
+        return 0
+    raw = db.engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        before = cur.execute("PRAGMA freelist_count").fetchone()[0]
+        raw.commit()
+        # execute() 는 statement 를 한 step 만 돌려 page 하나만 풀리므로 executescript 로 끝까지
+        cur.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+        after = cur.execute("PRAGMA freelist_count").fetchone()[0]
+        cur.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        return before - after
+    finally:
+        raw.close()
+
+def enable_incremental_vacuum() -> bool:
+    """기존 SQLite DB 를 auto_vacuum=INCREMENTAL 로 전환 (전체 VACUUM 한 번). 이미 켜져 있으면 False."""
+    if not _is_sqlite():
+        return False
+    raw = db.engine.raw_connection()
+    try:
+        raw.isolation_level = None  # VACUUM 은 transaction 밖에서
+        cur = raw.cursor()
+        if cur.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return False
+        cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cur.execute("VACUUM")
+        return True
+    finally:
+        raw.isolation_level = ""
+        raw.close()
+
+# ---- replay ----
+
+def iter_archived(job_id, after: int = 0):
+    """archive 된 event (to_json 형식) 중 id > after."""
+    rollup = db.session.get(EventRollup, int(job_id)) if str(job_id).isdigit() else None
+    if rollup is None or not rollup.archive_sha or rollup.last_event_id <= after:
+        return
+    with blobstore.open_blob(rollup.archive_sha) as f:
+        for line in f:
+            ev = json.loads(line)
+            if ev["id"] > after:
+                yield ev
+
+def replay(job_id, after: int = 0):
+    """job 의 event 를 id 순으로: archive 분 다음 events 테이블 분."""
+    for ev in iter_archived(job_id, after):
+        after = ev["id"]
+        yield ev
+    for e in (Event.query.filter(Event.job_id == job_id, Event.id > after)
+              .order_by(Event.id.asc()).yield_per(500)):
+        yield e.to_json()
+
+# ---- 주기 실행 (RQ) ----
+
+def schedule(interval: float = EVENT_RETENTION_INTERVAL_SEC) -> bool:
+    """주기 task 를 시작 (이미 돌고 있으면 아무것도 안 함). rq worker --with-scheduler 필요."""
+    import scheduler
+    if interval <= 0 or not get_redis().set(_SCHEDULE_KEY, "1", nx=True, ex=int(interval * 3)):
+        return False
+    scheduler.queue("low").enqueue("retention.run_periodic", interval)
+    return True
+
+def run_periodic(interval: float = EVENT_RETENTION_INTERVAL_SEC):
+    """retention 한 번 실행 후 interval 뒤로 자신을 다시 등록."""
+    import scheduler
+    from app import app
+    get_redis().set(_SCHEDULE_KEY, "1", ex=int(interval * 3))
+    try:
+        with app.app_context():
+            return run()
+    finally:
+        scheduler.queue("low").enqueue_in(timedelta(seconds=interval), "retention.run_periodic", interval)
@@ -0,0 +1,176 @@
+# rules.py
+# 오프라인 판정용 선언형 규칙 엔진.
+# control 규칙은 데이터(RULES)로 정의하고 import 시 한 번 matcher 로 컴파일한다.
+# 증거는 (tool, key) 로 색인해서 규칙마다 조회 한 번으로 판정.
+import re
+from typing import List, Dict, Tuple, Optional
+
+# check: pass 조건. fail_when 이 있으면 둘 다 아닐 때는 "애매함" → LLM 으로 넘김 (없으면 check 불만족 = fail)
+# key: 어떤 증거를 볼지 (http_check 는 생략 시 모든 응답 헤더를 합쳐서 봄, ssh_exec=cmd, mariadb_query=sql)
+RULES = [
+    {"control": "U31", "tool": "http_check",
+     "check": {"header_present": "strict-transport-security"},
+     "pass": {"finding": "HSTS present"},
+     "fail": {"finding": "HSTS missing", "risk": "Downgrade/SSL stripping risk"},
+     "recommendation": "Add HSTS header", "repro": "curl -I {url}"},
+    {"control": "U32", "tool": "http_check",
+     "check": {"header_present": "content-security-policy"},
+     "pass": {"finding": "CSP present"},
+     "fail": {"finding": "CSP missing", "risk": "XSS/MiTM risk"},
+     "recommendation": "Add CSP with strict directives", "repro": "curl -I {url}"},
+    {"control": "U33", "tool": "http_check",
+     "check": {"any": [{"header_present": "x-frame-options"},
+                       {"header_matches": ["content-security-policy", r"(?i)frame-ancestors"]}]},
+     "pass": {"finding": "Clickjacking protection present"},
+     "fail": {"finding": "No clickjacking protection", "risk": "UI redress attack risk"},
+     "recommendation": "Set CSP frame-ancestors or X-Frame-Options", "repro": "curl -I {url}"},
+    {"control": "U01", "tool": "ssh_exec",
+     "key": "grep -Ei '^[[:space:]]*PermitRootLogin' /etc/ssh/sshd_config",
+     "check": {"stdout_matches": r"(?im)^\s*PermitRootLogin\s+no\b"},
+     "fail_when": {"stdout_matches": r"(?im)^\s*PermitRootLogin\s+yes\b"},
+     "pass": {"finding": "Root login over SSH disabled"},
+     "fail": {"finding": "Root login over SSH allowed", "risk": "Direct root compromise via SSH"},
+     "recommendation": "Set 'PermitRootLogin no' in sshd_config and reload sshd", "repro": "{cmd}"},
+    {"control": "D01", "tool": "mariadb_query",
+     "key": "SELECT user, host FROM mysql.user WHERE user = ''",
+     "check": {"row_count_max": 0},
+     "pass": {"finding": "No anonymous DB accounts"},
+     "fail": {"finding": "Anonymous DB accounts exist", "risk": "Unauthenticated DB access"},
+     "recommendation": "DROP USER ''@'<host>' for every anonymous account", "repro": "{sql}"},
+]
+
+_KEY_FIELD = {"http_check": "url", "ssh_exec": "cmd", "mariadb_query": "sql"}
+
+class _Ev:
+    """증거 하나의 조회용 view. 헤더는 소문자 dict 로 한 번만 만든다."""
+    __slots__ = ("tool", "result", "sha256s", "headers")
+
+    def __init__(self, tool, result, sha256s, headers=None):
+        self.tool, self.result, self.sha256s = tool, result, sha256s
+        self.headers = headers if headers is not None else \
+            {k.lower(): v for k, v in (result.get("headers") or {}).items()}
+
+def _is_dry_run(result: Dict) -> bool:
+    return str(result.get("stdout", "")).startswith("DRY_RUN") or str(result.get("note", "")).startswith("DRY_RUN")
+
+class EvidenceIndex:
+    """(tool, key) → 증거. http_check 는 key 없는 조회용으로 전체 헤더를 합친 view 도 만든다."""
+    def __init__(self, evidence: List[Dict]):
+        self.by_key: Dict[Tuple[str, str], _Ev] = {}
+        merged, shas, first_url = {}, [], ""
+        for ev in evidence:
+            tool, result = ev.get("tool"), ev.get("result") or {}
+            if _is_dry_run(result):
+                continue  # 실제로 수집되지 않은 증거로는 판정하지 않음
+            view = _Ev(tool, result, [ev.get("sha256", "")])
+            self.by_key.setdefault((tool, str(result.get(_KEY_FIELD.get(tool, ""), ""))), view)
+            if tool == "http_check":
+                merged.update(view.headers); shas.append(ev.get("sha256", ""))
+                first_url = first_url or result.get("url", "")
+        self.http_merged = _Ev("http_check", {"url": first_url}, shas, merged) if shas else None
+
+    def get(self, tool: str, key: Optional[str]) -> Optional[_Ev]:
+        if tool == "http_check" and key is None:
+            return self.http_merged
+        return self.by_key.get((tool, key or ""))
+
+# ---- 조건 컴파일 ----
+
+def _compile(cond: Dict):
+    (op, arg), = cond.items()
+    if op == "any":
+        subs = [_compile(c) for c in arg]
+        return lambda ev: any(f(ev) for f in subs)
+    if op == "all":
+        subs = [_compile(c) for c in arg]
+        return lambda ev: all(f(ev) for f in subs)
+    if op == "not":
+        sub = _compile(arg)
+        return lambda ev: not sub(ev)
+    if op == "header_present":
+        name = arg.lower()
+        return lambda ev: name in ev.headers
+    if op == "header_matches":
+        name, rx = arg[0].lower(), re.compile(arg[1])
+        return lambda ev: name in ev.headers and rx.search(str(ev.headers[name])) is not None
+    if op == "stdout_matches":
+        rx = re.compile(arg)
+        return lambda ev: rx.search(str(ev.result.get("stdout", ""))) is not None
+    if op == "exit_code":
+        return lambda ev: ev.result.get("code") == arg
+    if op == "row_count_max":
+        return lambda ev: ev.result.get("rows_total", len(ev.result.get("rows") or [])) <= arg
+    if op == "rows_match":
+        col, rx = arg["col"], re.compile(arg["regex"])
+        def rows_match(ev):
+            cols = ev.result.get("cols") or []
+            if col not in cols:
+                return False
+            i = cols.index(col)
+            return any(rx.search(str(r[i])) for r in ev.result.get("rows") or [])
+        return rows_match
+    raise ValueError(f"unknown rule condition: {op}")
+
+class CompiledRule:
+    def __init__(self, spec: Dict):
+        self.spec = spec
+        self.control = spec["control"].upper()
+        self.tool = spec["tool"]
+        self.key = spec.get("key")
+        self.passes = _compile(spec["check"])
+        self.fails = _compile(spec["fail_when"]) if "fail_when" in spec else None
+
+    def collect_step(self, target: str) -> Dict:
+        """이 규칙에 필요한 증거를 모으는 plan step."""
+        if self.tool == "http_check":
+            return {"tool": "http_check", "args": {"url": self.key or target}}
+        return {"tool": self.tool, "args": {_KEY_FIELD[self.tool]: self.key}}
+
+    def evaluate(self, control_id: str, index: EvidenceIndex) -> Optional[Dict]:
+        """판정 item, 증거가 없거나 애매하면 None."""
+        ev = index.get(self.tool, self.key)
+        if ev is None:
+            return None
+        if self.passes(ev):
+            status = "pass"
+        elif self.fails is None or self.fails(ev):
+            status = "fail"
+        else:
+            return None
+        out = self.spec[status]
+        return {"control_id": control_id, "status": status, "evidence_refs": [s for s in ev.sha256s if s],
+                "finding": out.get("finding", ""), "risk": out.get("risk", ""),
+                "recommendation": self.spec.get("recommendation", ""),
+                "repro": [self.spec["repro"].format(**{k: ev.result.get(k, "") for k in ("url", "cmd", "sql")})]
+                         if self.spec.get("repro") else []}
+
+def compile_rules(specs: List[Dict]) -> Dict[str, CompiledRule]:
+    return {r.control: r for r in (CompiledRule(s) for s in specs)}
+
+COMPILED = compile_rules(RULES)
+
+def has_rule(control_id: str) -> bool:
+    return control_id.upper() in COMPILED
+
+def collect_steps(control_ids: List[str], target: str) -> List[Dict]:
+    """규칙이 필요로 하는 수집 step. "control" 은 어느 control 의 step 인지 (tool_call span label 용)."""
+    return [{**COMPILED[c.upper()].collect_step(target), "control": c} for c in control_ids if c.upper() in COMPILED]
+
+def evaluate(controls, evidence: List[Dict]) -> Tuple[List[Dict], Dict[str, str]]:
+    """
+    모든 control 을 한 번에 판정.
+    반환: (판정된 items, {control_id: 미판정 사유})  사유: "no rule" | "evidence missing" | "ambiguous"
+    """
+    index = EvidenceIndex(evidence)
+    items, pending = [], {}
+    for cid in controls:
+        rule = COMPILED.get(cid.upper())
+        if rule is None:
+            pending[cid] = "no rule"
+            continue
+        item = rule.evaluate(cid, index)
+        if item is None:
+            pending[cid] = "evidence missing" if index.get(rule.tool, rule.key) is None else "ambiguous"
+        else:
+            items.append(item)
+    return items, pending
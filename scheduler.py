@@ -0,0 +1,273 @@
+# scheduler.py
+# RQ 위의 scheduling 계층.
+# - priority lane: jobs-high / jobs / jobs-low (worker 는 `rq worker jobs-high jobs jobs-low` 순서로 dequeue)
+# - submitter 공정성: lane 안에서는 submitter 별 대기열을 round-robin 으로 꺼내고,
+#   제출자별 active job 이 상한을 넘으면 low lane 으로 강등
+# - target semaphore: 같은 host 에 동시에 도는 job 수 제한 (Redis sorted set lease), 바쁘면 지연 재등록
+# - token bucket: host 별 / 도구별 호출 속도 제한 (Redis Lua, 부족하면 대기)
+# Redis 장애 시에는 전부 통과시킨다 (bus.py 와 같은 fail-open).
+import time, uuid
+from datetime import timedelta, datetime, timezone
+from urllib.parse import urlparse
+from bus import get_redis
+from config import (SCHED_HIGH_MAX_CONTROLS, SCHED_SUBMITTER_MAX_ACTIVE, SCHED_FAIR_SHARE, SCHED_TARGET_MAX_ACTIVE,
+                    SCHED_TARGET_LEASE_SEC, SCHED_REQUEUE_DELAY_SEC, SCHED_HOST_RATE, SCHED_TOOL_RATES,
+                    SSH_HOST, DB_HOST, AGENT_DRY_RUN)
+
+LANES = {"high": "jobs-high", "normal": "jobs", "low": "jobs-low"}
+_PREFIX = "secagent:sched"
+_STATS = f"{_PREFIX}:stats"
+
+_queues, _scripts = {}, {}
+
+def _script(src):
+    if src not in _scripts:
+        _scripts[src] = get_redis().register_script(src)
+    return _scripts[src]
+
+def queue(priority: str = "normal"):
+    """lane 의 rq.Queue. rq 는 처음 enqueue 할 때 import (web 은 job 함수를 "worker.run_job" 경로로만 넘김)."""
+    name = LANES.get(priority, LANES["normal"])
+    if name not in _queues:
+        from rq import Queue
+        _queues[name] = Queue(name, connection=get_redis())
+    return _queues[name]
+
+def _incr(*fields, by=1):
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for f in fields:
+            pipe.hincrbyfloat(_STATS, f, by)
+        pipe.execute()
+    except Exception:
+        pass
+
+def host_of(target: str) -> str:
+    return (urlparse(target).hostname or target).lower() if "://" in target else target.lower()
+
+# ---- 제출 ----
+
+def choose_priority(requested, controls, submitter) -> str:
+    """
+    명시한 priority 가 있으면 그대로, 없으면 control 이 적은 점검은 high.
+    submitter 의 active job 이 상한 이상이면 low 로 강등.
+    """
+    prio = requested if requested in LANES else ("high" if len(controls or []) <= SCHED_HIGH_MAX_CONTROLS else "normal")
+    if submitter and SCHED_SUBMITTER_MAX_ACTIVE > 0 and prio != "low":
+        try:
+            active = int(get_redis().hget(f"{_PREFIX}:active", submitter) or 0)
+        except Exception:
+            active = 0
+        if active >= SCHED_SUBMITTER_MAX_ACTIVE:
+            _incr("submitter_demoted")
+            prio = "low"
+    return prio
+
+def submit(job, func="worker.run_job"):
+    """
+    job.priority lane 에 enqueue 하고 submitter active 수 증가. 반환: RQ job
+    submitter 가 있으면 job id 는 submitter 대기열로, RQ 에는 "lane 의 다음 차례 하나 실행" token 을 넣는다.
+    """
+    if job.submitter:
+        try:
+            get_redis().hincrby(f"{_PREFIX}:active", job.submitter, 1)
+        except Exception:
+            pass
+    _incr(f"enqueued:{job.priority}")
+    if job.submitter and SCHED_FAIR_SHARE and func == "worker.run_job":
+        lane = _rr_keys(job.priority)
+        try:
+            _script(_RR_PUSH)(keys=[lane["pending"] + job.submitter, lane["members"], lane["rotation"]],
+                              args=[job.submitter, job.id])
+            return queue(job.priority).enqueue("worker.run_next", job.priority)
+        except Exception:
+            pass  # 대기열에 못 넣었으면 예전처럼 job 을 직접 enqueue
+    return queue(job.priority).enqueue(func, job.id)
+
+# ---- submitter round-robin ----
+# token 하나 = 대기 job 하나. token 이 실행되면 rotation 맨 앞 submitter 의 가장 오래된 job 을 꺼내고
+# 그 submitter 는 (남은 job 이 있으면) rotation 맨 뒤로. 한 submitter 가 job 을 천 개 넣어도
+# 다른 submitter 의 job 은 자기 차례마다 끼어든다.
+
+# KEYS[1]=submitter 대기열, KEYS[2]=members set, KEYS[3]=rotation list, ARGV: submitter, job id
+_RR_PUSH = """
+redis.call('RPUSH', KEYS[1], ARGV[2])
+if redis.call('SADD', KEYS[2], ARGV[1]) == 1 then redis.call('RPUSH', KEYS[3], ARGV[1]) end
+"""
+
+# KEYS[1]=대기열 key prefix, KEYS[2]=rotation list, KEYS[3]=members set → job id / nil
+_RR_POP = """
+while true do
+  local sub = redis.call('LPOP', KEYS[2])
+  if not sub then return false end
+  local q = KEYS[1] .. sub
+  local id = redis.call('LPOP', q)
+  if redis.call('LLEN', q) > 0 then redis.call('RPUSH', KEYS[2], sub) else redis.call('SREM', KEYS[3], sub) end
+  if id then return id end
+end
+"""
+
+def _rr_keys(priority: str) -> dict:
+    base = f"{_PREFIX}:rr:{LANES.get(priority, LANES['normal'])}"
+    return {"pending": f"{base}:pending:", "rotation": f"{base}:rotation", "members": f"{base}:members"}
+
+def next_job(priority: str = "normal"):
+    """lane 에서 다음 차례 submitter 의 가장 오래된 job id. 비었거나 Redis 장애면 None."""
+    lane = _rr_keys(priority)
+    try:
+        jid = _script(_RR_POP)(keys=[lane["pending"], lane["rotation"], lane["members"]])
+    except Exception:
+        return None
+    return int(jid) if jid is not None else None
+
+def pending_by_submitter() -> dict:
+    """{lane: {submitter: 차례를 기다리는 job 수}}"""
+    r, out = get_redis(), {}
+    for prio in LANES:
+        lane = _rr_keys(prio)
+        subs = [s.decode() for s in r.smembers(lane["members"])]
+        pipe = r.pipeline(transaction=False)
+        for s in subs:
+            pipe.llen(lane["pending"] + s)
+        out[prio] = dict(zip(subs, pipe.execute())) if subs else {}
+    return out
+
+def release_submitter(submitter):
+    if not submitter:
+        return
+    try:
+        r = get_redis()
+        if r.hincrby(f"{_PREFIX}:active", submitter, -1) <= 0:
+            r.hdel(f"{_PREFIX}:active", submitter)
+    except Exception:
+        pass
+
+def record_wait(priority: str, enqueued_at):
+    """RQ enqueued_at(UTC) → dequeue 까지 대기 시간 누적."""
+    if enqueued_at is None:
+        return
+    if enqueued_at.tzinfo is None:
+        enqueued_at = enqueued_at.replace(tzinfo=timezone.utc)
+    ms = max(0.0, (datetime.now(timezone.utc) - enqueued_at).total_seconds() * 1000)
+    _incr(f"wait_ms:{priority}", by=ms)
+    _incr(f"started:{priority}")
+
+# ---- target semaphore ----
+
+# KEYS[1]=zset, ARGV: now, lease_sec, limit, token → 1 (획득) / 0
+_ACQUIRE = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+  redis.call('ZADD', KEYS[1], ARGV[1] + ARGV[2], ARGV[4])
+  redis.call('EXPIRE', KEYS[1], math.ceil(ARGV[2]) + 1)
+  return 1
+end
+return 0
+"""
+
+def acquire_target(target: str):
+    """획득하면 token, 상한이면 None. Redis 를 못 쓰면 빈 token("") 으로 통과."""
+    token = uuid.uuid4().hex
+    try:
+        ok = _script(_ACQUIRE)(keys=[f"{_PREFIX}:target:{host_of(target)}"],
+                               args=[time.time(), SCHED_TARGET_LEASE_SEC, SCHED_TARGET_MAX_ACTIVE, token])
+    except Exception:
+        return ""
+    if not ok:
+        _incr("target_busy")
+        return None
+    return token
+
+def release_target(target: str, token):
+    if not token:
+        return
+    try:
+        get_redis().zrem(f"{_PREFIX}:target:{host_of(target)}", token)
+    except Exception:
+        pass
+
+def requeue_later(job, func="worker.run_job"):
+    """target 이 바쁠 때 worker 를 붙잡지 않고 잠시 뒤 같은 lane 으로 재등록 (rq worker --with-scheduler 필요)."""
+    _incr("requeued")
+    return queue(job.priority).enqueue_in(timedelta(seconds=SCHED_REQUEUE_DELAY_SEC), func, job.id)
+
+# ---- token bucket ----
+
+# KEYS[1]=bucket hash, ARGV: now, rate(/s), burst, cost → 0 (통과) / 필요 대기 ms
+_TAKE = """
+local rate, burst, now = tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[1])
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(b[1]) or burst
+local ts = tonumber(b[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local wait = 0
+if tokens >= tonumber(ARGV[4]) then tokens = tokens - tonumber(ARGV[4]) else wait = math.ceil((tonumber(ARGV[4]) - tokens) / rate * 1000) end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return wait
+"""
+
+def _take(key: str, rate: float, burst: float) -> float:
+    """토큰 하나 확보될 때까지 대기. 반환: 대기한 ms"""
+    waited = 0.0
+    try:
+        script = _script(_TAKE)
+        while True:
+            wait_ms = script(keys=[key], args=[time.time(), rate, burst, 1])
+            if not wait_ms:
+                return waited
+            time.sleep(wait_ms / 1000); waited += wait_ms
+    except Exception:
+        return waited
+
+def step_host(tool: str, args: dict) -> str:
+    if tool == "http_check":
+        return host_of(args.get("url", ""))
+    return {"ssh_exec": SSH_HOST, "mariadb_query": DB_HOST}.get(tool, "")
+
+# AGENT_DRY_RUN 이면 실제 호출 없이 stub 이 답하는 도구 (http_check 는 dry-run 에서도 실제 요청)
+_DRY_RUN_TOOLS = ("ssh_exec", "mariadb_query")
+
+def throttle(tool: str, args: dict):
+    """
+    도구 호출 전 (도구, host) 별, host 별 bucket 에서 토큰 확보. 대기가 생기면 throttle 통계에 기록.
+    bucket 은 host 단위라 서로 다른 target 을 도는 worker 끼리는 속도 제한을 나눠 갖지 않는다.
+    """
+    if AGENT_DRY_RUN and tool in _DRY_RUN_TOOLS:
+        return
+    host = step_host(tool, args)
+    for kind, key, (rate, burst) in (("tool", f"{tool}:{host}", SCHED_TOOL_RATES.get(tool, (0, 0))),
+                                     ("host", host, SCHED_HOST_RATE)):
+        if rate <= 0 or not host:
+            continue
+        waited = _take(f"{_PREFIX}:bucket:{kind}:{key}", rate, burst)
+        if waited:
+            _incr(f"throttled:{kind}")
+            _incr(f"throttle_wait_ms:{kind}", by=waited)
+
+# ---- 통계 ----
+
+def stats() -> dict:
+    """lane 별 깊이/대기 시간, throttle/강등/재등록 횟수, submitter 별 active / 차례 대기 job."""
+    try:
+        r = get_redis()
+        raw = {k.decode(): float(v) for k, v in r.hgetall(_STATS).items()}
+        active = {k.decode(): int(v) for k, v in r.hgetall(f"{_PREFIX}:active").items()}
+        pending = pending_by_submitter()
+    except Exception as e:
+        return {"error": str(e)}
+    lanes = {}
+    for prio, name in LANES.items():
+        q = queue(prio)
+        started = raw.get(f"started:{prio}", 0)
+        lanes[prio] = {"queue": name, "depth": q.count, "running": q.started_job_registry.count,
+                       "scheduled": q.scheduled_job_registry.count,
+                       "enqueued": int(raw.get(f"enqueued:{prio}", 0)), "started": int(started),
+                       "wait_ms_avg": round(raw.get(f"wait_ms:{prio}", 0) / started, 1) if started else None}
+    return {"lanes": lanes,
+            "throttle": {kind: {"events": int(raw.get(f"throttled:{kind}", 0)),
+                                "wait_ms": round(raw.get(f"throttle_wait_ms:{kind}", 0), 1)}
+                         for kind in ("host", "tool")},
+            "target_busy": int(raw.get("target_busy", 0)), "requeued": int(raw.get("requeued", 0)),
+            "submitter_demoted": int(raw.get("submitter_demoted", 0)),
+            "active_by_submitter": active, "pending_by_submitter": pending}
@@ -0,0 +1,22 @@
+import os, sys, tempfile
+
+import pytest
+
+# config 는 import 시점에 환경 변수를 읽으므로 어떤 모듈보다 먼저: 임시 SQLite/저장소, 캐시/LLM 끔
+_tmp = tempfile.mkdtemp(prefix="secagent-test-")
+os.environ.update({"DATABASE_URL": "sqlite:///" + os.path.join(_tmp, "test.db"),
+                   "ARTIFACT_DIR": os.path.join(_tmp, "artifacts"), "RAG_DOC_DIR": os.path.join(_tmp, "docs"),
+                   "TOOL_CACHE": "off", "LLM_CACHE": "off", "USE_GPT": "false", "AGENT_DRY_RUN": "true",
+                   "REDIS_URL": "redis://127.0.0.1:1/0"})
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+@pytest.fixture
+def app_ctx():
+    """빈 DB 가 붙은 app context (test 마다 table 을 새로)."""
+    from app import app
+    from models import db
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app
+        db.session.remove()
@@ -0,0 +1,83 @@
+import os, sys, time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+HTTP = [{"tool": "http_check", "args": {"url": "https://t.test/"}, "sha256": "a" * 64,
+         "result": {"url": "https://t.test/", "status": 200, "headers": {"Server": "nginx"}}}]
+CONTROLS = {"U31": {"title": "HSTS"}, "U32": {"title": "CSP"}, "U33": {"title": "Clickjacking"}}
+
+def _job(db, status="DONE", incremental=True):
+    from models import Job
+    job = Job.from_request({"target": "https://t.test/", "controls": list(CONTROLS),
+                            "options": {"incremental": incremental}})
+    job.status = status
+    db.session.add(job); db.session.commit()
+    return job
+
+def test_plan_reuse_copies_only_definitive_matching_findings(app_ctx):
+    import agent
+    from models import db, Finding
+    prior = _job(db)
+    fps, _, _ = agent._plan_reuse(prior, CONTROLS, HTTP)
+    for cid, status, fp in (("U31", "pass", fps["U31"]), ("U32", "unknown", fps["U32"]), ("U33", "fail", "stale")):
+        db.session.add(Finding(job_id=prior.id, control_id=cid, status=status, fingerprint=fp))
+    db.session.commit()
+    job = _job(db, status="RUNNING")
+    _, reused, base = agent._plan_reuse(job, CONTROLS, HTTP)
+    assert base == prior.id and sorted(reused) == ["U31"]
+    # 증거가 바뀌면 fingerprint 도 바뀌어 재사용하지 않음
+    changed = [dict(HTTP[0], sha256="b" * 64)]
+    assert agent._plan_reuse(job, CONTROLS, changed)[1] == {}
+
+def test_plan_reuse_is_opt_in(app_ctx):
+    import agent
+    from models import db, Finding
+    prior = _job(db)
+    fps, _, _ = agent._plan_reuse(prior, CONTROLS, HTTP)
+    db.session.add(Finding(job_id=prior.id, control_id="U31", status="pass", fingerprint=fps["U31"])); db.session.commit()
+    assert agent.INCREMENTAL_RESCAN is False
+    job = _job(db, status="RUNNING", incremental=None)
+    job.options = {}; db.session.commit()
+    assert agent._plan_reuse(job, CONTROLS, HTTP)[1:] == ({}, None)
+
+def test_event_sink_publishes_serialized_batch_with_ids(app_ctx, monkeypatch):
+    import agent
+    from models import db, Event
+    published = []
+    monkeypatch.setattr(agent, "publish_events", published.extend)
+    job = _job(db)
+    sink = agent.EventSink(max_size=10, max_delay_ms=60000, urgent_levels=["stage"])
+    sink.add(job.id, "info", "a"); sink.add(job.id, "info", "b")
+    assert published == [] and Event.query.count() == 0
+    sink.add(job.id, "stage", "EXECUTE")  # urgent → 즉시 flush
+    assert [p["message"] for p in published] == ["a", "b", "EXECUTE"]
+    assert [p["id"] for p in published] == [e.id for e in Event.query.order_by(Event.id)]
+
+def test_event_sink_puts_batch_back_when_commit_fails(app_ctx, monkeypatch):
+    import agent
+    from models import db, Event
+    monkeypatch.setattr(agent, "publish_events", lambda evs: None)
+    job = _job(db)
+    sink = agent.EventSink(max_size=10, max_delay_ms=60000, urgent_levels=[])
+    sink.add(job.id, "info", "a")
+    with monkeypatch.context() as m:
+        m.setattr(db.session, "commit", lambda: (_ for _ in ()).throw(RuntimeError("database is locked")))
+        with pytest.raises(RuntimeError):
+            sink.flush()
+    assert [e.message for e in sink.flush()] == ["a"] and Event.query.count() == 1
+
+def test_event_sink_flushes_idle_batch_from_timer(app_ctx, monkeypatch):
+    import agent
+    from models import db, Event
+    monkeypatch.setattr(agent, "publish_events", lambda evs: None)
+    job = _job(db)
+    sink = agent.EventSink(max_size=10, max_delay_ms=50, urgent_levels=[])
+    sink.add(job.id, "info", "idle")
+    deadline = time.time() + 5
+    while sink._buf and time.time() < deadline:
+        time.sleep(0.02)
+    assert not sink._buf
+    db.session.expire_all()
+    assert [e.message for e in Event.query.all()] == ["idle"]
@@ -0,0 +1,31 @@
+import asyncio, os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+def test_perform_heartbeats_and_updates_registries(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    from rq import Queue
+    import aworker
+    monkeypatch.setattr(aworker, "ASYNC_WORKER_HEARTBEAT_SEC", 0.05)
+    q = Queue("test", connection=fakeredis.FakeStrictRedis())
+    ok, bad = q.enqueue("time.sleep", 0.3), q.enqueue("math.sqrt", -1)
+    beats = []
+    orig = ok.heartbeat
+    monkeypatch.setattr(ok, "heartbeat", lambda ts, ttl, **kw: (beats.append(ttl), orig(ts, ttl, **kw)))
+
+    async def main():
+        task = asyncio.create_task(aworker.perform(ok, q, None))
+        ticks = 0
+        while not task.done():  # job 이 thread 에서 도는 동안 event loop 는 계속 돈다
+            ticks += 1
+            await asyncio.sleep(0.02)
+        await aworker.perform(bad, q, None)
+        return ticks
+
+    assert asyncio.run(main()) >= 5
+    assert len(beats) >= 3 and set(beats) == {aworker.HEARTBEAT_TTL}
+    assert ok.get_status(refresh=True) == "finished" and bad.get_status(refresh=True) == "failed"
+    assert q.started_job_registry.get_job_ids() == []
+    assert q.finished_job_registry.get_job_ids() == [ok.id] and q.failed_job_registry.get_job_ids() == [bad.id]
@@ -0,0 +1,15 @@
+import math, os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import evidence
+
+HTTP = [{"tool": "http_check", "args": {"url": "https://example.test/"}, "sha256": "x" * 64,
+         "result": {"status": 200, "headers": {"Server": "nginx"}}}]
+
+def test_group_controls_fills_groups_up_to_max_group():
+    for n, max_group in ((1, 8), (8, 8), (9, 8), (20, 8), (25, 5)):
+        controls = {f"C{i:03d}": {"title": f"C{i:03d}"} for i in range(n)}
+        groups = evidence.group_controls(controls, HTTP, max_group=max_group)
+        assert len(groups) == math.ceil(n / max_group)
+        assert all(len(g["controls"]) <= max_group for g in groups)
+        assert sorted(cid for g in groups for cid in g["controls"]) == sorted(controls)
@@ -0,0 +1,45 @@
+import asyncio, os, sys, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import executor
+import metrics
+
+def _fake_tools(monkeypatch, delay=0.05):
+    calls, lock = [], threading.Lock()
+    def tool(name):
+        def run(args):
+            with lock: calls.append((name, dict(args)))
+            time.sleep(delay)
+            return {"tool": name, "args": args, "result": {"stdout_bytes": 3}, "sha256": f"{name}:{sorted(args.items())}"}
+        return run
+    monkeypatch.setattr(executor, "TOOL_FUNCS", {"http_check": tool("http_check"), "ssh_exec": tool("ssh_exec")})
+    monkeypatch.setattr(executor, "throttle", lambda tool, args: None)
+    return calls
+
+def test_execute_plan_dedupes_and_keeps_input_order(monkeypatch):
+    calls = _fake_tools(monkeypatch)
+    steps = [{"tool": "http_check", "args": {"url": "https://t.test/"}, "control": "U31"},
+             {"tool": "ssh_exec", "args": {"cmd": "id"}},
+             {"tool": " http_check ", "args": {"url": " https://t.test/"}, "control": "U32"},
+             {"tool": "nope", "args": {}}]
+    seen = []
+    outs = executor.execute_plan(steps, on_call=lambda s, n: seen.append((s["tool"], n)))
+    assert sorted(calls) == [("http_check", {"url": "https://t.test/"}), ("ssh_exec", {"cmd": "id"})]
+    assert outs[0] is outs[2] and outs[1]["tool"] == "ssh_exec" and outs[3]["result"] == {"note": "unknown tool"}
+    assert ("http_check", 2) in seen and outs[0]["timing"]["bytes"] == 3
+
+def test_tool_call_spans_carry_the_requesting_controls(monkeypatch):
+    _fake_tools(monkeypatch, delay=0)
+    metrics._local.drain()
+    executor.execute_plan([{"tool": "http_check", "args": {"url": "https://t.test/"}, "control": c}
+                           for c in ("U33", "U31", "U32", "U34")] + [{"tool": "ssh_exec", "args": {"cmd": "id"}}])
+    labels = {dict(lb)["tool"]: dict(lb)["control"] for lb in metrics._local.hist["tool_call_seconds"]}
+    assert labels == {"http_check": "U31,U32,U33,+1", "ssh_exec": "-"}
+
+def test_execute_plan_async_runs_sync_tools_in_threads(monkeypatch):
+    calls = _fake_tools(monkeypatch, delay=0.2)
+    steps = [{"tool": "ssh_exec", "args": {"cmd": f"c{i}"}} for i in range(4)]
+    t0 = time.perf_counter()
+    outs = asyncio.run(executor.execute_plan_async(steps))
+    assert len(calls) == 4 and [o["args"]["cmd"] for o in outs] == ["c0", "c1", "c2", "c3"]
+    assert time.perf_counter() - t0 < 0.6  # 순차면 0.8s
@@ -0,0 +1,74 @@
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import fleet as fleets
+from fleet import FleetError
+
+def test_expand_targets_dedupes_and_skips_network_addresses():
+    out = fleets.expand_targets(["a.test", "https://b.test/x", "a.test", "10.0.0.0/30", "10.0.0.1", "", "fe80::/127"],
+                                template="https://{host}/")
+    assert out == ["https://a.test/", "https://b.test/x", "https://10.0.0.1/", "https://10.0.0.2/",
+                   "https://[fe80::]/", "https://[fe80::1]/"]
+
+def test_expand_targets_limits_and_errors():
+    assert len(fleets.expand_targets(["10.0.0.0/29"], max_targets=6)) == 6
+    with pytest.raises(FleetError):
+        fleets.expand_targets(["10.0.0.0/24"], max_targets=10)
+    with pytest.raises(FleetError):
+        fleets.expand_targets(["a.test", "b.test", "c.test"], max_targets=2)
+    with pytest.raises(FleetError):
+        fleets.expand_targets(["10.0.0.300/24"])
+
+def test_parse_host_file_strips_comments():
+    assert fleets.parse_host_file("# header\n a.test  # web\n\n10.0.0.0/30\n") == ["a.test", "10.0.0.0/30"]
+
+def test_positive_int():
+    assert fleets._positive_int({}, "batch_size", 25) == 25
+    assert fleets._positive_int({"batch_size": ""}, "batch_size", 25) == 25
+    assert fleets._positive_int({"batch_size": 3}, "batch_size", 25) == 3
+    assert fleets._positive_int({"batch_size": " 7 "}, "batch_size", 25) == 7
+    for bad in (0, -1, "0", "x", 2.5, True, [1]):
+        with pytest.raises(FleetError):
+            fleets._positive_int({"batch_size": bad}, "batch_size", 25)
+
+class _FakeQueue:
+    def __init__(self): self.calls = []
+    def enqueue(self, func, *args, **kw):
+        self.calls.append((func, args, kw)); return f"rq{len(self.calls)}"
+
+def test_enqueue_fleet_chains_lanes_and_scales_timeout(app_ctx):
+    fleet, job_ids = fleets.create_fleet({"targets": [f"h{i}.test" for i in range(5)], "batch_size": 2, "parallelism": 2})
+    q = _FakeQueue()
+    assert fleets.enqueue_fleet(q, fleet, job_ids) == 3
+    batches = [args[0] for _, args, _ in q.calls]
+    assert batches == [job_ids[:2], job_ids[2:4], job_ids[4:]]
+    assert [kw["job_timeout"] for _, _, kw in q.calls] == [2 * fleets.FLEET_JOB_TIMEOUT_SEC] * 2 + [fleets.FLEET_JOB_TIMEOUT_SEC]
+    assert q.calls[0][2]["depends_on"] is None and q.calls[2][2]["depends_on"].dependencies == ["rq1"]
+
+def test_fail_unfinished_completes_the_fleet_once(app_ctx):
+    from models import db, Job, Fleet
+    fleet, job_ids = fleets.create_fleet({"targets": ["a.test", "b.test", "c.test"]})
+    db.session.get(Job, job_ids[0]).status = "DONE"; db.session.commit()
+    fleets.record_job(fleet.id, True, ["pass"])
+    assert fleets.fail_unfinished(fleet.id, job_ids) == job_ids[1:]
+    assert fleets.fail_unfinished(fleet.id, job_ids) == []  # 두 번째 호출은 중복 집계하지 않음
+    f = db.session.get(Fleet, fleet.id)
+    assert (f.jobs_done, f.jobs_failed, f.status) == (1, 2, "DONE")
+    assert {db.session.get(Job, j).status for j in job_ids[1:]} == {"FAILED"}
+
+def test_aborted_batch_fails_the_jobs_it_did_not_reach(app_ctx, monkeypatch):
+    import worker
+    from models import db, Job, Fleet
+    fleet, job_ids = fleets.create_fleet({"targets": ["a.test", "b.test", "c.test"]})
+    def run_job(jid):
+        if jid == job_ids[1]:
+            raise TimeoutError("batch killed")  # RQ death penalty 처럼 batch 중간에 끊김
+        db.session.get(Job, jid).status = "DONE"; db.session.commit()
+        fleets.record_job(fleet.id, True, [])
+    monkeypatch.setattr(worker, "run_job", run_job)
+    with pytest.raises(TimeoutError):
+        worker.run_fleet_batch(job_ids, fleet_id=fleet.id)
+    f = db.session.get(Fleet, fleet.id)
+    assert (f.jobs_done, f.jobs_failed, f.status) == (1, 2, "DONE")
@@ -0,0 +1,22 @@
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import kvcache
+
+def test_disk_cache_ttl_and_lru_eviction(tmp_path):
+    cache = kvcache.make_cache("disk", str(tmp_path), max_entries=2, redis_prefix="x:")
+    cache.put("aa1", {"v": 1}, ttl=60)
+    assert cache.get("aa1")["v"] == 1 and cache.get("missing") is None
+    cache.put("bb2", {"v": 2}, ttl=-1)
+    assert cache.get("bb2") is None and not os.path.exists(cache._path("bb2"))
+    for i, k in enumerate(("cc3", "dd4", "ee5")):
+        cache.put(k, {"v": i}, ttl=60)
+        os.utime(cache._path(k), (time.time() - 100 + i, time.time() - 100 + i))
+    os.utime(cache._path("aa1"), (time.time() - 200, time.time() - 200))
+    cache.get("cc3")  # 읽으면 최근 사용
+    cache.evict()
+    assert cache.get("aa1") is None and cache.get("dd4") is None
+    assert [cache.get(k)["v"] for k in ("cc3", "ee5")] == [0, 2]
+
+def test_make_cache_off():
+    assert kvcache.make_cache("off", "", 1, "") is None
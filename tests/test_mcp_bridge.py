@@ -0,0 +1,96 @@
+import hashlib, os, sys, threading, time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import blobstore
+import mcp_bridge
+
+def test_capture_keeps_head_and_tail_and_spools_the_rest():
+    data = bytes(range(256)) * 40  # 10240 bytes
+    with mcp_bridge._Capture(head=100, tail=50) as cap:
+        for i in range(0, len(data), 333):
+            cap.feed(data[i:i + 333])
+    assert cap.size == len(data) and cap.truncated
+    assert bytes(cap.head) == data[:100] and bytes(cap.tail) == data[-50:]
+    assert cap.sha256 == hashlib.sha256(data).hexdigest()
+    assert cap.ref == blobstore.ref(cap.sha256) and blobstore.get_bytes(cap.sha256) == data
+    assert f"...[{len(data) - 150} bytes truncated]..." in cap.text("latin-1")
+
+def test_small_capture_is_not_truncated_or_spooled():
+    cap = mcp_bridge._captured(b"hello world")
+    assert not cap.truncated and cap.ref == "" and cap.text() == "hello world"
+    assert cap.summary("stdout") == {"stdout_bytes": 11, "stdout_sha256": hashlib.sha256(b"hello world").hexdigest(),
+                                     "stdout_truncated": False}
+
+def test_demux_splits_outputs_across_chunk_boundaries():
+    tag = b"__TAG__"
+    stream = b"one\n__TAG__ 0\ntwo two\n__TAG__ 3\n" + b"x" * 300 + b"__TAG__ -1\n"
+    caps = [mcp_bridge._Capture(head=64, tail=16) for _ in range(3)]
+    mux = mcp_bridge._Demux(tag, caps)
+    for i in range(0, len(stream), 5):
+        mux.feed(stream[i:i + 5])
+    mux.finish()
+    assert mux.codes == [0, 3, -1]
+    assert [c.size for c in caps] == [4, 8, 300]
+    assert bytes(caps[0].head) == b"one\n" and bytes(caps[1].head) == b"two two\n"
+    assert caps[2].truncated and bytes(caps[2].tail) == b"x" * 16
+    for c in caps: c.close()
+
+def test_http_sha_ignores_volatile_headers_but_result_keeps_them():
+    def result(headers):
+        return mcp_bridge._http_result("https://t.test/", 200, headers, "utf-8", mcp_bridge._captured(b"body"), time.time())
+    a = result({"Date": "Mon", "X-Request-Id": "1", "Set-Cookie": "sid=1; Path=/; Expires=Wed, 21 Oct 2026 07:28:00 GMT; HttpOnly",
+                "Strict-Transport-Security": "max-age=1"})
+    b = result({"Date": "Tue", "X-Request-Id": "2", "Set-Cookie": "sid=2; Path=/; Expires=Thu, 22 Oct 2026 07:28:00 GMT; HttpOnly",
+                "Strict-Transport-Security": "max-age=1"})
+    assert a["sha256"] == b["sha256"]
+    assert a["result"]["headers"]["Set-Cookie"].startswith("sid=1") and a["result"]["headers"]["Date"] == "Mon"
+    # 쿠키 속성(HttpOnly → Secure)이나 판정용 header 가 바뀌면 다른 증거
+    c = result({"Date": "Tue", "Set-Cookie": "sid=3; Path=/; Secure", "Strict-Transport-Security": "max-age=1"})
+    d = result({"Date": "Tue", "Set-Cookie": "sid=1; Path=/; Expires=Wed, 21 Oct 2026 07:28:00 GMT; HttpOnly"})
+    assert len({a["sha256"], c["sha256"], d["sha256"]}) == 3
+
+def test_cookie_shape_splits_merged_set_cookie_headers():
+    merged = "sid=abc; Path=/; Expires=Wed, 21 Oct 2026 07:28:00 GMT; HttpOnly, lang=ko; Secure"
+    assert mcp_bridge._cookie_shape(merged) == "lang; secure, sid; expires; httponly; path=/"
+
+class _Transport:
+    def __init__(self): self.active = True
+    def is_active(self): return self.active
+    def send_ignore(self): pass
+    def open_session(self, timeout=None): return _Chan()
+
+class _Chan:
+    def settimeout(self, t): pass
+    def close(self): pass
+
+class _Client:
+    def __init__(self): self.transport, self.closed = _Transport(), False
+    def get_transport(self): return self.transport
+    def close(self): self.closed = True
+
+def _pool_with_client():
+    pool = mcp_bridge._SSHPool(4, 300, 30)
+    client, ready = _Client(), threading.Event()
+    ready.set()
+    key = ("h", "u", "k")
+    pool._entries[key] = {"client": client, "ready": ready, "error": None, "last": time.time(), "in_use": 0,
+                          "sem": threading.BoundedSemaphore(4)}
+    return pool, key, client
+
+def test_ssh_timeout_keeps_the_shared_transport():
+    pytest.importorskip("paramiko")
+    pool, key, client = _pool_with_client()
+    with pytest.raises(TimeoutError):
+        with pool.channel("h", "u", "k"):
+            raise TimeoutError("slow command")
+    assert key in pool._entries and not client.closed and pool._entries[key]["in_use"] == 0
+
+def test_ssh_protocol_error_closes_the_transport():
+    paramiko = pytest.importorskip("paramiko")
+    pool, key, client = _pool_with_client()
+    with pytest.raises(paramiko.SSHException):
+        with pool.channel("h", "u", "k"):
+            raise paramiko.SSHException("broken")
+    assert key not in pool._entries and client.closed
@@ -0,0 +1,35 @@
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import metrics
+
+@pytest.fixture(autouse=True)
+def fresh(monkeypatch):
+    monkeypatch.setattr(metrics, "_local", metrics._Registry())
+    monkeypatch.setattr(metrics, "_pending", metrics._Registry())
+    monkeypatch.setattr(metrics, "get_redis", lambda: (_ for _ in ()).throw(OSError("no redis")))
+
+def test_span_records_outcome_and_size():
+    with metrics.span("tool_call", tool="http_check") as sp:
+        sp.size, sp.outcome = 2000, "hit"
+    with pytest.raises(ValueError):
+        with metrics.span("tool_call", tool="http_check"):
+            raise ValueError("x")
+    hist = metrics._local.hist
+    outcomes = sorted(dict(lb)["outcome"] for lb in hist["tool_call_seconds"])
+    assert outcomes == ["error", "hit"] and sp.ms >= 0
+    (row,) = hist["tool_call_bytes"].values()
+    assert row[metrics.BYTES_BUCKETS.index(4096)] == 1 and row[-1] == 2000
+
+def test_render_prometheus_text_without_redis():
+    metrics.observe("stage_seconds", 0.2, stage="PLAN")
+    metrics.inc("findings", control="U31", outcome="pass")
+    text = metrics.render()
+    assert '# TYPE secagent_stage_seconds histogram' in text
+    assert 'secagent_stage_seconds_bucket{stage="PLAN",le="0.25"} 1' in text
+    assert 'secagent_stage_seconds_bucket{stage="PLAN",le="0.1"} 0' in text
+    assert 'secagent_findings_total{control="U31",outcome="pass"} 1' in text
+    metrics.push()  # Redis 가 없어도 예외 없이 delta 를 버림
+    assert metrics._pending.drain() == ({}, {})
@@ -0,0 +1,57 @@
+import os, sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+def _events_sql(db):
+    return db.session.execute(db.text("SELECT sql FROM sqlite_master WHERE type='table' AND name='events'")).scalar()
+
+def _job(db):
+    from models import Job
+    job = Job.from_request({"target": "https://t.test/", "controls": ["U31"]})
+    job.status = "DONE"
+    db.session.add(job); db.session.commit()
+    return job
+
+def test_upgrade_schema_migrates_legacy_events_once(app_ctx):
+    from models import db, Event, upgrade_schema
+    job = _job(db)
+    # AUTOINCREMENT 도 payload_json column 도 없던 예전 events table
+    db.session.execute(db.text("DROP TABLE events"))
+    db.session.execute(db.text("CREATE TABLE events (id INTEGER PRIMARY KEY, job_id INTEGER NOT NULL, ts DATETIME, "
+                               "level VARCHAR, message VARCHAR)"))
+    db.session.execute(db.text("INSERT INTO events (id, job_id, ts, level, message) VALUES (7, :j, :ts, 'info', 'old')"),
+                       {"j": job.id, "ts": datetime.utcnow()})
+    db.session.commit()
+    upgrade_schema()
+    upgrade_schema()  # 두 번째 실행은 아무것도 바꾸지 않음
+    assert "AUTOINCREMENT" in _events_sql(db).upper()
+    assert [(e.id, e.message) for e in Event.query.all()] == [(7, "old")]
+    db.session.add(Event(job_id=job.id, message="new")); db.session.commit()
+    assert max(e.id for e in Event.query.all()) == 8
+
+def test_event_ids_are_not_reused_after_retention(app_ctx):
+    import retention
+    from models import db, Event, EventRollup, upgrade_schema
+    upgrade_schema()
+    job = _job(db)
+    db.session.add_all([Event(job_id=job.id, message=f"e{i}") for i in range(3)]); db.session.commit()
+    last = max(e.id for e in Event.query.all())
+    retention.archive_job(job.id); db.session.commit()
+    assert Event.query.count() == 0 and db.session.get(EventRollup, job.id).last_event_id == last
+    assert [e["message"] for e in retention.iter_archived(job.id)] == ["e0", "e1", "e2"]
+    ev = Event(job_id=job.id, message="later"); db.session.add(ev); db.session.commit()
+    assert ev.id > last
+
+def test_artifacts_with_the_same_result_share_one_blob(app_ctx):
+    import blobstore
+    from models import db, Artifact, referenced_blobs
+    job = _job(db)
+    out = lambda ms: {"tool": "http_check", "sha256": "s" * 64,
+                      "result": {"url": "https://t.test/", "status": 200, "headers": {"A": "1"}, "elapsed_ms": ms}}
+    a, b = Artifact.from_tool_output(job.id, out(5)), Artifact.from_tool_output(job.id, out(900))
+    db.session.add_all([a, b]); db.session.commit()
+    assert a.ref == b.ref and blobstore.get_json(blobstore.sha_of(a.ref))["headers"] == {"A": "1"}
+    orphan = blobstore.put_json({"orphan": True})
+    assert blobstore.gc(referenced_blobs(), grace_sec=0)["removed"] >= 1
+    assert blobstore.exists(blobstore.sha_of(a.ref)) and not blobstore.exists(orphan)
@@ -0,0 +1,50 @@
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import rules
+
+SSHD = "grep -Ei '^[[:space:]]*PermitRootLogin' /etc/ssh/sshd_config"
+
+def _http(headers, sha="a" * 64):
+    return {"tool": "http_check", "args": {"url": "https://t.test/"}, "sha256": sha,
+            "result": {"url": "https://t.test/", "status": 200, "headers": headers}}
+
+def _ssh(stdout, sha="b" * 64):
+    return {"tool": "ssh_exec", "args": {"cmd": SSHD}, "sha256": sha, "result": {"cmd": SSHD, "stdout": stdout, "code": 0}}
+
+def test_header_rules_pass_and_fail_case_insensitively():
+    items, pending = rules.evaluate(["U31", "U32", "U33"], [_http({"Strict-Transport-Security": "max-age=1",
+                                                                   "Content-Security-Policy": "frame-ancestors 'none'"})])
+    assert pending == {}
+    assert {i["control_id"]: i["status"] for i in items} == {"U31": "pass", "U32": "pass", "U33": "pass"}
+    assert items[0]["evidence_refs"] == ["a" * 64] and items[0]["repro"] == ["curl -I https://t.test/"]
+    items, _ = rules.evaluate(["U31"], [_http({"Server": "nginx"})])
+    assert items[0]["status"] == "fail" and items[0]["risk"]
+
+def test_headers_are_merged_across_http_evidence():
+    index = rules.EvidenceIndex([_http({"X-Frame-Options": "DENY"}, "1" * 64), _http({"Server": "x"}, "2" * 64)])
+    ev = index.get("http_check", None)
+    assert ev.sha256s == ["1" * 64, "2" * 64] and "x-frame-options" in ev.headers
+    assert rules.COMPILED["U33"].evaluate("U33", index)["status"] == "pass"
+
+def test_fail_when_leaves_ambiguous_output_pending():
+    assert rules.evaluate(["U01"], [_ssh("PermitRootLogin no\n")])[0][0]["status"] == "pass"
+    assert rules.evaluate(["U01"], [_ssh("PermitRootLogin yes\n")])[0][0]["status"] == "fail"
+    assert rules.evaluate(["U01"], [_ssh("PermitRootLogin prohibit-password\n")]) == ([], {"U01": "ambiguous"})
+
+def test_missing_dry_run_and_unknown_controls_are_pending():
+    _, pending = rules.evaluate(["U01", "D01", "X99"], [_ssh("DRY_RUN: would run ssh")])
+    assert pending == {"U01": "evidence missing", "D01": "evidence missing", "X99": "no rule"}
+
+def test_row_count_rule():
+    sql = rules.COMPILED["D01"].key
+    ev = {"tool": "mariadb_query", "args": {"sql": sql}, "sha256": "c" * 64,
+          "result": {"sql": sql, "cols": ["user", "host"], "rows": [], "rows_total": 0}}
+    assert rules.evaluate(["D01"], [ev])[0][0]["status"] == "pass"
+    ev["result"].update(rows=[["", "%"]], rows_total=1)
+    assert rules.evaluate(["D01"], [ev])[0][0]["status"] == "fail"
+
+def test_collect_steps_tags_each_step_with_its_control():
+    steps = rules.collect_steps(["u31", "U01", "X99"], "https://t.test/")
+    assert steps == [{"tool": "http_check", "args": {"url": "https://t.test/"}, "control": "u31"},
+                     {"tool": "ssh_exec", "args": {"cmd": SSHD}, "control": "U01"}]
@@ -0,0 +1,53 @@
+import os, sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import bus
+import scheduler
+
+@pytest.fixture
+def redis(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # Lua script (round-robin, token bucket)
+    r = fakeredis.FakeStrictRedis()
+    monkeypatch.setattr(bus, "_redis", r)
+    monkeypatch.setattr(scheduler, "_scripts", {})
+    return r
+
+class _Queue:
+    def __init__(self): self.calls = []
+    def enqueue(self, func, *args, **kw): self.calls.append((func, args))
+
+def test_round_robin_across_submitters_within_a_lane(redis, monkeypatch):
+    q = _Queue()
+    monkeypatch.setattr(scheduler, "queue", lambda priority="normal": q)
+    jobs = [("alice", 1), ("alice", 2), ("alice", 3), ("bob", 4), ("carol", 5), ("bob", 6)]
+    for sub, jid in jobs:
+        scheduler.submit(SimpleNamespace(id=jid, submitter=sub, priority="normal"))
+    assert q.calls == [("worker.run_next", ("normal",))] * len(jobs)  # RQ 에는 차례 token 만
+    order = [scheduler.next_job("normal") for _ in jobs]
+    assert order == [1, 4, 5, 2, 6, 3]
+    assert scheduler.next_job("normal") is None and scheduler.pending_by_submitter()["normal"] == {}
+
+def test_throttle_buckets_are_per_host_and_tool_rates_are_opt_in(redis, monkeypatch):
+    scheduler.throttle("http_check", {"url": "https://a.test/x"})
+    scheduler.throttle("http_check", {"url": "https://B.test/"})
+    keys = sorted(k.decode() for k in redis.keys(f"{scheduler._PREFIX}:bucket:*"))
+    assert keys == [f"{scheduler._PREFIX}:bucket:host:a.test", f"{scheduler._PREFIX}:bucket:host:b.test"]
+    monkeypatch.setattr(scheduler, "SCHED_TOOL_RATES", {"http_check": (5.0, 10.0)})
+    scheduler.throttle("http_check", {"url": "https://a.test/"})
+    assert redis.exists(f"{scheduler._PREFIX}:bucket:tool:http_check:a.test")
+
+def test_dry_run_stubs_are_not_throttled(redis, monkeypatch):
+    monkeypatch.setattr(scheduler, "AGENT_DRY_RUN", True)
+    scheduler.throttle("ssh_exec", {"cmd": "id"})
+    scheduler.throttle("mariadb_query", {"sql": "SELECT 1"})
+    assert redis.keys(f"{scheduler._PREFIX}:bucket:*") == []
+
+def test_throttle_fails_open_without_redis(monkeypatch):
+    monkeypatch.setattr(scheduler, "_scripts", {})
+    monkeypatch.setattr(bus, "_redis", SimpleNamespace(register_script=lambda src: (_ for _ in ()).throw(OSError("down"))))
+    scheduler.throttle("http_check", {"url": "https://a.test/"})
+    assert scheduler.next_job("normal") is None
@@ -1,14 +1,104 @@
+from contextlib import nullcontext
+from flask import has_app_context
+from rq import get_current_job
 from models import db, Job, Event
-from agent import run_pipeline, log
+from agent import run_pipeline, log, flush_events
+import fleet as fleets
+import scheduler
+import metrics
+import report
 
-def run_job(job_id):
+def _begin(job_id, rq_job=None):
+    """대기 시간 기록, target semaphore 획득 후 RUNNING. host 가 바쁘면 재등록하고 (None, None)."""
     job = Job.query.get(job_id)
+    if job is None or job.status in ("DONE", "FAILED"):
+        return None, None  # 이미 끝남 (예: 끊긴 fleet batch 에서 FAILED 처리된 뒤 재등록분이 도착)
+    if rq_job is not None:
+        scheduler.record_wait(job.priority, rq_job.enqueued_at)
+    # 같은 host 에 이미 상한만큼 job 이 돌고 있으면 worker 를 붙잡지 않고 나중에 다시
+    token = scheduler.acquire_target(job.target)
+    if token is None:
+        scheduler.requeue_later(job)
+        log(job_id, "info", "target_busy", {"target": job.target, "requeued": True}); flush_events()
+        return None, None
     job.status = "RUNNING"; job.progress = 10; db.session.commit()
+    log(job_id, "stage", "PREPARE")
+    return job, token
+
+def _store_reports(job):
+    """완료된 job 의 JSON/PDF 보고서를 미리 렌더해 저장. 실패해도 job 은 DONE (요청 시 다시 렌더)."""
     try:
-        log(job_id, "stage", "PREPARE")
-        findings = run_pipeline(job)
-        job.status = "DONE"; job.progress = 100; db.session.commit()
-        log(job_id, "done", "Job completed", {"findings": [f.control_id for f in findings]})
+        with metrics.span("report_render"):
+            reports = report.store(job)
+        log(job.id, "info", "report", reports)
     except Exception as e:
-        job.status = "FAILED"; db.session.commit()
-        log(job_id, "error", "Job failed", {"error": str(e)})
+        db.session.rollback()
+        log(job.id, "warn", "report_failed", {"error": str(e)})
+
+def _done(job, findings):
+    job.status = "DONE"; job.progress = 100; db.session.commit()
+    _store_reports(job)
+    log(job.id, "done", "Job completed", {"findings": [f.control_id for f in findings]})
+    return True, [f.status for f in findings]
+
+def _failed(job, e):
+    db.session.rollback()
+    job.status = "FAILED"; db.session.commit()
+    log(job.id, "error", "Job failed", {"error": str(e)})
+    return False, []
+
+def _finish(job, token, ok, statuses):
+    flush_events()
+    metrics.inc("jobs", outcome="done" if ok else "failed")
+    metrics.push()  # 이 process 의 지표 delta 를 Redis 로 (app 의 /metrics 가 합산)
+    scheduler.release_target(job.target, token)
+    scheduler.release_submitter(job.submitter)
+    if job.fleet_id:
+        fleets.record_job(job.fleet_id, ok, statuses)
+
+def _app_context():
+    """rq work-horse 에는 Flask app context 가 없으므로 필요하면 연다 (이미 있으면 그대로)."""
+    if has_app_context():
+        return nullcontext()
+    from app import app
+    return app.app_context()
+
+def run_job(job_id):
+    with _app_context():
+        job, token = _begin(job_id, get_current_job())
+        if job is None:
+            return
+        ok, statuses = False, []
+        try:
+            ok, statuses = _done(job, run_pipeline(job))
+        except Exception as e:
+            ok, statuses = _failed(job, e)
+        finally:
+            _finish(job, token, ok, statuses)
+
+def run_next(priority="normal"):
+    """submitter round-robin token: lane 에서 다음 차례 job 을 꺼내 실행 (scheduler.submit 참고)."""
+    job_id = scheduler.next_job(priority)
+    if job_id is not None:
+        run_job(job_id)
+
+def abort_batch(fleet_id, job_ids):
+    """batch 가 끝까지 못 돈 경우(timeout, worker 종료): 남은 job 을 FAILED 로 기록해 fleet 이 DONE 에 도달하게."""
+    db.session.rollback()
+    for jid in fleets.fail_unfinished(fleet_id, job_ids):
+        log(jid, "error", "Job failed", {"error": "fleet batch aborted"})
+    flush_events()
+
+def run_fleet_batch(job_ids, fleet_id=None):
+    """fleet 의 batch 하나: job 들을 순서대로 실행 (각 job 의 실패는 run_job 안에서 처리됨)."""
+    with _app_context():
+        if fleet_id:
+            fleets.mark_running(fleet_id)
+        left = list(job_ids)
+        try:
+            while left:
+                run_job(left[0])
+                left.pop(0)
+        finally:
+            if left and fleet_id:
+                abort_batch(fleet_id, left)